@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Run writer threads through get_db().transaction() and reader threads
+through get_db().read_transaction() against one SQLite database, the way
+the import, export and delete threads and the web server share it. Count
+transactions and "database is locked" errors, and show the lock waits.
+
+    python3 bench/db_concurrency.py [--writers 4] [--readers 8] [--seconds 10]
+"""
+
+import os, sys, time, shutil, tempfile, threading
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sqlalchemy.exc import OperationalError
+from images import Tag
+from images.database import init, get_db
+
+
+def writer(n, stop, counts):
+    i = 0
+    while not stop.is_set():
+        try:
+            with get_db().transaction() as t:
+                t.add(Tag(id='w%i-%i' % (n, i), color=i % 8))
+            i += 1
+            counts['writes'] += 1
+        except OperationalError as e:
+            counts['locked' if 'locked' in str(e) else 'errors'] += 1
+
+
+def reader(stop, counts):
+    while not stop.is_set():
+        try:
+            with get_db().read_transaction() as t:
+                t.query(Tag).filter(Tag.color == 3).count()
+            counts['reads'] += 1
+        except OperationalError as e:
+            counts['locked' if 'locked' in str(e) else 'errors'] += 1
+
+
+parser = ArgumentParser(usage="db_concurrency.py [--writers 4] [--readers 8] [--seconds 10]")
+parser.add_argument('--writers', type=int, default=4)
+parser.add_argument('--readers', type=int, default=8)
+parser.add_argument('--seconds', type=float, default=10)
+args = parser.parse_args()
+
+folder = tempfile.mkdtemp()
+try:
+    db = init('sqlite:///' + os.path.join(folder, 'images.db'))
+    db.create_all()
+    stop = threading.Event()
+    counts = {'writes': 0, 'reads': 0, 'locked': 0, 'errors': 0}
+    threads = (
+        [threading.Thread(target=writer, args=(n, stop, counts)) for n in range(args.writers)] +
+        [threading.Thread(target=reader, args=(stop, counts)) for n in range(args.readers)]
+    )
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print("%(writes)i writes, %(reads)i reads, %(locked)i locked, %(errors)i other errors" % counts)
+    print("%.0f writes/s, %.0f reads/s" % (counts['writes'] / args.seconds, counts['reads'] / args.seconds))
+    for kind, wait in sorted(db.lock_waits.get().items()):
+        print("%-8s %7i waits, mean %6.2f ms, max %7.2f ms" % (
+            kind, wait['count'], wait['mean'] * 1000, wait['max'] * 1000))
+finally:
+    shutil.rmtree(folder)
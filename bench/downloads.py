@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Measure thumbnail downloads through /location/<id>/dl, in requests per
+second, by calling the location app as a WSGI application from a number
+of threads: plain downloads, and revalidations with If-None-Match, which
+a browser makes for files it has cached. A fresh system with a thumbnail
+location is set up in a temporary folder.
+
+This measures the serving path itself, with Basic auth; a real server
+adds its own overhead, and sends the files with os.sendfile if it has a
+wsgi.file_wrapper that does.
+
+    python3 bench/downloads.py [--threads 4] [--seconds 5]
+"""
+
+import os, sys, time, base64, shutil, logging, tempfile, threading
+from argparse import ArgumentParser
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+CONFIG = """
+[Database]
+path = sqlite:///%(folder)s/images.db
+
+[Location]
+thumb = %(folder)s/thumb
+
+[User]
+user = User, normal, enabled
+
+[Tag]
+"""
+
+THUMBS = 100
+THUMB_BYTES = 12000
+
+
+def run(app, location_id, seconds, threads, revalidate):
+    authorization = 'Basic ' + base64.b64encode(b'user:user').decode()
+    etags = {}
+    counts = []
+    stop = threading.Event()
+
+    def client():
+        count = 0
+        while not stop.is_set():
+            name = 'thumb%i.jpg' % (count % THUMBS)
+            environ = {
+                'PATH_INFO': '/%i/dl/%s' % (location_id, name),
+                'QUERY_STRING': 'v=1',
+                'HTTP_AUTHORIZATION': authorization,
+            }
+            if revalidate and name in etags:
+                environ['HTTP_IF_NONE_MATCH'] = etags[name]
+            setup_testing_defaults(environ)
+            headers = {}
+            def start_response(status, response_headers, exc_info=None):
+                headers.update((k.lower(), v) for k, v in response_headers)
+                headers['status'] = status
+            body = app(environ, start_response)
+            for chunk in body:
+                pass
+            if hasattr(body, 'close'):
+                body.close()
+            assert headers['status'][:3] in ('200', '304'), headers['status']
+            if 'etag' in headers:
+                etags[name] = headers['etag']
+            count += 1
+        counts.append(count)
+
+    workers = [threading.Thread(target=client) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / seconds
+
+
+parser = ArgumentParser(usage="downloads.py [--threads 4] [--seconds 5]")
+parser.add_argument('--threads', type=int, default=4)
+parser.add_argument('--seconds', type=float, default=5)
+args = parser.parse_args()
+
+folder = tempfile.mkdtemp()
+try:
+    with open(os.path.join(folder, 'images.ini'), 'w') as f:
+        f.write(CONFIG % {'folder': folder})
+    from images import Location
+    from images.setup import Setup
+    from images.location import app, get_location_by_type
+    setup = Setup(os.path.join(folder, 'images.ini'))
+    logging.getLogger().setLevel(logging.WARNING)
+    setup.create_database_tables()
+    setup.add_users()
+    setup.add_locations()
+
+    location = get_location_by_type(Location.Type.thumb)
+    os.makedirs(location.metadata.folder, exist_ok=True)
+    for n in range(THUMBS):
+        with open(os.path.join(location.metadata.folder, 'thumb%i.jpg' % n), 'wb') as f:
+            f.write(os.urandom(THUMB_BYTES))
+
+    for name, revalidate in (('download', False), ('revalidate', True)):
+        rate = run(app, location.id, args.seconds, args.threads, revalidate)
+        print("%-12s %8.2f k requests/s" % (name, rate / 1000))
+finally:
+    shutil.rmtree(folder)
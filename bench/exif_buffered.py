@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Compare the default and the buffered mode of exifread.process_file.
+
+Counts the read/seek calls issued on the file object (each one is a
+system call on an unbuffered file) and the wall time per file, over a
+corpus of JPEG and TIFF samples.
+
+    python3 bench/exif_buffered.py ~/Pictures/samples
+"""
+
+import os, sys, time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import exifread
+
+
+class CountingFile(object):
+    """File wrapper that counts read and seek calls."""
+    def __init__(self, path):
+        self.f = open(path, 'rb', buffering=0)
+        self.calls = 0
+
+    def read(self, *args):
+        self.calls += 1
+        return self.f.read(*args)
+
+    def seek(self, *args):
+        self.calls += 1
+        return self.f.seek(*args)
+
+    def tell(self):
+        return self.f.tell()
+
+    def __iter__(self):
+        return iter(self.f)
+
+    def close(self):
+        self.f.close()
+
+
+def run(paths, buffered, rounds):
+    calls = 0
+    start = time.perf_counter()
+    for n in range(rounds):
+        for path in paths:
+            f = CountingFile(path)
+            exifread.process_file(f, buffered=buffered)
+            f.close()
+            calls += f.calls
+    elapsed = time.perf_counter() - start
+    total = len(paths) * rounds
+    return calls / total, elapsed / total * 1000
+
+
+parser = ArgumentParser(usage="exif_buffered.py folder")
+parser.add_argument('folder', help='folder with JPEG and TIFF samples')
+parser.add_argument('-r', '--rounds', type=int, default=5, help='rounds over the corpus')
+args = parser.parse_args()
+
+paths = [
+    os.path.join(r, f)
+    for r, ds, fs in os.walk(args.folder)
+    for f in fs
+    if f.split('.')[-1].lower() in ('jpg', 'jpeg', 'tif', 'tiff')
+]
+if not paths:
+    sys.exit("No samples found in %s" % args.folder)
+
+print("%i files, %i rounds" % (len(paths), args.rounds))
+for buffered in (False, True):
+    calls, ms = run(paths, buffered, args.rounds)
+    print("%-9s %8.1f calls/file %8.3f ms/file" % ('buffered' if buffered else 'default', calls, ms))
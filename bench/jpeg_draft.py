@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compare rendering proxy and thumbnail from a JPEG with and without
+DCT-domain draft decoding targeted at the proxy box. Note that without it,
+Pillow's thumbnail() still drafts to the size of the NEAREST pre-shrink.
+
+Each run happens in a fresh interpreter so that peak RSS is measured for
+that run alone. Without a file argument, a 24 MP (6000x4000) test JPEG is
+generated.
+
+    python3 bench/jpeg_draft.py [image.jpg]
+"""
+
+import os, sys, time, subprocess, tempfile
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+def one(path, draft, rounds):
+    from images.ingest.image import render
+    folder = tempfile.mkdtemp()
+    thumb_path = os.path.join(folder, 'thumb.jpg')
+    proxy_path = os.path.join(folder, 'proxy.jpg')
+    start = time.perf_counter()
+    for n in range(rounds):
+        if os.path.exists(thumb_path):
+            os.remove(thumb_path)
+        render(path, thumb_path, proxy_path, draft=draft)
+    elapsed = (time.perf_counter() - start) / rounds
+    print("%.1f %i" % (elapsed * 1000, peak_rss()))
+
+
+def peak_rss():
+    """Peak RSS in KiB of this process image (ru_maxrss survives exec)."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+
+
+def make_sample():
+    from PIL import Image, ImageDraw
+    path = os.path.join(tempfile.mkdtemp(), '24mp.jpg')
+    im = Image.linear_gradient('L').resize((6000, 4000)).convert('RGB')
+    draw = ImageDraw.Draw(im)
+    for x in range(0, 6000, 40):
+        draw.line((x, 0, 6000 - x, 4000), fill=(x % 255, 80, 160))
+    im.save(path, quality=92)
+    return path
+
+
+parser = ArgumentParser(usage="jpeg_draft.py [image.jpg]")
+parser.add_argument('image', nargs='?', help='JPEG to render, defaults to a generated 24 MP one')
+parser.add_argument('-r', '--rounds', type=int, default=5, help='renders per measurement')
+parser.add_argument('--one', choices=('draft', 'full'), help='measure one mode (internal)')
+args = parser.parse_args()
+
+if args.one:
+    one(args.image, args.one == 'draft', args.rounds)
+    sys.exit(0)
+
+path = args.image or make_sample()
+print("Rendering %s, %i rounds" % (path, args.rounds))
+results = {}
+for mode in ('full', 'draft'):
+    out = subprocess.check_output([
+        sys.executable, __file__, path, '--one', mode, '--rounds', str(args.rounds)
+    ]).decode().split()
+    results[mode] = float(out[0]), int(out[1])
+    print("%-6s %8.1f ms/file %8.1f MiB peak RSS" % (mode, results[mode][0], results[mode][1] / 1024))
+
+print("saved  %8.1f ms/file %8.1f MiB peak RSS" % (
+    results['full'][0] - results['draft'][0],
+    (results['full'][1] - results['draft'][1]) / 1024,
+))
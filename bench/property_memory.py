@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Measure the memory taken per PropertySet instance with the generated
+__slots__, against the same properties kept in an instance __dict__, for
+a few of the classes that are created in large numbers. Instances still
+have a __dict__ for other attributes, allocated only when one is set.
+
+    python3 bench/property_memory.py
+"""
+
+import os, sys, copy, tracemalloc
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from images.types import PropertySet
+from images.entry import FileDescriptor
+from images.tag import TagDescriptor
+from images.ingest.image import JPEGMetadata
+
+
+SAMPLES = (
+    (TagDescriptor, {
+        'id': 'summer', 'color_id': 3, 'background_color': '#ffffff',
+        'foreground_color': '#000000', 'color_name': 'white',
+    }),
+    (FileDescriptor, {
+        'path': 'abc/IMG_4711.JPG', 'location_id': 10, 'size': 4711, 'purpose': 0,
+        'mime': 'image/jpeg',
+    }),
+    (JPEGMetadata, {
+        'Artist': 'Someone', 'ColorSpace': 'sRGB', 'Copyright': 'Someone',
+        'DateTime': '2020:06:30 18:30:00', 'DateTimeDigitized': '2020:06:30 18:30:00',
+        'DateTimeOriginal': '2020:06:30 18:30:00', 'ExposureTime': (1, 250),
+        'FNumber': (28, 10), 'Flash': 'Flash did not fire', 'FocalLength': (50, 1),
+        'FocalLengthIn35mmFilm': 75, 'Geometry': (6000, 4000), 'ISOSpeedRatings': 200,
+        'Make': 'Camera Maker', 'Model': 'Model 1', 'Orientation': 'Horizontal (normal)',
+        'Mirror': 'none', 'Angle': 90, 'Saturation': 'Normal', 'Software': 'Firmware 1.0',
+        'SubjectDistanceRange': 0, 'WhiteBalance': 'Auto', 'Latitude': '57.7',
+        'Longitude': '11.97',
+    }),
+)
+
+
+def dict_backed(cls):
+    """
+    A class with the properties of `cls`, kept in the instance __dict__.
+    """
+    dct = {name: copy.copy(prop) for name, prop in cls._properties.items()}
+    dct['__slots__'] = ()  # no property slots
+    return type(cls.__name__, (PropertySet,), dct)
+
+
+def measure(cls, dct, number):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [cls(dct) for n in range(number)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding the objects is not counted
+    return (after - before - sys.getsizeof(objects)) / number
+
+
+parser = ArgumentParser(usage="property_memory.py")
+parser.add_argument('-n', '--number', type=int, default=100000, help='objects per measurement')
+args = parser.parse_args()
+
+for cls, dct in SAMPLES:
+    sizes = {}
+    for name, variant in (('__dict__', dict_backed(cls)), ('__slots__', cls)):
+        sizes[name] = measure(variant, dct, args.number)
+        print("%-16s %-10s %8.1f bytes/object" % (cls.__name__, name, sizes[name]))
+    print("%-16s %-10s %8.1f %%" % (cls.__name__, 'saved', 100 * (1 - sizes['__slots__'] / sizes['__dict__'])))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Compare the generic PropertySet from_dict/to_dict with the ones the
+metaclass specializes for each class, for EntryDescriptor and
+JPEGMetadata. Also checks that both give the same result.
+
+    python3 bench/property_sets.py
+"""
+
+import os, sys, timeit
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from images.types import PropertySet, to_plain
+from images.entry import EntryDescriptor
+from images.ingest.image import JPEGMetadata
+
+
+ENTRY = {
+    '*schema': 'EntryDescriptor',
+    'id': 4711,
+    'original_filename': 'IMG_4711.JPG',
+    'source': 'camera',
+    'state': 2,
+    'hidden': 'no',
+    'deleted': False,
+    'access': 1,
+    'files': [],
+    'tags': ['family', 'summer'],
+    'create_ts': '2020-07-01 12:00:00',
+    'update_ts': '2020-07-02 12:00:00',
+    'taken_ts': '2020-06-30 18:30:00',
+    'user_id': 1,
+    'metadata': {'*schema': 'DefaultMetadata', 'title': 'Lake', 'creator': None, 'comment': None},
+    'self_url': '/entry/4711',
+}
+
+JPEG = {
+    '*schema': 'JPEGMetadata',
+    'Artist': 'Someone',
+    'ColorSpace': 'sRGB',
+    'DateTimeOriginal': '2020:06:30 18:30:00',
+    'ExposureTime': (1, 250),
+    'FNumber': (28, 10),
+    'Flash': 'Flash did not fire',
+    'FocalLength': (50, 1),
+    'FocalLengthIn35mmFilm': '75',
+    'Geometry': (6000, 4000),
+    'ISOSpeedRatings': 200,
+    'Make': 'Camera Maker',
+    'Model': 'Model 1',
+    'Orientation': 'Horizontal (normal)',
+    'Angle': '90',
+    'Software': 'Firmware 1.0',
+    'Latitude': 57.7,
+    'Longitude': 11.97,
+}
+
+
+def generic(cls, dct):
+    obj = cls()
+    PropertySet.from_dict(obj, dct)
+    return PropertySet.to_dict(obj)
+
+
+def specialized(cls, dct):
+    obj = cls()
+    obj.from_dict(dct)
+    return obj.to_dict()
+
+
+parser = ArgumentParser(usage="property_sets.py")
+parser.add_argument('-n', '--number', type=int, default=20000, help='round trips per measurement')
+args = parser.parse_args()
+
+for cls, dct in ((EntryDescriptor, ENTRY), (JPEGMetadata, JPEG)):
+    assert to_plain(generic(cls, dct)) == to_plain(specialized(cls, dct)), cls.__name__
+    times = {}
+    for name, function in (('generic', generic), ('specialized', specialized)):
+        times[name] = timeit.timeit(lambda: function(cls, dct), number=args.number) / args.number
+        print("%-16s %-12s %8.2f us/round trip" % (cls.__name__, name, times[name] * 1e6))
+    print("%-16s %-12s %8.2f x" % (cls.__name__, 'speedup', times['generic'] / times['specialized']))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Measure getting the thumbnails of a grid page: one request per thumbnail
+through /location/<id>/dl, against one request for the sprite of the page
+through /entry/sprite, built and then cached. Both apps are called as
+WSGI applications, so this leaves out the round trips themselves, which
+are what the sprite saves most of. A fresh system with entries and their
+thumbnails is set up in a temporary folder.
+
+    python3 bench/sprites.py [--page-size 100] [--repeat 20]
+"""
+
+import os, sys, time, base64, shutil, logging, tempfile
+from argparse import ArgumentParser
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+CONFIG = """
+[Database]
+path = sqlite:///%(folder)s/images.db
+
+[Location]
+thumb = %(folder)s/thumb
+
+[User]
+user = User, normal, enabled
+
+[Tag]
+"""
+
+THUMB_BYTES = 12000
+AUTHORIZATION = 'Basic ' + base64.b64encode(b'user:user').decode()
+
+
+def call(app, path, query=''):
+    environ = {
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'HTTP_AUTHORIZATION': AUTHORIZATION,
+    }
+    setup_testing_defaults(environ)
+    status = []
+    body = app(environ, lambda s, headers, exc_info=None: status.append(s))
+    size = sum(len(chunk) for chunk in body)
+    if hasattr(body, 'close'):
+        body.close()
+    assert status[0].startswith('200'), status[0]
+    return size
+
+
+def timed(repeat, function):
+    start = time.perf_counter()
+    for n in range(repeat):
+        size = function()
+    return (time.perf_counter() - start) / repeat * 1000, size
+
+
+parser = ArgumentParser(usage="sprites.py [--page-size 100] [--repeat 20]")
+parser.add_argument('--page-size', type=int, default=100)
+parser.add_argument('--repeat', type=int, default=20)
+args = parser.parse_args()
+
+folder = tempfile.mkdtemp()
+try:
+    with open(os.path.join(folder, 'images.ini'), 'w') as f:
+        f.write(CONFIG % {'folder': folder})
+    from images import Location, User
+    from images.setup import Setup
+    from images.database import get_db
+    from images import entry, location
+    from images.entry import EntryDescriptor, FileDescriptor, EntryQuery, create_entry, get_entries
+    setup = Setup(os.path.join(folder, 'images.ini'))
+    logging.getLogger().setLevel(logging.WARNING)
+    setup.create_database_tables()
+    setup.add_users()
+    setup.add_locations()
+
+    thumb = location.get_location_by_type(Location.Type.thumb)
+    os.makedirs(thumb.metadata.folder, exist_ok=True)
+    with get_db().read_transaction() as t:
+        user_id = t.query(User.id).filter(User.name == 'user').scalar()
+    for n in range(args.page_size):
+        path = 'thumb%i.jpg' % n
+        with open(os.path.join(thumb.metadata.folder, path), 'wb') as f:
+            f.write(os.urandom(THUMB_BYTES))
+        create_entry(EntryDescriptor(
+            original_filename=path,
+            source='bench',
+            user_id=user_id,
+            files=[FileDescriptor(path=path, location_id=thumb.id,
+                                  purpose=FileDescriptor.Purpose.thumb, mime='image/jpeg')],
+        ), system=True)
+
+    query = 'page_size=%i' % args.page_size
+    urls = [urlsplit(ed.thumb_url) for ed in get_entries(EntryQuery(page_size=args.page_size), system=True).entries]
+
+    def thumbnails():
+        return sum(call(location.app, url.path[len(location.BASE):], url.query) for url in urls)
+
+    def sprite():
+        return call(entry.app, '/sprite', query)
+
+    def cold_sprite():
+        shutil.rmtree(os.path.join(thumb.metadata.folder, entry.SPRITE_FOLDER), ignore_errors=True)
+        return sprite()
+
+    for name, function in (
+        ('thumbnails', thumbnails),
+        ('sprite, cold', cold_sprite),
+        ('sprite', sprite),
+    ):
+        ms, size = timed(args.repeat, function)
+        requests = len(urls) if function is thumbnails else 1
+        print("%-14s %8.2f ms %5i requests %9i bytes" % (name, ms, requests, size))
+finally:
+    shutil.rmtree(folder)
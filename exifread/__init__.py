@@ -11,22 +11,37 @@ __version__ = '2.1.1'
 
 logger = get_logger()
 
+# how much of a TIFF file to keep in memory in buffered mode
+TIFF_BUFFER_SIZE = 65536
+
 
 def increment_base(data, base):
     return ord_(data[base + 2]) * 256 + ord_(data[base + 3]) + 2
 
 
-def process_file(f, stop_tag=DEFAULT_STOP_TAG, details=True, strict=False, debug=False):
+def process_file(f, stop_tag=DEFAULT_STOP_TAG, details=True, strict=False, debug=False,
+                 buffered=False, wanted=None):
     """
     Process an image file (expects an open file object).
 
     This is the function that has to deal with all the arbitrary nasty bits
     of the EXIF standard.
+
+    With buffered=True, the APP1 segment of a JPEG (or the head of a TIFF)
+    is read once and decoded from memory instead of seeking and reading the
+    file for every value. The resulting tags are the same.
+
+    With wanted given as a collection of tag names (like 'EXIF FNumber'),
+    only those tags are decoded. IFDs, the MakerNote and the thumbnail are
+    skipped entirely unless some wanted tag lives there.
     """
 
     # by default do not fake an EXIF beginning
     fake_exif = 0
 
+    # end of the EXIF segment in the file, if known
+    segment_end = None
+
     # determine whether it's a JPEG or TIFF
     data = f.read(12)
     if data[0:4] in [b'II*\x00', b'MM\x00*']:
@@ -174,6 +189,7 @@ def process_file(f, stop_tag=DEFAULT_STOP_TAG, details=True, strict=False, debug
             logger.debug("Did get 0x%X and %s",
                          ord_(data[2 + base]), data[6 + base:10 + base + 1])
             return {}
+        segment_end = base + 4 + ord_(data[base + 4]) * 256 + ord_(data[base + 5])
     else:
         # file format not recognized
         logger.debug("File format not recognized.")
@@ -188,7 +204,14 @@ def process_file(f, stop_tag=DEFAULT_STOP_TAG, details=True, strict=False, debug
         'd': 'XMP/Adobe unknown'
     }[endian])
 
-    hdr = ExifHeader(f, endian, offset, fake_exif, strict, debug, details)
+    buffer = None
+    if buffered:
+        f.seek(offset)
+        buffer = f.read(segment_end - offset if segment_end else TIFF_BUFFER_SIZE)
+        logger.debug("Buffered %d bytes of EXIF data at offset %d", len(buffer), offset)
+
+    hdr = ExifHeader(f, endian, offset, fake_exif, strict, debug, details,
+                     buffer=buffer, buffer_offset=offset, wanted=wanted)
     ifd_list = hdr.list_ifd()
     thumb_ifd = False
     ctr = 0
@@ -200,8 +223,9 @@ def process_file(f, stop_tag=DEFAULT_STOP_TAG, details=True, strict=False, debug
             thumb_ifd = ifd
         else:
             ifd_name = 'IFD %d' % ctr
-        logger.debug('IFD %d (%s) at offset %s:', ctr, ifd_name, ifd)
-        hdr.dump_ifd(ifd, ifd_name, stop_tag=stop_tag)
+        if hdr.wants_ifd(ifd_name):
+            logger.debug('IFD %d (%s) at offset %s:', ctr, ifd_name, ifd)
+            hdr.dump_ifd(ifd, ifd_name, stop_tag=stop_tag)
         ctr += 1
     # EXIF IFD
     exif_off = hdr.tags.get('Image ExifOffset')
@@ -212,11 +236,12 @@ def process_file(f, stop_tag=DEFAULT_STOP_TAG, details=True, strict=False, debug
     # deal with MakerNote contained in EXIF IFD
     # (Some apps use MakerNote tags but do not use a format for which we
     # have a description, do not process these).
-    if details and 'EXIF MakerNote' in hdr.tags and 'Image Make' in hdr.tags:
+    if (details and 'EXIF MakerNote' in hdr.tags and 'Image Make' in hdr.tags
+            and hdr.wants_ifd('MakerNote')):
         hdr.decode_maker_note()
 
     # extract thumbnails
-    if details and thumb_ifd:
+    if details and thumb_ifd and hdr.wants_ifd('Thumbnail'):
         hdr.extract_tiff_thumbnail(thumb_ifd)
         hdr.extract_jpeg_thumbnail()
 
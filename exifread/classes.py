@@ -7,6 +7,18 @@ from .tags import *
 
 logger = get_logger()
 
+# tags needed to extract the embedded thumbnail
+THUMBNAIL_TAGS = (
+    'Thumbnail Compression',
+    'Thumbnail JPEGInterchangeFormat',
+    'Thumbnail JPEGInterchangeFormatLength',
+    'Thumbnail StripOffsets',
+    'Thumbnail StripByteCounts',
+)
+
+# struct format characters for unsigned integers of a given byte length
+STRUCT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
 
 class IfdTag:
     """
@@ -51,7 +63,7 @@ class ExifHeader:
     """
 
     def __init__(self, file, endian, offset, fake_exif, strict,
-                 debug=False, detailed=True):
+                 debug=False, detailed=True, buffer=None, buffer_offset=0, wanted=None):
         self.file = file
         self.endian = endian
         self.offset = offset
@@ -60,6 +72,66 @@ class ExifHeader:
         self.debug = debug
         self.detailed = detailed
         self.tags = {}
+        # optional in-memory copy of the file, starting at buffer_offset
+        self.buffer = memoryview(buffer) if buffer is not None else None
+        self.buffer_offset = buffer_offset
+        # optional set of tag names to decode, None means all of them
+        self.wanted = None
+        if wanted is not None:
+            self.wanted = set(wanted)
+            if 'JPEGThumbnail' in self.wanted or 'TIFFThumbnail' in self.wanted:
+                self.wanted.update(THUMBNAIL_TAGS)
+            if self.wants_ifd('MakerNote'):
+                self.wanted.update(('EXIF MakerNote', 'Image Make', 'Image Model'))
+
+    def wants_ifd(self, ifd_name):
+        """Tell whether any wanted tag lives in the named IFD."""
+        if self.wanted is None:
+            return True
+        prefix = ifd_name + ' '
+        return any(name.startswith(prefix) for name in self.wanted)
+
+    def wants_tag(self, name, tag_entry=None):
+        """
+        Tell whether the tag with the full name (IFD name and tag name) should
+        be decoded. Pointers to wanted sub-IFDs are always decoded, and so is
+        the whole MakerNote once any tag in it is wanted, since some makes
+        derive their tags from raw MakerNote entries.
+        """
+        if self.wanted is None or name in self.wanted:
+            return True
+        if name.startswith('MakerNote '):
+            return self.wants_ifd('MakerNote')
+        if name == 'Image ExifOffset':
+            return self.wants_ifd('EXIF')
+        if tag_entry and len(tag_entry) > 1 and type(tag_entry[1]) is tuple:
+            return self.wants_ifd(tag_entry[1][0])
+        return False
+
+    def _read(self, position, length):
+        """
+        Read length bytes at the absolute file position, from the buffer
+        if it covers the whole range, else from the file.
+        """
+        if self.buffer is not None:
+            start = position - self.buffer_offset
+            if start >= 0 and start + length <= len(self.buffer):
+                return self.buffer[start:start + length].tobytes()
+        self.file.seek(position)
+        return self.file.read(length)
+
+    def _unpack(self, offset, fmt_char, count):
+        """
+        Unpack count items of the struct format fmt_char at offset using the
+        buffer. Return None if the buffer does not cover the range.
+        """
+        if self.buffer is None:
+            return None
+        fmt = ('<' if self.endian == 'I' else '>') + '%d%s' % (count, fmt_char)
+        start = self.offset + offset - self.buffer_offset
+        if start < 0 or start + struct.calcsize(fmt) > len(self.buffer):
+            return None
+        return struct.unpack_from(fmt, self.buffer, start)
 
     def s2n(self, offset, length, signed=0):
         """
@@ -70,6 +142,12 @@ class ExifHeader:
         For some cameras that use relative tags, this offset may be relative
         to some other starting point.
         """
+        fmt_char = STRUCT_FORMATS.get(length)
+        if fmt_char is not None:
+            value = self._unpack(offset, fmt_char.lower() if signed else fmt_char, 1)
+            if value is not None:
+                return value[0]
+
         self.file.seek(self.offset + offset)
         sliced = self.file.read(length)
         if self.endian == 'I':
@@ -140,7 +218,8 @@ class ExifHeader:
                 tag_name = 'Tag 0x%04X' % tag
 
             # ignore certain tags for faster processing
-            if not (not self.detailed and tag in IGNORE_TAGS):
+            if (not (not self.detailed and tag in IGNORE_TAGS)
+                    and self.wants_tag(ifd_name + ' ' + tag_name, tag_entry)):
                 field_type = self.s2n(entry + 2, 2)
 
                 # unknown field type
@@ -182,8 +261,7 @@ class ExifHeader:
                     if count != 0:  # and count < (2**31):  # 2E31 is hardware dependant. --gd
                         file_position = self.offset + offset
                         try:
-                            self.file.seek(file_position)
-                            values = self.file.read(count)
+                            values = self._read(file_position, count)
                             #print(values)
                             # Drop any garbage after a null.
                             values = values.split(b'\x00', 1)[0]
@@ -205,7 +283,18 @@ class ExifHeader:
                     # XXX investigate
                     # some entries get too big to handle could be malformed
                     # file or problem with self.s2n
-                    if count < 1000:
+                    unpacked = None
+                    if count < 1000 and type_length in STRUCT_FORMATS:
+                        fmt_char = STRUCT_FORMATS[4 if field_type in (5, 10) else type_length]
+                        unpacked = self._unpack(offset, fmt_char.lower() if signed else fmt_char,
+                                                count * 2 if field_type in (5, 10) else count)
+                    if unpacked is not None:
+                        if field_type in (5, 10):
+                            values = [Ratio(unpacked[n], unpacked[n + 1])
+                                      for n in range(0, len(unpacked), 2)]
+                        else:
+                            values = list(unpacked)
+                    elif count < 1000:
                         for dummy in range(count):
                             if field_type in (5, 10):
                                 # a ratio
@@ -287,8 +376,7 @@ class ExifHeader:
         else:
             tiff = 'II*\x00\x08\x00\x00\x00'
             # ... plus thumbnail IFD data plus a null "next IFD" pointer
-        self.file.seek(self.offset + thumb_ifd)
-        tiff += self.file.read(entries * 12 + 2) + '\x00\x00\x00\x00'
+        tiff += self._read(self.offset + thumb_ifd, entries * 12 + 2) + '\x00\x00\x00\x00'
 
         # fix up large value offset pointers into data area
         for i in range(entries):
@@ -315,8 +403,7 @@ class ExifHeader:
                     strip_off = newoff
                     strip_len = 4
                 # get original data and store it
-                self.file.seek(self.offset + old_offset)
-                tiff += self.file.read(count * type_length)
+                tiff += self._read(self.offset + old_offset, count * type_length)
 
         # add pixel strips and update strip offset info
         old_offsets = self.tags['Thumbnail StripOffsets'].values
@@ -327,8 +414,7 @@ class ExifHeader:
             tiff = tiff[:strip_off] + offset + tiff[strip_off + strip_len:]
             strip_off += strip_len
             # add pixel strip to end
-            self.file.seek(self.offset + old_offsets[i])
-            tiff += self.file.read(old_counts[i])
+            tiff += self._read(self.offset + old_offsets[i], old_counts[i])
 
         self.tags['TIFFThumbnail'] = tiff
 
@@ -340,17 +426,16 @@ class ExifHeader:
         """
         thumb_offset = self.tags.get('Thumbnail JPEGInterchangeFormat')
         if thumb_offset:
-            self.file.seek(self.offset + thumb_offset.values[0])
             size = self.tags['Thumbnail JPEGInterchangeFormatLength'].values[0]
-            self.tags['JPEGThumbnail'] = self.file.read(size)
+            self.tags['JPEGThumbnail'] = self._read(self.offset + thumb_offset.values[0], size)
 
         # Sometimes in a TIFF file, a JPEG thumbnail is hidden in the MakerNote
         # since it's not allowed in a uncompressed TIFF IFD
         if 'JPEGThumbnail' not in self.tags:
             thumb_offset = self.tags.get('MakerNote JPEGThumbnail')
             if thumb_offset:
-                self.file.seek(self.offset + thumb_offset.values[0])
-                self.tags['JPEGThumbnail'] = self.file.read(thumb_offset.field_length)
+                self.tags['JPEGThumbnail'] = self._read(self.offset + thumb_offset.values[0],
+                                                        thumb_offset.field_length)
 
     def decode_maker_note(self):
         """
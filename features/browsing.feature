@@ -0,0 +1,58 @@
+Feature: Browsing entries
+
+  Entries are listed newest first, a page at a time. Following the next
+  and previous links of a page gives the neighbouring pages, even when
+  entries share the same time.
+
+  Background:
+     Given a system specified by "default.ini"
+       And 12 entries taken two by two at the same time
+
+  Scenario: Paging forwards through all entries
+      When the entries are listed 5 at a time
+       And the next link is followed until the last page
+      Then the pages should have 5, 5 and 2 entries
+       And all entries should be listed once, newest first
+       And the offsets should be 0, 5 and 10
+
+  Scenario: Paging backwards from the last page
+      When the entries are listed 5 at a time
+       And the next link is followed until the last page
+       And the previous link is followed until the first page
+      Then the pages should have 5, 5, 2, 5 and 5 entries
+       And the offsets should be 0, 5, 10, 5 and 0
+       And the first page should have no previous link
+
+  Scenario: Listing entries without counting them
+      When the entries are listed 5 at a time without counting
+      Then the total count should be missing
+
+  Scenario: Counts are refreshed when an entry is added
+      When the entries are listed 5 at a time
+       And an entry called extra is added
+       And the entries are listed 5 at a time
+      Then the total count should be 13
+
+  Scenario: Streaming all entries
+      When all entries are streamed
+      Then the stream should be a feed of 12 entries, newest first
+
+  Scenario: Listing a summary of the entries
+      When the entries are listed 5 at a time with the summary view
+      Then the entries should only have id, state, taken_ts, tags, thumb_url and proxy_url
+       And the next link should keep the summary view
+
+  Scenario: Listing entries with a field that doesn't exist
+      When the user user:user lists the entries with the fields id,nonsense
+      Then the response should be 400
+       And the response should mention "nonsense" and "thumb_url"
+
+  Scenario: Listing entries with a view that doesn't exist
+      When the user user:user lists the entries with the nonsense view
+      Then the response should be 400
+       And the response should mention "nonsense" and "summary"
+
+  Scenario: Listing entries after a cursor that is not one
+      When the user user:user lists the entries after the cursor "2020-01-01|nonsense"
+      Then the response should be 400
+       And the response should mention "2020-01-01|nonsense" and "cursor"
@@ -0,0 +1,22 @@
+Feature: Database transactions
+
+  Background:
+     Given a system specified by "default.ini"
+
+  Scenario: A read transaction can't write
+      When a tag is added in a read transaction
+      Then the transaction should fail
+       And there should be no tag "readonly"
+
+  Scenario: A read transaction inside a transaction sees its changes
+      When a tag "inner" is added and read back in the same transaction
+      Then the tag should have been found
+
+  Scenario: Time waiting on locks is measured
+      When a tag "waited" is added
+      Then the lock waits should include connect and commit
+
+  Scenario: Time waiting for the write lock inside a transaction is measured
+     Given another connection holds the write lock for 0.3 seconds
+      When a tag "waited" is added and committed inside the transaction
+      Then the lock waits should include a statement of at least 0.2 seconds
@@ -0,0 +1,44 @@
+Feature: Downloading files
+
+  Background:
+     Given a system specified by "default.ini"
+       And a file "abc.jpg" of 1000 bytes on the "thumb" location
+       And a file "abc.jpg" of 1000 bytes on the "image" location
+
+  Scenario: Downloading a thumbnail
+      When the user user:user downloads "abc.jpg?v=1" from the "thumb" location
+      Then the response should be 200 with 1000 bytes
+       And the response should have an ETag
+       And the response should be cacheable for good
+
+  Scenario: Downloading a thumbnail without a version
+      When the user user:user downloads "abc.jpg" from the "thumb" location
+      Then the response should be 200 with 1000 bytes
+       And the response should have to be revalidated
+
+  Scenario: Downloading a thumbnail again
+      When the user user:user downloads "abc.jpg?v=1" from the "thumb" location
+       And the user user:user downloads "abc.jpg?v=1" from the "thumb" location again
+      Then the response should be 304 with 0 bytes
+
+  Scenario: Downloading a changed file again
+      When the user user:user downloads "abc.jpg" from the "image" location
+       And the file "abc.jpg" on the "image" location is replaced
+       And the user user:user downloads "abc.jpg" from the "image" location again
+      Then the response should be 200 with 1000 bytes
+
+  Scenario: Downloading part of an original
+      When the user user:user downloads bytes 100-199 of "abc.jpg" from the "image" location
+      Then the response should be 206 with 100 bytes
+       And the response should be bytes 100-199 of the file
+       And the response should have the header Content-Range "bytes 100-199/1000"
+
+  Scenario: Downloading part of a changed original
+      When the user user:user downloads "abc.jpg" from the "image" location
+       And the file "abc.jpg" on the "image" location is replaced
+       And the user user:user downloads bytes 100-199 of "abc.jpg" from the "image" location if unchanged
+      Then the response should be 200 with 1000 bytes
+
+  Scenario: Downloading a file that isn't there
+      When the user user:user downloads "nothere.jpg" from the "image" location
+      Then the response should be 404
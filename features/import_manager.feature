@@ -0,0 +1,65 @@
+Feature: Import manager
+
+  One pool of workers imports the jobs of all importable locations. Jobs
+  are claimed in batches and handed out round robin over the locations,
+  so that a busy location doesn't hold up the others.
+
+  Background:
+     Given a system specified by "default.ini"
+       And a specific set of locations
+        | name     | type   | folder                   |
+        | test_mob | mobile | /tmp/images_behave/mobile |
+       And import jobs are run by a recorder
+
+  Scenario: Taking turns between locations
+     Given 6 import jobs on the location drop_folder
+       And 2 import jobs on the location test_mob
+       And an import manager with 1 worker
+      When the import manager has run 8 jobs
+      Then the first 4 jobs should alternate between the locations
+       And the last 4 jobs should be on the location drop_folder
+
+  Scenario: Sharing the workers
+     Given 4 import jobs on the location drop_folder
+       And 4 import jobs on the location test_mob
+       And an import manager with 2 workers
+      When the import manager has run 8 jobs
+      Then at most 2 jobs should have run at once
+
+  Scenario: Claiming jobs in batches
+     Given 12 import jobs on the location drop_folder
+       And an import manager with 2 workers
+      When the import manager has run 12 jobs
+      Then the location drop_folder should have been claimed from 2 times
+
+  Scenario: Getting the import stats
+     Given 3 import jobs on the location drop_folder
+       And an import manager with 2 workers
+      When the import manager has run 3 jobs
+       And the user admin:admin gets the importers
+      Then the importer of the location drop_folder should have 3 done and 0 failed
+       And the importer of the location drop_folder should have 0 queued, 0 claimed and 0 in flight
+       And the importer of the location test_mob should have 0 done and 0 failed
+       And the importers should show the time spent waiting for database locks
+       And the importers should show the hit rate of the credential cache
+
+  Scenario: Waking up for new jobs
+     Given an idle import manager with 1 worker
+      When 2 import jobs are created on the location drop_folder
+      Then the import manager should run 2 jobs within 2 seconds
+       And the latency on the location drop_folder should be below 0.5 seconds
+
+  Scenario: Waking up for new jobs created in bulk
+     Given an idle import manager with 1 worker
+      When import jobs for job0.jpg to job4.jpg are created in bulk on the location drop_folder
+      Then the import manager should run 5 jobs within 2 seconds
+       And the latency on the location drop_folder should be below 0.5 seconds
+
+  Scenario: Polling idle locations less often
+     Given an idle import manager with 1 worker
+      When the location drop_folder is polled 3 more times without jobs
+      Then the location drop_folder should be polled every 480 seconds
+      When the location drop_folder is polled 3 more times without jobs
+      Then the location drop_folder should be polled every 600 seconds
+      When 1 import job is created on the location drop_folder
+      Then the location drop_folder should be polled every 30 seconds
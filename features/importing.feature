@@ -0,0 +1,61 @@
+Feature: Import jobs
+
+  Import jobs are claimed in batches by workers. A claim is a lease
+  that runs out if the worker never finishes the job.
+
+  Background:
+     Given a system specified by "default.ini"
+       And 5 import jobs on the location drop_folder
+
+  Scenario: Claiming a batch of import jobs
+      When worker A claims 3 import jobs on the location drop_folder
+      Then worker A should have 3 import jobs
+       And those import jobs should be active
+
+  Scenario: Two workers claiming on the same location
+      When worker A claims 3 import jobs on the location drop_folder
+       And worker B claims 3 import jobs on the location drop_folder
+      Then worker A should have 3 import jobs
+       And worker B should have 2 import jobs
+       And no import job should be claimed twice
+
+  Scenario: Claiming jobs of a worker whose lease has expired
+      When worker A claims 5 import jobs on the location drop_folder with an expired lease
+       And worker B claims 5 import jobs on the location drop_folder
+      Then worker B should have 5 import jobs
+
+  Scenario: Creating import jobs in bulk
+      When import jobs for job0.jpg to job9.jpg are created in bulk on the location drop_folder
+      Then 5 import jobs should have been created and 5 should have existed
+      When worker A claims 10 import jobs on the location drop_folder
+      Then worker A should have 10 import jobs
+
+  Scenario: Creating import jobs in bulk with repeated paths
+      When import jobs for job5.jpg to job7.jpg are created in bulk twice on the location drop_folder
+      Then 3 import jobs should have been created and 3 should have existed
+
+  Scenario: Creating import jobs in bulk on a location that doesn't exist
+      When the user admin:admin posts import jobs for job8.jpg on the location with id 999
+      Then the response should be 404
+       And there should be 5 import jobs
+
+  Scenario: Creating import jobs in bulk on a location that can't be imported from
+      When the user admin:admin posts import jobs for job8.jpg on the location thumb
+      Then the response should be 400
+       And there should be 5 import jobs
+
+  Scenario: Creating import jobs in bulk without a location
+      When the user admin:admin posts import jobs for job8.jpg without a location
+      Then the response should be 400
+       And there should be 5 import jobs
+
+  Scenario: Inserting an import job that another writer has just created
+      When import jobs for job3.jpg to job6.jpg are inserted without looking for existing ones on the location drop_folder
+      Then 2 import jobs should have been inserted
+       And there should be 7 import jobs
+
+  Scenario: Upgrading a database with duplicate import jobs
+     Given the import jobs for job0.jpg and job1.jpg were created twice before paths were unique
+      When the database is upgraded
+      Then there should be 5 import jobs
+       And an import job for job0.jpg should not be created twice
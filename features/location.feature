@@ -27,3 +27,22 @@ Feature: Locations
        And that location should have public access
        And that location should belong to user 2
 
+  Scenario: Looking up a location again
+      When the location named "test_mob" is looked up twice
+      Then both lookups should give the same location
+
+  Scenario: Moving a location
+      When the location named "test_mob" is moved to "/tmp/images/mobile2"
+      Then there should be a "mobile" location named "test_mob"
+       And that location should be mounted at "/tmp/images/mobile2"
+
+  Scenario: Deleting a location
+      When the location named "test_leg" is deleted
+      Then there should be no "legacy" location named "test_leg"
+
+  Scenario: Looking up a location while it is being moved
+     Given the location named "test_mob" is moved to "/tmp/images/mobile2" but not yet committed
+      When the location named "test_mob" is looked up from another thread
+       And the move is committed
+      Then there should be a "mobile" location named "test_mob"
+       And that location should be mounted at "/tmp/images/mobile2"
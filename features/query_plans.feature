@@ -0,0 +1,40 @@
+Feature: Query plans
+
+  The queries behind browsing, deleting and looking up entries should be
+  answered from indexes, also on a large library. The plans are checked
+  with EXPLAIN QUERY PLAN on a synthetic SQLite database.
+
+  Background:
+     Given a synthetic database with 1000000 entries
+       And a logged in normal user
+
+  Scenario: Listing the first page of entries
+      When the first page of entries is listed
+      Then no query should scan a whole table
+       And no query should sort in a temporary b-tree
+
+  Scenario: Listing the next page of entries
+      When the next page of entries is listed
+      Then no query should scan a whole table
+       And no query should sort in a temporary b-tree
+       And the page should be found by seeking on taken_ts
+
+  Scenario: Listing the previous page of entries
+      When the previous page of entries is listed
+      Then no query should scan a whole table
+       And no query should sort in a temporary b-tree
+       And the page should be found by seeking on taken_ts
+
+  Scenario: Listing entries with and without a tag
+      When the entries with the tag "tag7" but not "tag8" are listed
+      Then no query should scan a whole table
+       And no query should sort in a temporary b-tree
+
+  Scenario: Picking up an entry to delete
+      When an entry to delete is picked up
+      Then no query should scan a whole table
+       And no query should sort in a temporary b-tree
+
+  Scenario: Looking up an entry by source
+      When the entry IMG_42.jpg from the source src2 is looked up
+      Then no query should scan a whole table
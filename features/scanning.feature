@@ -0,0 +1,55 @@
+Feature: Scanning folders
+
+  Scanners remember what they have seen in a folder and only report new
+  or changed files on later scans.
+
+  Background:
+     Given a system specified by "default.ini"
+       And the files a.jpg, b.jpg and sub/c.jpg in the drop_folder
+
+  Scenario: Scanning a folder for the first time
+      When the drop_folder is scanned
+      Then the scan should find a.jpg, b.jpg and sub/c.jpg
+
+  Scenario: Scanning an unchanged folder
+      When the drop_folder is scanned
+       And the drop_folder is scanned again
+      Then the scan should find nothing
+
+  Scenario: Scanning after adding and changing files
+      When the drop_folder is scanned
+       And the files sub/d.jpg and sub/deeper/e.jpg are added to the drop_folder
+       And the file a.jpg is replaced in the drop_folder
+       And the drop_folder is scanned again
+      Then the scan should find a.jpg, sub/d.jpg and sub/deeper/e.jpg
+
+  Scenario: Only a full scan finds files rewritten in place
+      When the drop_folder is scanned
+       And the file sub/c.jpg is rewritten in the drop_folder
+       And the drop_folder is scanned again
+      Then the scan should find nothing
+      When the drop_folder is fully scanned
+      Then the scan should find sub/c.jpg
+
+  Scenario: Scan state is kept between scanners
+      When the drop_folder is scanned
+       And the file f.jpg is added to the drop_folder
+       And the drop_folder is scanned by a new scanner
+      Then the scan should find f.jpg
+
+  Scenario: A scan whose import jobs could not be created is done over
+      When the import jobs of a scan of the drop_folder fail to be created
+       And the drop_folder is scanned again
+      Then the scan should find a.jpg, b.jpg and sub/c.jpg
+
+  Scenario: Watching a folder for new files
+      When the drop_folder is watched
+       And the file f.jpg is added to the drop_folder
+       And the files new/g.jpg and new/deeper/h.jpg are added to the drop_folder
+       And the file .hidden.jpg is added to the drop_folder
+      Then the watch should find f.jpg, new/g.jpg and new/deeper/h.jpg
+
+  Scenario: Watching a folder for files moved in
+      When the drop_folder is watched
+       And the file sub/c.jpg is replaced in the drop_folder
+      Then the watch should find sub/c.jpg
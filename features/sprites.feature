@@ -0,0 +1,29 @@
+Feature: Thumbnail sprites
+
+  The thumbnails of a page of entries come in one sprite, a line of JSON
+  with the offset of each thumbnail followed by the thumbnails.
+
+  Background:
+     Given a system specified by "default.ini"
+       And 3 entries with thumbnails
+
+  Scenario: Getting the thumbnails of a page
+      When the user user:user gets the sprite of the entries 5 at a time
+      Then the response should be 200
+       And the sprite should have the thumbnails of 3 entries, newest first
+
+  Scenario: Getting the thumbnails of a smaller page
+      When the user user:user gets the sprite of the entries 2 at a time
+      Then the sprite should have the thumbnails of 2 entries, newest first
+
+  Scenario: Getting the thumbnails of a page again
+      When the user user:user gets the sprite of the entries 5 at a time
+       And the user user:user gets the sprite of the entries 5 at a time again
+      Then the response should be 304 with 0 bytes
+
+  Scenario: Getting the thumbnails of a page with a new thumbnail
+      When the user user:user gets the sprite of the entries 5 at a time
+       And the thumbnail of the newest entry is rendered again
+       And the user user:user gets the sprite of the entries 5 at a time again
+      Then the response should be 200
+       And the sprite should have the thumbnails of 3 entries, newest first
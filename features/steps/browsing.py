@@ -0,0 +1,137 @@
+import re, json, base64
+from urllib.parse import urlsplit, urlencode
+from wsgiref.util import setup_testing_defaults
+from behave import *
+from hamcrest import *
+from bottle import request
+
+from images.entry import app, EntryDescriptor, EntryDescriptorFeed, EntryQuery, create_entry, get_entries, iter_entries
+
+
+def follow(context, link):
+    request.bind({'REQUEST_METHOD': 'GET', 'QUERY_STRING': urlsplit(link).query})
+    context.pages.append(get_entries(EntryQuery.map_in_from_request(), system=True))
+
+
+def get(context, credentials, query):
+    environ = {
+        'PATH_INFO': '/',
+        'QUERY_STRING': urlencode(query),
+        'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(credentials.encode()).decode(),
+    }
+    setup_testing_defaults(environ)
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+    response['body'] = b''.join(app(environ, start_response))
+    context.response = response
+
+
+def numbers(text):
+    return [int(n) for n in re.findall(r'\d+', text)]
+
+
+@given('{count:d} entries taken two by two at the same time')
+def step_impl(context, count):
+    context.entry_ids = []
+    for n in range(count):
+        ed = create_entry(EntryDescriptor(
+            original_filename='entry%i.jpg' % n,
+            source='test',
+            taken_ts='2020-01-%02i 12:00:00' % (n // 2 + 1),
+        ), system=True)
+        context.entry_ids.append(ed.id)
+    context.pages = []
+
+@when('the entries are listed {page_size:d} at a time')
+def step_impl(context, page_size):
+    context.pages.append(get_entries(EntryQuery(page_size=page_size), system=True))
+
+@when('the entries are listed {page_size:d} at a time without counting')
+def step_impl(context, page_size):
+    context.pages.append(get_entries(EntryQuery(page_size=page_size, count=False), system=True))
+
+@when('the entries are listed {page_size:d} at a time with the {view} view')
+def step_impl(context, page_size, view):
+    context.pages.append(get_entries(EntryQuery(page_size=page_size, view=view), system=True))
+
+@when('an entry called {entry_name} is added')
+def step_impl(context, entry_name):
+    create_entry(EntryDescriptor(original_filename=entry_name, source='test'), system=True)
+
+@when('the next link is followed until the last page')
+def step_impl(context):
+    while context.pages[-1].next_link:
+        follow(context, context.pages[-1].next_link)
+
+@when('the previous link is followed until the first page')
+def step_impl(context):
+    while context.pages[-1].prev_link:
+        follow(context, context.pages[-1].prev_link)
+
+@then('the pages should have {counts} entries')
+def step_impl(context, counts):
+    assert_that([page.count for page in context.pages], equal_to(numbers(counts)))
+
+@then('the offsets should be {offsets}')
+def step_impl(context, offsets):
+    assert_that([page.offset for page in context.pages], equal_to(numbers(offsets)))
+
+@then('all entries should be listed once, newest first')
+def step_impl(context):
+    ids = [ed.id for page in context.pages for ed in page.entries]
+    # Same taken_ts and create_ts, so the later id comes first
+    assert_that(ids, equal_to(list(reversed(context.entry_ids))))
+
+@then('the first page should have no previous link')
+def step_impl(context):
+    assert_that(context.pages[-1].prev_link, none())
+
+@then('the total count should be missing')
+def step_impl(context):
+    assert_that(context.pages[-1].total_count, none())
+
+@then('the total count should be {count:d}')
+def step_impl(context, count):
+    assert_that(context.pages[-1].total_count, equal_to(count))
+
+@when('all entries are streamed')
+def step_impl(context):
+    feed = EntryDescriptorFeed()
+    context.stream = ''.join(feed.to_json_stream(iter_entries(EntryQuery(), system=True)))
+
+@then('the stream should be a feed of {count:d} entries, newest first')
+def step_impl(context, count):
+    feed = json.loads(context.stream)
+    assert_that(feed['*schema'], equal_to('EntryDescriptorFeed'))
+    assert_that(feed['count'], equal_to(count))
+    ids = [entry['id'] for entry in feed['entries']]
+    assert_that(ids, equal_to(list(reversed(context.entry_ids))))
+
+@then('the entries should only have {names}')
+def step_impl(context, names):
+    feed = json.loads(context.pages[-1].to_json())
+    for entry in feed['entries']:
+        assert_that(set(entry) - {'*schema'}, equal_to(set(re.split(r',\s*|\s+and\s+', names))))
+
+@then('the next link should keep the {view} view')
+def step_impl(context, view):
+    assert_that(context.pages[-1].next_link, contains_string('view=' + view))
+
+@when('the user {credentials} lists the entries with the fields {fields}')
+def step_impl(context, credentials, fields):
+    get(context, credentials, {'fields': fields})
+
+@when('the user {credentials} lists the entries with the {view} view')
+def step_impl(context, credentials, view):
+    get(context, credentials, {'view': view})
+
+@when('the user {credentials} lists the entries after the cursor "{cursor}"')
+def step_impl(context, credentials, cursor):
+    get(context, credentials, {'after': cursor})
+
+@then('the response should mention "{first}" and "{second}"')
+def step_impl(context, first, second):
+    body = context.response['body'].decode('utf8')
+    assert_that(body, contains_string(first))
+    assert_that(body, contains_string(second))
@@ -0,0 +1,78 @@
+import sqlite3, threading, time
+from behave import *
+from hamcrest import *
+
+from images import Tag
+from images.database import get_db
+
+
+@when('a tag is added in a read transaction')
+def step_impl(context):
+    try:
+        with get_db().read_transaction() as t:
+            t.add(Tag(id='readonly', color=0))
+            t.flush()
+        context.error = None
+    except Exception as e:
+        context.error = e
+
+@when('a tag "{tag_id}" is added and read back in the same transaction')
+def step_impl(context, tag_id):
+    with get_db().transaction() as t:
+        t.add(Tag(id=tag_id, color=0))
+        t.flush()
+        with get_db().read_transaction() as r:
+            context.found = r.query(Tag).filter(Tag.id == tag_id).count()
+
+@when('a tag "{tag_id}" is added')
+def step_impl(context, tag_id):
+    with get_db().transaction() as t:
+        t.add(Tag(id=tag_id, color=0))
+
+@given('another connection holds the write lock for {seconds:g} seconds')
+def step_impl(context, seconds):
+    locked = threading.Event()
+    def hold():
+        connection = sqlite3.connect(get_db().engine.url.database)
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            locked.set()
+            time.sleep(seconds)
+            connection.rollback()
+        finally:
+            connection.close()
+    context.holder = threading.Thread(target=hold)
+    context.holder.start()
+    context.tear_down_scenario.insert(0, lambda context: context.holder.join())
+    locked.wait()
+
+@when('a tag "{tag_id}" is added and committed inside the transaction')
+def step_impl(context, tag_id):
+    with get_db().transaction() as t:
+        t.add(Tag(id=tag_id, color=0))
+        t.commit()
+
+@then('the transaction should fail')
+def step_impl(context):
+    assert_that(context.error, is_not(None))
+
+@then('there should be no tag "{tag_id}"')
+def step_impl(context, tag_id):
+    with get_db().read_transaction() as t:
+        assert_that(t.query(Tag).filter(Tag.id == tag_id).count(), equal_to(0))
+
+@then('the tag should have been found')
+def step_impl(context):
+    assert_that(context.found, equal_to(1))
+
+@then('the lock waits should include connect and commit')
+def step_impl(context):
+    waits = get_db().lock_waits.get()
+    assert_that(waits, has_key('connect'))
+    assert_that(waits, has_key('commit'))
+    assert_that(waits['commit']['count'], greater_than(0))
+
+@then('the lock waits should include a statement of at least {seconds:g} seconds')
+def step_impl(context, seconds):
+    waits = get_db().lock_waits.get()
+    assert_that(waits['execute']['max'], greater_than_or_equal_to(seconds))
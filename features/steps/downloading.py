@@ -0,0 +1,98 @@
+import os, base64
+from wsgiref.util import setup_testing_defaults
+from behave import *
+from hamcrest import *
+
+from images import Location
+from images.location import app, get_location_by_type
+
+
+def download(context, credentials, path, type, **environ):
+    location = get_location_by_type(getattr(Location.Type, type))
+    path, _, query = path.partition('?')
+    environ.update({
+        'PATH_INFO': '/%i/dl/%s' % (location.id, path),
+        'QUERY_STRING': query,
+        'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(credentials.encode()).decode(),
+    })
+    setup_testing_defaults(environ)
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+        response['headers'] = {name.lower(): value for name, value in headers}
+    body = app(environ, start_response)
+    try:
+        response['body'] = b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    context.response = response
+
+
+def write_file(context, name, size, type):
+    location = get_location_by_type(getattr(Location.Type, type))
+    os.makedirs(location.metadata.folder, exist_ok=True)
+    data = os.urandom(size)
+    # Written next to it and moved in, so that it is a new file
+    path = os.path.join(location.metadata.folder, name)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.rename(path + '.tmp', path)
+    context.data = data
+
+
+@given('a file "{name}" of {size:d} bytes on the "{type}" location')
+def step_impl(context, name, size, type):
+    write_file(context, name, size, type)
+
+@when('the file "{name}" on the "{type}" location is replaced')
+def step_impl(context, name, type):
+    write_file(context, name, len(context.data), type)
+
+@when('the user {credentials} downloads "{path}" from the "{type}" location again')
+def step_impl(context, credentials, path, type):
+    download(context, credentials, path, type,
+             HTTP_IF_NONE_MATCH=context.response['headers']['etag'])
+
+@when('the user {credentials} downloads bytes {first:d}-{last:d} of "{path}" from the "{type}" location if unchanged')
+def step_impl(context, credentials, first, last, path, type):
+    download(context, credentials, path, type,
+             HTTP_RANGE='bytes=%i-%i' % (first, last),
+             HTTP_IF_RANGE=context.response['headers']['etag'])
+
+@when('the user {credentials} downloads bytes {first:d}-{last:d} of "{path}" from the "{type}" location')
+def step_impl(context, credentials, first, last, path, type):
+    download(context, credentials, path, type, HTTP_RANGE='bytes=%i-%i' % (first, last))
+
+@when('the user {credentials} downloads "{path}" from the "{type}" location')
+def step_impl(context, credentials, path, type):
+    download(context, credentials, path, type)
+
+@then('the response should be {status:d} with {size:d} bytes')
+def step_impl(context, status, size):
+    assert_that(context.response['status'], equal_to(status))
+    assert_that(len(context.response['body']), equal_to(size))
+
+@then('the response should be {status:d}')
+def step_impl(context, status):
+    assert_that(context.response['status'], equal_to(status))
+
+@then('the response should have an ETag')
+def step_impl(context):
+    assert_that(context.response['headers'], has_key('etag'))
+
+@then('the response should be cacheable for good')
+def step_impl(context):
+    assert_that(context.response['headers']['cache-control'], contains_string('immutable'))
+
+@then('the response should have to be revalidated')
+def step_impl(context):
+    assert_that(context.response['headers']['cache-control'], contains_string('no-cache'))
+
+@then('the response should be bytes {first:d}-{last:d} of the file')
+def step_impl(context, first, last):
+    assert_that(context.response['body'], equal_to(context.data[first:last + 1]))
+
+@then('the response should have the header {name} "{value}"')
+def step_impl(context, name, value):
+    assert_that(context.response['headers'][name.lower()], equal_to(value))
@@ -0,0 +1,179 @@
+import time, json, base64
+from threading import Lock
+from wsgiref.util import setup_testing_defaults
+from behave import *
+from hamcrest import *
+
+from images import import_job
+from images.import_job import ImportManager, ImportJobDescriptor, POLL_INTERVAL, create_import_job
+from images.location import get_location_by_name
+
+
+class Recorder(object):
+    """
+    Stands in for run_import_job, recording the locations of the jobs in
+    the order they were run, and how many ran at once.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.locations = []
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, jd, metadata):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+            self.locations.append(jd.location.id)
+        return True
+
+
+def wait_for(condition, timeout=10):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "Timed out"
+        time.sleep(0.01)
+
+
+def get_json(app, credentials, path):
+    environ = {
+        'PATH_INFO': path,
+        'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(credentials.encode()).decode(),
+    }
+    setup_testing_defaults(environ)
+    status = []
+    body = app(environ, lambda s, headers, exc_info=None: status.append(s))
+    assert status[0].startswith('200'), status[0]
+    return json.loads(b''.join(body).decode('utf8'))
+
+
+@given('import jobs are run by a recorder')
+def step_impl(context):
+    run_import_job = import_job.run_import_job
+    claim_import_jobs = import_job.claim_import_jobs
+    context.recorder = Recorder()
+    context.claims_made = []
+
+    def claim(location_id, **kwargs):
+        jds = claim_import_jobs(location_id, **kwargs)
+        if jds:
+            context.claims_made.append(location_id)
+        return jds
+
+    import_job.run_import_job = context.recorder
+    import_job.claim_import_jobs = claim
+
+    def tear_down(context):
+        if getattr(context, 'import_manager', None) is not None:
+            context.import_manager.shutdown()
+            context.import_manager = None
+        import_job.run_import_job = run_import_job
+        import_job.claim_import_jobs = claim_import_jobs
+
+    context.tear_down_scenario.insert(0, tear_down)
+
+@given('an import manager with {workers:d} worker')
+@given('an import manager with {workers:d} workers')
+def step_impl(context, workers):
+    context.import_manager = ImportManager(workers=workers, pool='thread')
+
+@given('an idle import manager with {workers:d} worker')
+def step_impl(context, workers):
+    context.import_manager = manager = ImportManager(workers=workers, pool='thread')
+    # The first poll of every location has found nothing
+    wait_for(lambda: all(interval > POLL_INTERVAL for interval in manager.poll_interval.values()))
+
+@when('{count:d} import job is created on the location {location_name}')
+@when('{count:d} import jobs are created on the location {location_name}')
+def step_impl(context, count, location_name):
+    location = get_location_by_name(location_name)
+    for n in range(count):
+        create_import_job(ImportJobDescriptor(
+            path='new%i.jpg' % n,
+            location=location,
+            user_id=1,
+        ))
+
+@when('the location {location_name} is polled {count:d} more times without jobs')
+def step_impl(context, location_name, count):
+    location = get_location_by_name(location_name)
+    for n in range(count):
+        assert_that(context.import_manager.claim(location.id), empty())
+
+@when('the import manager has run {count:d} jobs')
+def step_impl(context, count):
+    manager = context.import_manager
+    wait_for(lambda: sum(manager.get_stats(location_id)['done']
+                         for location_id in manager.locations) >= count)
+
+@when('the user {credentials} gets the importers')
+def step_impl(context, credentials):
+    feed = get_json(import_job.app, credentials, '/')
+    context.importers = {importer['location_id']: importer for importer in feed['entries']}
+    context.lock_waits = feed['lock_waits']
+    context.credential_cache = feed['credential_cache']
+
+@then('the import manager should run {count:d} jobs within {seconds:d} seconds')
+def step_impl(context, count, seconds):
+    manager = context.import_manager
+    wait_for(lambda: sum(manager.get_stats(location_id)['done']
+                         for location_id in manager.locations) >= count, timeout=seconds)
+
+@then('the latency on the location {location_name} should be below {seconds:g} seconds')
+def step_impl(context, location_name, seconds):
+    stats = context.import_manager.get_stats(get_location_by_name(location_name).id)
+    assert_that(stats['max_latency'], less_than(seconds))
+
+@then('the location {location_name} should be polled every {seconds:d} seconds')
+def step_impl(context, location_name, seconds):
+    location = get_location_by_name(location_name)
+    assert_that(context.import_manager.poll_interval[location.id], equal_to(seconds))
+
+@then('the first {count:d} jobs should alternate between the locations')
+def step_impl(context, count):
+    locations = context.recorder.locations[:count]
+    for previous, location_id in zip(locations, locations[1:]):
+        assert_that(location_id, is_not(equal_to(previous)))
+
+@then('the last {count:d} jobs should be on the location {location_name}')
+def step_impl(context, count, location_name):
+    location = get_location_by_name(location_name)
+    assert_that(context.recorder.locations[-count:], only_contains(location.id))
+
+@then('at most {count:d} jobs should have run at once')
+def step_impl(context, count):
+    assert_that(context.recorder.max_running, less_than_or_equal_to(count))
+
+@then('the location {location_name} should have been claimed from {count:d} times')
+def step_impl(context, location_name, count):
+    location = get_location_by_name(location_name)
+    assert_that(context.claims_made.count(location.id), equal_to(count))
+
+@then('the importer of the location {location_name} should have {done:d} done and {failed:d} failed')
+def step_impl(context, location_name, done, failed):
+    importer = context.importers[get_location_by_name(location_name).id]
+    assert_that((importer['done'], importer['failed']), equal_to((done, failed)))
+
+@then('the importer of the location {location_name} should have {queued:d} queued, {claimed:d} claimed and {in_flight:d} in flight')
+def step_impl(context, location_name, queued, claimed, in_flight):
+    importer = context.importers[get_location_by_name(location_name).id]
+    assert_that((importer['queued'], importer['claimed'], importer['in_flight']),
+                equal_to((queued, claimed, in_flight)))
+
+@then('the importers should show the time spent waiting for database locks')
+def step_impl(context):
+    assert_that(context.lock_waits, has_entries(
+        connect=has_entries(count=greater_than(0)),
+        commit=has_entries(count=greater_than(0)),
+    ))
+    for wait in context.lock_waits.values():
+        assert_that(wait['max'], less_than_or_equal_to(wait['total']))
+
+@then('the importers should show the hit rate of the credential cache')
+def step_impl(context):
+    stats = context.credential_cache
+    assert_that(stats['misses'], greater_than(0))
+    assert_that(stats['hit_rate'], equal_to(stats['hits'] / (stats['hits'] + stats['misses'])))
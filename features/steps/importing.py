@@ -0,0 +1,151 @@
+import io, json, base64
+from datetime import timedelta
+from wsgiref.util import setup_testing_defaults
+from behave import *
+from hamcrest import *
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from images import ImportJob
+from images.database import get_db
+from images.import_job import app, ImportJobDescriptor, create_import_job, create_import_jobs, \
+    claim_import_jobs, count_import_jobs_by_location, insert_import_jobs, import_job_row
+from images.location import get_location_by_name
+
+
+def post_import_jobs(context, credentials, jobs):
+    body = json.dumps({'*schema': 'ImportJobDescriptorFeed', 'entries': jobs}).encode('utf8')
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/jobs',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(credentials.encode()).decode(),
+    }
+    setup_testing_defaults(environ)
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+        response['headers'] = {name.lower(): value for name, value in headers}
+    response['body'] = b''.join(app(environ, start_response))
+    context.response = response
+
+
+@given('{count:d} import jobs on the location {location_name}')
+def step_impl(context, count, location_name):
+    location = get_location_by_name(location_name)
+    for n in range(count):
+        create_import_job(ImportJobDescriptor(
+            path='job%i.jpg' % n,
+            location=location,
+            user_id=1,
+        ))
+    context.claims = {}
+
+@when('worker {worker} claims {count:d} import jobs on the location {location_name} with an expired lease')
+def step_impl(context, worker, count, location_name):
+    location = get_location_by_name(location_name)
+    context.claims[worker] = claim_import_jobs(location.id, owner=worker, limit=count,
+                                               lease=timedelta(seconds=-1))
+
+@when('worker {worker} claims {count:d} import jobs on the location {location_name}')
+def step_impl(context, worker, count, location_name):
+    location = get_location_by_name(location_name)
+    context.claims[worker] = claim_import_jobs(location.id, owner=worker, limit=count)
+    context.worker = worker
+
+@then('worker {worker} should have {count:d} import jobs')
+def step_impl(context, worker, count):
+    assert_that(context.claims[worker], has_length(count))
+    context.worker = worker
+
+@then('those import jobs should be active')
+def step_impl(context):
+    for jd in context.claims[context.worker]:
+        assert_that(jd.state, equal_to(ImportJob.State.active))
+
+@then('no import job should be claimed twice')
+def step_impl(context):
+    ids = [jd.id for jds in context.claims.values() for jd in jds]
+    assert_that(len(set(ids)), equal_to(len(ids)))
+
+@when('import jobs for job{first:d}.jpg to job{last:d}.jpg are created in bulk on the location {location_name}')
+def step_impl(context, first, last, location_name):
+    location = get_location_by_name(location_name)
+    context.result = create_import_jobs([
+        ImportJobDescriptor(path='job%i.jpg' % n, location=location, user_id=1)
+        for n in range(first, last + 1)
+    ])
+
+@when('import jobs for job{first:d}.jpg to job{last:d}.jpg are created in bulk twice on the location {location_name}')
+def step_impl(context, first, last, location_name):
+    location = get_location_by_name(location_name)
+    context.result = create_import_jobs([
+        ImportJobDescriptor(path='job%i.jpg' % n, location=location, user_id=1)
+        for n in list(range(first, last + 1)) * 2
+    ])
+
+@then('{created:d} import jobs should have been created and {existing:d} should have existed')
+def step_impl(context, created, existing):
+    assert_that(context.result, equal_to({'created': created, 'existing': existing}))
+
+@when('the user {credentials} posts import jobs for {path} on the location with id {location_id:d}')
+def step_impl(context, credentials, path, location_id):
+    post_import_jobs(context, credentials, [
+        {'*schema': 'ImportJobDescriptor', 'path': path, 'location': {'id': location_id}},
+    ])
+
+@when('the user {credentials} posts import jobs for {path} on the location {location_name}')
+def step_impl(context, credentials, path, location_name):
+    location = get_location_by_name(location_name)
+    post_import_jobs(context, credentials, [
+        {'*schema': 'ImportJobDescriptor', 'path': path, 'location': {'id': location.id}},
+    ])
+
+@when('the user {credentials} posts import jobs for {path} without a location')
+def step_impl(context, credentials, path):
+    post_import_jobs(context, credentials, [
+        {'*schema': 'ImportJobDescriptor', 'path': path},
+    ])
+
+@then('there should be {count:d} import jobs')
+def step_impl(context, count):
+    assert_that(sum(count_import_jobs_by_location(ImportJob.State.new).values()), equal_to(count))
+
+@when('import jobs for job{first:d}.jpg to job{last:d}.jpg are inserted without looking for existing ones on the location {location_name}')
+def step_impl(context, first, last, location_name):
+    location = get_location_by_name(location_name)
+    with get_db().transaction() as t:
+        context.inserted = insert_import_jobs(t, [
+            import_job_row(ImportJobDescriptor(path='job%i.jpg' % n, location=location, user_id=1))
+            for n in range(first, last + 1)
+        ])
+
+@then('{count:d} import jobs should have been inserted')
+def step_impl(context, count):
+    assert_that(context.inserted, equal_to(count))
+
+@given('the import jobs for {first} and {second} were created twice before paths were unique')
+def step_impl(context, first, second):
+    with get_db().engine.begin() as connection:
+        connection.execute(text('DROP INDEX import_job_location_path'))
+        connection.execute(text('CREATE INDEX import_job_location_path ON import_job (location_id, path)'))
+        connection.execute(text(
+            'INSERT INTO import_job (create_ts, path, state, user_id, location_id)'
+            ' SELECT create_ts, path, state, user_id, location_id FROM import_job'
+            ' WHERE path IN (:first, :second)'), {'first': first, 'second': second})
+
+@when('the database is upgraded')
+def step_impl(context):
+    get_db().upgrade_all()
+
+@then('an import job for {path} should not be created twice')
+def step_impl(context, path):
+    row = import_job_row(ImportJobDescriptor(
+        path=path, location=get_location_by_name('drop_folder'), user_id=1))
+    def insert():
+        with get_db().engine.begin() as connection:
+            connection.execute(ImportJob.__table__.insert(), row)
+    assert_that(calling(insert), raises(IntegrityError))
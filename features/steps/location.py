@@ -1,9 +1,11 @@
-import logging
+import logging, threading
 from behave import *
 from hamcrest import *
 
 from images import Location, Entry
-from images.location import LocationDescriptor, create_location, get_locations_by_type
+from images.database import get_db
+from images.location import LocationDescriptor, create_location, get_locations_by_type, \
+    get_location_by_name, update_location_by_id, delete_location_by_id
 
 
 @given('a specific set of locations')
@@ -19,6 +21,58 @@ def step_impl(context):
         ld.metadata = md
         create_location(ld)
 
+@when(u'the location named "{name}" is looked up twice')
+def step_impl(context, name):
+    context.lookups = [get_location_by_name(name), get_location_by_name(name)]
+
+@when(u'the location named "{name}" is moved to "{folder}"')
+def step_impl(context, name, folder):
+    location = get_location_by_name(name)
+    md = Location.DefaultLocationMetadata(location.metadata.to_dict())
+    md.folder = folder
+    update_location_by_id(location.id, LocationDescriptor(name=name, type=location.type, metadata=md))
+
+@given(u'the location named "{name}" is moved to "{folder}" but not yet committed')
+def step_impl(context, name, folder):
+    location_id = get_location_by_name(name).id
+    transaction = get_db().transaction()  # left open until committed
+    t = transaction.__enter__()
+    location = t.query(Location).filter(Location.id == location_id).one()
+    md = Location.DefaultLocationMetadata(LocationDescriptor.map_in(location).metadata.to_dict())
+    md.folder = folder
+    location.data = md.to_json()
+    t.flush()
+    context.transaction = transaction
+    def tear_down(context):
+        if getattr(context, 'transaction', None) is not None:
+            transaction.__exit__(RuntimeError, RuntimeError("not committed"), None)
+    context.tear_down_scenario.insert(0, tear_down)
+
+@when(u'the location named "{name}" is looked up from another thread')
+def step_impl(context, name):
+    # Another thread, as this one would read through the open transaction
+    thread = threading.Thread(target=get_location_by_name, args=(name,))
+    thread.start()
+    thread.join()
+
+@when(u'the move is committed')
+def step_impl(context):
+    transaction, context.transaction = context.transaction, None
+    transaction.__exit__(None, None, None)
+
+@when(u'the location named "{name}" is deleted')
+def step_impl(context, name):
+    delete_location_by_id(get_location_by_name(name).id)
+
+@then(u'both lookups should give the same location')
+def step_impl(context):
+    assert_that(context.lookups[1], same_instance(context.lookups[0]))
+
+@then(u'there should be no "{type}" location named "{name}"')
+def step_impl(context, type, name):
+    lds = get_locations_by_type(getattr(Location.Type, type))
+    assert_that(name, is_not(is_in([ld.name for ld in lds.entries])))
+
 @then(u'there should be a "{type}" location named "{name}"')
 def step_impl(context, type, name):
     lds = get_locations_by_type(getattr(Location.Type, type))
@@ -0,0 +1,156 @@
+import os, re, shutil
+from urllib.parse import urlsplit
+from behave import *
+from hamcrest import *
+from bottle import request
+from sqlalchemy import event
+
+from images import User
+from images.database import init, get_db
+from images.user import UserDescriptor
+from images.entry import EntryQuery, get_entries, get_entry_by_source, invalidate_entry_counts
+from images.delete import pick_up_deletion
+
+
+PLANS_PATH = '/tmp/images_plans'
+SQL_PATH = 'sqlite:///%s/images.db' % PLANS_PATH
+
+_built = None  # number of entries in the synthetic database
+
+# Tables that grow with the library, and may never be scanned
+LARGE_TABLES = ('entry', 'entry_tag')
+
+
+def build(count):
+    """
+    Fill a fresh database with `count` entries spread over 20 sources, 5
+    users and 100 tags. Every 50th entry is hidden and every 1000th is
+    marked for deletion.
+    """
+    shutil.rmtree(PLANS_PATH, ignore_errors=True)
+    os.mkdir(PLANS_PATH)
+    db = init(SQL_PATH)
+    db.create_all()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %i)
+            INSERT INTO entry (id, original_filename, source, type, state, hidden,
+                               delete_ts, access, create_ts, update_ts, taken_ts,
+                               user_id, tags)
+            SELECT i, 'IMG_' || i || '.jpg', 'src' || (i %% 20),
+                   CASE WHEN i %% 10 = 0 THEN 1 ELSE 0 END, 0, i %% 50 = 0,
+                   CASE WHEN i %% 1000 = 0 THEN datetime('2001-01-01', '+' || i || ' seconds') END,
+                   i %% 4,
+                   datetime('2000-01-01', '+' || (i * 60) || ' seconds'),
+                   datetime('2000-01-01', '+' || (i * 60) || ' seconds'),
+                   datetime('2000-01-01', '+' || (i * 300 %% 99999999) || ' seconds'),
+                   1 + i %% 5, '~tag' || (i %% 100) || '~'
+              FROM n
+        """ % count)
+        connection.exec_driver_sql("""
+            INSERT INTO entry_tag (entry_id, tag_id) SELECT id, 'tag' || (id % 100) FROM entry
+        """)
+
+
+def capture(context):
+    context.statements = []
+    def before_cursor_execute(connection, cursor, statement, parameters, context_, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            context.statements.append((statement, parameters))
+    for engine in {get_db().engine, get_db().reader}:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        context.tear_down_scenario.append(
+            lambda context, engine=engine: event.remove(engine, 'before_cursor_execute', before_cursor_execute))
+
+
+def follow(context, link):
+    request.bind({'REQUEST_METHOD': 'GET', 'QUERY_STRING': urlsplit(link).query})
+    user = context.user
+    request.user = user
+    context.statements[:] = []
+    return get_entries(EntryQuery.map_in_from_request())
+
+
+def plans(context):
+    """
+    EXPLAIN QUERY PLAN details of every captured statement.
+    """
+    engine = get_db().reader
+    result = []
+    with engine.connect() as connection:
+        for statement, parameters in context.statements:
+            rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            result.append((statement, [row[-1] for row in rows]))
+    return result
+
+
+@given('a synthetic database with {count:d} entries')
+def step_impl(context, count):
+    global _built
+    if _built != count:
+        build(count)
+        _built = count
+    init(SQL_PATH)
+    invalidate_entry_counts()
+    capture(context)
+
+@given('a logged in normal user')
+def step_impl(context):
+    context.user = UserDescriptor(id=1, name='user', user_class=User.Class.normal)
+    request.user = context.user
+
+    def tear_down(context):
+        request.user = None
+
+    context.tear_down_scenario.append(tear_down)
+
+
+@when('the first page of entries is listed')
+def step_impl(context):
+    context.page = get_entries(EntryQuery())
+
+@when('the next page of entries is listed')
+def step_impl(context):
+    page = get_entries(EntryQuery())
+    context.page = follow(context, page.next_link)
+
+@when('the previous page of entries is listed')
+def step_impl(context):
+    page = get_entries(EntryQuery())
+    page = follow(context, page.next_link)
+    context.page = follow(context, page.prev_link)
+
+@when('the entries with the tag "{tag_name}" but not "{exclude_name}" are listed')
+def step_impl(context, tag_name, exclude_name):
+    context.page = get_entries(EntryQuery(include_tags=[tag_name], exclude_tags=[exclude_name]))
+
+@when('an entry to delete is picked up')
+def step_impl(context):
+    assert_that(pick_up_deletion(), not_none())
+
+@when('the entry {filename} from the source {source} is looked up')
+def step_impl(context, filename, source):
+    get_entry_by_source(source, filename, system=True)
+
+
+@then('no query should scan a whole table')
+def step_impl(context):
+    for statement, details in plans(context):
+        for detail in details:
+            # Also a SCAN of an index walks all rows, only a SEARCH seeks.
+            # Aliases like entry_1 are shown instead of the table name.
+            assert_that(detail, is_not(matches_regexp(
+                r'^SCAN (TABLE )?(%s)(_\d+)?\b' % '|'.join(LARGE_TABLES))), statement)
+
+@then('no query should sort in a temporary b-tree')
+def step_impl(context):
+    for statement, details in plans(context):
+        for detail in details:
+            assert_that(detail, is_not(contains_string('TEMP B-TREE')), statement)
+
+@then('the page should be found by seeking on taken_ts')
+def step_impl(context):
+    pages = [details for statement, details in plans(context) if 'LIMIT' in statement]
+    assert_that(pages, is_not(empty()))
+    for details in pages:
+        assert_that(' '.join(details), matches_regexp(r'taken_ts[<>]\?'))
@@ -0,0 +1,103 @@
+import os, re
+from behave import *
+from hamcrest import *
+
+from images import scanner
+from images.location import get_location_by_name
+from images.scanner import IncrementalScanner, FolderWatcher, create_scanned_import_jobs
+
+
+def split_names(names):
+    return [name for name in re.split(r',\s*|\s+and\s+', names) if name]
+
+
+def write_files(names, data=b'image', replace=False):
+    location = get_location_by_name('drop_folder')
+    for name in split_names(names):
+        path = os.path.join(location.metadata.folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # replacements are written next to the folder and moved in
+        temp = os.path.join(os.path.dirname(location.metadata.folder), 'replace.tmp')
+        with open(temp if replace else path, 'wb') as f:
+            f.write(data)
+        if replace:
+            os.rename(temp, path)
+
+
+def scan(context, new_scanner=False, full=False):
+    location = get_location_by_name('drop_folder')
+    if new_scanner or getattr(context, 'scanner', None) is None:
+        context.scanner = IncrementalScanner(location.metadata.folder, location.id)
+    context.found = [
+        path for batch in context.scanner.scan_batches(100, full=full) for path in batch
+    ]
+
+
+@given('the files {names} in the drop_folder')
+def step_impl(context, names):
+    write_files(names)
+    context.scanner = None
+
+@when('the files {names} are added to the drop_folder')
+def step_impl(context, names):
+    write_files(names)
+
+@when('the file {name} is added to the drop_folder')
+def step_impl(context, name):
+    write_files(name)
+
+@when('the file {name} is replaced in the drop_folder')
+def step_impl(context, name):
+    write_files(name, data=b'replaced image', replace=True)
+
+@when('the file {name} is rewritten in the drop_folder')
+def step_impl(context, name):
+    write_files(name, data=b'rewritten image')
+
+@when('the drop_folder is scanned')
+def step_impl(context):
+    scan(context)
+
+@when('the drop_folder is scanned again')
+def step_impl(context):
+    scan(context)
+
+@when('the drop_folder is fully scanned')
+def step_impl(context):
+    scan(context, full=True)
+
+@when('the drop_folder is scanned by a new scanner')
+def step_impl(context):
+    scan(context, new_scanner=True)
+
+@when('the import jobs of a scan of the drop_folder fail to be created')
+def step_impl(context):
+    location = get_location_by_name('drop_folder')
+    context.scanner = IncrementalScanner(location.metadata.folder, location.id)
+    def create_import_jobs(jds):
+        raise RuntimeError("database is locked")
+    scanner.create_import_jobs, original = create_import_jobs, scanner.create_import_jobs
+    try:
+        assert_that(calling(create_scanned_import_jobs).with_args(location, context.scanner),
+                    raises(RuntimeError))
+    finally:
+        scanner.create_import_jobs = original
+
+@when('the drop_folder is watched')
+def step_impl(context):
+    location = get_location_by_name('drop_folder')
+    context.watcher = FolderWatcher(location.metadata.folder)
+    context.tear_down_scenario.append(lambda context: context.watcher.close())
+
+@then('the watch should find {names}')
+def step_impl(context, names):
+    found = list(context.watcher.watch(timeout=0.2))
+    assert_that(found, contains_inanyorder(*split_names(names)))
+
+@then('the scan should find nothing')
+def step_impl(context):
+    assert_that(context.found, empty())
+
+@then('the scan should find {names}')
+def step_impl(context, names):
+    assert_that(context.found, contains_inanyorder(*split_names(names)))
@@ -0,0 +1,85 @@
+import os, json, base64
+from wsgiref.util import setup_testing_defaults
+from behave import *
+from hamcrest import *
+
+from images import Location
+from images.entry import app, EntryDescriptor, FileDescriptor, create_entry, set_entry_files
+from images.localfile import file_version
+from images.location import get_location_by_type
+
+
+def write_thumbnail(context, entry_id, path):
+    location = get_location_by_type(Location.Type.thumb)
+    os.makedirs(location.metadata.folder, exist_ok=True)
+    data = os.urandom(500 + entry_id)
+    filename = os.path.join(location.metadata.folder, path)
+    with open(filename, 'wb') as f:
+        f.write(data)
+    context.thumbnails[entry_id] = data
+    return FileDescriptor(
+        path=path,
+        location_id=location.id,
+        purpose=FileDescriptor.Purpose.thumb,
+        mime='image/jpeg',
+        version=file_version(filename),
+    )
+
+
+def get_sprite(context, credentials, page_size, **environ):
+    environ.update({
+        'PATH_INFO': '/sprite',
+        'QUERY_STRING': 'page_size=%i' % page_size,
+        'HTTP_AUTHORIZATION': 'Basic ' + base64.b64encode(credentials.encode()).decode(),
+    })
+    setup_testing_defaults(environ)
+    response = {}
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+        response['headers'] = {name.lower(): value for name, value in headers}
+    body = app(environ, start_response)
+    try:
+        response['body'] = b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    context.response = response
+
+
+@given('{count:d} entries with thumbnails')
+def step_impl(context, count):
+    context.thumbnails = {}
+    context.entry_ids = []
+    for n in range(count):
+        ed = create_entry(EntryDescriptor(
+            original_filename='sprite%i.jpg' % n,
+            source='test',
+            taken_ts='2020-01-%02i 12:00:00' % (n + 1),
+        ), system=True)
+        set_entry_files(ed.id, [write_thumbnail(context, ed.id, 'sprite%i.jpg' % ed.id)])
+        context.entry_ids.append(ed.id)
+
+@when('the user {credentials} gets the sprite of the entries {page_size:d} at a time')
+def step_impl(context, credentials, page_size):
+    get_sprite(context, credentials, page_size)
+
+@when('the user {credentials} gets the sprite of the entries {page_size:d} at a time again')
+def step_impl(context, credentials, page_size):
+    get_sprite(context, credentials, page_size,
+               HTTP_IF_NONE_MATCH=context.response['headers']['etag'])
+
+@when('the thumbnail of the newest entry is rendered again')
+def step_impl(context):
+    entry_id = context.entry_ids[-1]
+    # At the same path and size, likely within the resolution of file times
+    set_entry_files(entry_id, [write_thumbnail(context, entry_id, 'sprite%i.jpg' % entry_id)])
+
+@then('the sprite should have the thumbnails of {count:d} entries, newest first')
+def step_impl(context, count):
+    line, _, data = context.response['body'].partition(b'\n')
+    index = json.loads(line.decode('utf8'))['entries']
+    assert_that([thumb['id'] for thumb in index],
+                equal_to(context.entry_ids[::-1][:count]))
+    for thumb in index:
+        assert_that(data[thumb['offset']:thumb['offset'] + thumb['length']],
+                    equal_to(context.thumbnails[thumb['id']]))
@@ -3,7 +3,9 @@ from behave import *
 from hamcrest import *
 
 from images.tag import TagDescriptor, add_tag, ensure_tag, get_tag_by_id
-from images.entry import EntryQuery, get_entries, update_entry_by_id, get_entry_by_source
+from images import EntryTag
+from images.database import get_db
+from images.entry import EntryQuery, get_entries, update_entry_by_id, get_entry_by_source, backfill_entry_tags
 
 @given('a tag name "{tag_name}"')
 def step_impl(context, tag_name):
@@ -53,6 +55,17 @@ def step_impl(context, tag_name, entry_name):
     ed.tags.append(tag_name)
     update_entry_by_id(ed.id, ed, system=True)
 
+@given('the tag index of the entry {entry_name} is lost')
+def step_impl(context, entry_name):
+    ed = get_entry_by_source('test', entry_name, system=True)
+    with get_db().transaction() as t:
+        t.query(EntryTag).filter(EntryTag.entry_id == ed.id).delete()
+        t.commit()
+
+@when('the tag index is backfilled')
+def step_impl(context):
+    backfill_entry_tags()
+
 @when('the tag "{tag_name}" is removed from the entry {entry_name}')
 def step_impl(context, tag_name, entry_name):
     ed = get_entry_by_source('test', entry_name, system=True)
@@ -70,6 +83,13 @@ def step_impl(context, entry_name, tag_name):
     ed = get_entry_by_source('test', entry_name, system=True)
     assert_that(tag_name, not_(is_in(ed.tags)))
 
+@then('a search for the tag "{tag_name}" but not "{exclude_name}" should give {hits} hit')
+@then('a search for the tag "{tag_name}" but not "{exclude_name}" should give {hits} hits')
+def step_impl(context, tag_name, exclude_name, hits):
+    q = EntryQuery(include_tags=[tag_name], exclude_tags=[exclude_name])
+    result = get_entries(q, system=True)
+    assert_that(result.total_count, equal_to(int(hits)))
+
 @then('a search for the tag "{tag_name}" should give {hits} hit')
 @then('a search for the tag "{tag_name}" should give {hits} hits')
 def step_impl(context, tag_name, hits):
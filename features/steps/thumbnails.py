@@ -0,0 +1,127 @@
+import io, os, struct
+from behave import *
+from hamcrest import *
+from PIL import Image
+
+from images import Location, ImportJob
+from images.ingest import image  # registers the JPEG import module
+from images.entry import FileDescriptor, create_entry, get_entry_by_id, set_entry_files
+from images.import_job import ImportJobDescriptor, get_import_module, create_import_job, \
+    claim_import_jobs, get_import_job_by_id, run_import_job
+from images.location import LocationDescriptor, get_location_by_id, get_location_by_name, \
+    update_location_by_id
+
+
+# The original is blue and the embedded thumbnail red, to tell them apart
+ORIGINAL_COLOR = (0, 0, 255)
+EMBEDDED_COLOR = (255, 0, 0)
+
+
+def jpeg(color, size, exif=b''):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'JPEG', exif=exif)
+    return out.getvalue()
+
+
+def exif_with_thumbnail(thumbnail):
+    """
+    EXIF with an empty IFD0 and an IFD1 pointing at `thumbnail`, which
+    follows the IFDs.
+    """
+    ifd0 = struct.pack('>HI', 0, 14)
+    ifd1 = (struct.pack('>H', 2)
+            + struct.pack('>HHII', 0x0201, 4, 1, 44)  # JPEGInterchangeFormat
+            + struct.pack('>HHII', 0x0202, 4, 1, len(thumbnail))  # JPEGInterchangeFormatLength
+            + struct.pack('>I', 0))
+    return b'Exif\x00\x00MM\x00\x2a' + struct.pack('>I', 8) + ifd0 + ifd1 + thumbnail
+
+
+def thumbnail_of(ed, purpose):
+    for fd in ed.files:
+        if fd.purpose == purpose:
+            return os.path.join(get_location_by_id(fd.location_id).get_root(), fd.path)
+
+
+@given('fast thumbnails on the location {location_name}')
+def step_impl(context, location_name):
+    # A copy, the descriptors of the location registry are shared
+    location = LocationDescriptor.FromJSON(get_location_by_name(location_name).to_json())
+    location.metadata.fast_thumbnail = True
+    update_location_by_id(location.id, location)
+
+@given('a photo "{name}" with a {width:d}x{height:d} embedded thumbnail on the location {location_name}')
+def step_impl(context, name, width, height, location_name):
+    location = get_location_by_name(location_name)
+    os.makedirs(location.get_root(), exist_ok=True)
+    with open(os.path.join(location.get_root(), name), 'wb') as f:
+        f.write(jpeg(ORIGINAL_COLOR, (1600, 1200),
+                     exif=exif_with_thumbnail(jpeg(EMBEDDED_COLOR, (width, height)))))
+    context.jd = create_import_job(ImportJobDescriptor(
+        path=name,
+        location=location,
+        user_id=1,
+    ))
+
+@when('the photo is imported up to creating its entry')
+def step_impl(context):
+    jd, = claim_import_jobs(context.jd.location.id, limit=1)
+    jd.analyse()
+    context.import_module = get_import_module(jd)
+    context.import_module.run()
+    context.entry = create_entry(context.import_module.entry, system=True)
+
+@when('the import of the photo is completed')
+def step_impl(context):
+    context.import_module.complete(context.entry.id)
+    context.previous_entry = context.entry
+    context.entry = get_entry_by_id(context.entry.id)
+
+@when('the thumbnail of the entry is replaced by one with the same file time')
+def step_impl(context):
+    fd, = [fd for fd in context.entry.files if fd.purpose == FileDescriptor.Purpose.thumb]
+    context.previous_entry = context.entry
+    context.entry = set_entry_files(context.entry.id, [FileDescriptor.FromJSON(fd.to_json())])
+
+@when('the import job of the photo is run')
+def step_impl(context):
+    jd, = claim_import_jobs(context.jd.location.id, limit=1)
+    assert run_import_job(jd, jd.location.metadata)
+    context.jd = get_import_job_by_id(jd.id)
+    context.entry = get_entry_by_id(context.jd.entry_id)
+
+@then('the import job should be done')
+def step_impl(context):
+    assert_that(context.jd.state, equal_to(ImportJob.State.done))
+
+@then('the entry should have a {width:d}x{height:d} thumbnail from the {source}')
+def step_impl(context, width, height, source):
+    with Image.open(thumbnail_of(context.entry, FileDescriptor.Purpose.thumb)) as im:
+        assert_that(im.size, equal_to((width, height)))
+        color = im.convert('RGB').getpixel((width // 2, height // 2))
+    expected = EMBEDDED_COLOR if source == 'embedded thumbnail' else ORIGINAL_COLOR
+    for value, wanted in zip(color, expected):
+        assert_that(value, close_to(wanted, 16))
+
+@then('the entry should have no proxy')
+def step_impl(context):
+    assert_that(thumbnail_of(context.entry, FileDescriptor.Purpose.proxy), is_(None))
+
+@then('the entry should have a proxy')
+def step_impl(context):
+    assert os.path.exists(thumbnail_of(context.entry, FileDescriptor.Purpose.proxy))
+
+@then('the thumb url of the entry should have changed')
+def step_impl(context):
+    assert_that(context.entry.thumb_url, is_not(equal_to(context.previous_entry.thumb_url)))
+
+@then('the thumb url of the entry should not have changed')
+def step_impl(context):
+    assert_that(context.entry.thumb_url, equal_to(context.previous_entry.thumb_url))
+
+@then('the thumbnail of the entry should have a newer version')
+def step_impl(context):
+    version, previous_version = (
+        [fd.version for fd in ed.files if fd.purpose == FileDescriptor.Purpose.thumb][0]
+        for ed in (context.entry, context.previous_entry)
+    )
+    assert_that(version, greater_than(previous_version))
@@ -1,8 +1,12 @@
 from behave import *
 from hamcrest import *
 
+import threading
+
 from bottle import request
-from images.user import authenticate, current_is_user, current_is_admin, current_is_guest
+from images import User
+from images.database import get_db, password_hash
+from images.user import authenticate, current_is_user, current_is_admin, current_is_guest, get_credential_cache_stats
 
 @given('the username is "{user}"')
 def step_impl(context, user):
@@ -25,6 +29,52 @@ def step_impl(context, username, password):
 def step_impl(context):
     context.logged_in = authenticate(context.user, context.password)
 
+@when('the user tries to log in twice')
+def step_impl(context):
+    authenticate(context.user, context.password)
+    context.stats = get_credential_cache_stats()
+    context.logged_in = authenticate(context.user, context.password)
+
+@when('the password of {username} is changed to "{password}"')
+def step_impl(context, username, password):
+    with get_db().transaction() as t:
+        t.query(User).filter(User.name == username).one().password = password_hash(password)
+
+@given('the password of {username} is changed to "{password}" but not yet committed')
+def step_impl(context, username, password):
+    transaction = get_db().transaction()  # left open until committed
+    t = transaction.__enter__()
+    t.query(User).filter(User.name == username).one().password = password_hash(password)
+    t.flush()
+    context.transaction = transaction
+    def tear_down(context):
+        if getattr(context, 'transaction', None) is not None:
+            transaction.__exit__(RuntimeError, RuntimeError("not committed"), None)
+    context.tear_down_scenario.insert(0, tear_down)
+
+@when('another request logs in as {username}:{password}')
+def step_impl(context, username, password):
+    # Another thread, as this one would read through the open transaction
+    thread = threading.Thread(target=authenticate, args=(username, password))
+    thread.start()
+    thread.join()
+
+@when('the change is committed')
+def step_impl(context):
+    transaction, context.transaction = context.transaction, None
+    transaction.__exit__(None, None, None)
+
+@when('the user {username} is disabled')
+def step_impl(context, username):
+    with get_db().transaction() as t:
+        t.query(User).filter(User.name == username).one().status = User.Status.disabled
+
+@then('the second login should be a credential cache hit')
+def step_impl(context):
+    stats = get_credential_cache_stats()
+    assert_that(stats['hits'], equal_to(context.stats['hits'] + 1))
+    assert_that(stats['misses'], equal_to(context.stats['misses']))
+
 @then('the login should {result}')
 def step_impl(context, result):
     if result == 'succeed':
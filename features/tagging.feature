@@ -79,3 +79,19 @@ Feature: Tagging
        And the entry e should have the tag "good tag"
        And a search for the tag "good tag" should give 1 hit
        And a search for the tag "bad tag" should give 0 hits
+
+  Scenario: Excluding a tag from a search
+     Given an entry called e1
+       And an entry called e2
+       And the entry e1 has the tag "Common"
+       And the entry e2 has the tag "common"
+       And the entry e2 has the tag "rare"
+      Then a search for the tag "common" should give 2 hits
+       And a search for the tag "common" but not "Rare" should give 1 hit
+
+  Scenario: Backfilling tags of entries from before the tag index
+     Given an entry called e
+       And the entry e has the tag "old tag"
+       And the tag index of the entry e is lost
+      When the tag index is backfilled
+      Then a search for the tag "old tag" should give 1 hit
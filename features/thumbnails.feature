@@ -0,0 +1,54 @@
+Feature: Thumbnails
+
+  With fast thumbnails, an imported photo gets its entry as soon as its
+  thumbnail is made from the embedded EXIF thumbnail. The proxy is added
+  when it has been rendered, along with a thumbnail from the original if
+  the embedded one was too small.
+
+  Background:
+     Given a system specified by "default.ini"
+
+  Scenario: Importing a photo with a small embedded thumbnail
+     Given fast thumbnails on the location drop_folder
+       And a photo "photo.jpg" with a 160x120 embedded thumbnail on the location drop_folder
+      When the photo is imported up to creating its entry
+      Then the entry should have a 120x120 thumbnail from the embedded thumbnail
+       And the entry should have no proxy
+      When the import of the photo is completed
+      Then the entry should have a 200x200 thumbnail from the original
+       And the entry should have a proxy
+       And the thumb url of the entry should have changed
+       And the thumbnail of the entry should have a newer version
+
+  Scenario: Importing a photo with a large embedded thumbnail
+     Given fast thumbnails on the location drop_folder
+       And a photo "photo.jpg" with a 320x240 embedded thumbnail on the location drop_folder
+      When the photo is imported up to creating its entry
+      Then the entry should have a 200x200 thumbnail from the embedded thumbnail
+       And the entry should have no proxy
+      When the import of the photo is completed
+      Then the entry should have a 200x200 thumbnail from the embedded thumbnail
+       And the entry should have a proxy
+       And the thumb url of the entry should not have changed
+
+  Scenario: Replacing a thumbnail within the resolution of file times
+     Given fast thumbnails on the location drop_folder
+       And a photo "photo.jpg" with a 160x120 embedded thumbnail on the location drop_folder
+      When the photo is imported up to creating its entry
+       And the thumbnail of the entry is replaced by one with the same file time
+      Then the thumbnail of the entry should have a newer version
+       And the thumb url of the entry should have changed
+
+  Scenario: Importing a photo without fast thumbnails
+     Given a photo "photo.jpg" with a 160x120 embedded thumbnail on the location drop_folder
+      When the photo is imported up to creating its entry
+      Then the entry should have a 200x200 thumbnail from the original
+       And the entry should have a proxy
+
+  Scenario: Running an import job with fast thumbnails
+     Given fast thumbnails on the location drop_folder
+       And a photo "photo.jpg" with a 160x120 embedded thumbnail on the location drop_folder
+      When the import job of the photo is run
+      Then the import job should be done
+       And the entry should have a 200x200 thumbnail from the original
+       And the entry should have a proxy
@@ -50,3 +50,31 @@ Feature: User accounts
 
   Scenario: No-one has logged in
       Then there should not be a session
+
+  Scenario: A user logging in again is not looked up again
+     Given the username is "user"
+       And the password is "user"
+      When the user tries to log in twice
+      Then the login should succeed
+       And the second login should be a credential cache hit
+
+  Scenario: A user whose password has changed authenticates
+     Given the user logged in as user:user
+      When the password of user is changed to "changed"
+      Then the user logged in as user:user
+       And the login should fail
+      Then the user logged in as user:changed
+       And the login should succeed
+
+  Scenario: A user who has been disabled authenticates
+     Given the user logged in as user:user
+      When the user user is disabled
+      Then the user logged in as user:user
+       And the login should fail
+
+  Scenario: A user logging in while the password is being changed authenticates
+     Given the password of user is changed to "changed" but not yet committed
+      When another request logs in as user:user
+       And the change is committed
+      Then the user logged in as user:user
+       And the login should fail
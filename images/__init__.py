@@ -1,7 +1,7 @@
 
 from enum import IntEnum
 
-from sqlalchemy import Column, DateTime, String, Integer, Boolean, Float, ForeignKey, func
+from sqlalchemy import Column, DateTime, String, Integer, Boolean, Float, ForeignKey, Index, func
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -45,6 +45,8 @@ class Location(Base):
         tags = Property(list)
         read_only = Property(bool)
         wants = Property(list)  # FileDescriptor.Purpose
+        fast_thumbnail = Property(bool, default=False)  # Use embedded EXIF thumbnail
+        watch = Property(bool, default=False)  # Watch scannable folder with inotify
 
     id = Column(Integer, primary_key=True)
     type = Column(Integer, nullable=False)
@@ -121,6 +123,12 @@ class ImportJob(Base):
     user_id = Column(Integer, ForeignKey('user.id'), nullable=False)
     location_id = Column(Integer, ForeignKey('location.id'), nullable=False)
     entry_id = Column(Integer, ForeignKey('entry.id'))
+    lease_owner = Column(String(128))  # worker that claimed the job
+    lease_expire_ts = Column(DateTime(timezone=True))  # claimable again after this
+
+    __table_args__ = (
+        Index('import_job_location_path', 'location_id', 'path', unique=True),
+    )
 
     user = relationship(User)
     location = relationship(Location)
@@ -211,6 +219,32 @@ class Entry(Base):
 
     user = relationship(User)
     parent_entry = relationship('Entry')
+    entry_tags = relationship('EntryTag', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # Browsing: visible entries newest first, and all entries newest first
+        Index('entry_browse', 'hidden', 'delete_ts', 'taken_ts', 'create_ts', 'id'),
+        Index('entry_taken', 'taken_ts', 'create_ts', 'id'),
+        # Deletion pick up
+        Index('entry_delete', 'delete_ts'),
+        # Lookup by source
+        Index('entry_source', 'source', 'original_filename'),
+    )
+
+
+class EntryTag(Base):
+    """
+    One row per tag of an entry, kept in sync with Entry.tags so that tag
+    filters can use an index.
+    """
+    __tablename__ = 'entry_tag'
+
+    entry_id = Column(Integer, ForeignKey('entry.id'), primary_key=True)
+    tag_id = Column(String(128), primary_key=True)  # lower case, as in Entry.tags
+
+    __table_args__ = (
+        Index('entry_tag_tag', 'tag_id', 'entry_id'),
+    )
 
 
 class Tag(Base):
@@ -220,6 +254,17 @@ class Tag(Base):
     color = Column(Integer, default=0)
 
 
+class ScanState(Base):
+    __tablename__ = 'scan_state'
+
+    location_id = Column(Integer, ForeignKey('location.id'), primary_key=True)
+    path = Column(String(256), primary_key=True)  # relative to the location, '' for the root
+    is_dir = Column(Boolean, nullable=False, default=False)
+    size = Column(Integer)
+    mtime = Column(Float)
+    inode = Column(Integer)
+
+
 class RemoteCopy(Base):
     __tablename__ = 'remote_copy'
 
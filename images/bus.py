@@ -0,0 +1,37 @@
+"""In-process publish/subscribe of events between threads"""
+
+import logging
+from threading import Lock
+
+
+_subscribers = {}
+_lock = Lock()
+
+
+def subscribe(topic, callback):
+    """
+    Call `callback` with the arguments of every event published on `topic`.
+    """
+    with _lock:
+        _subscribers.setdefault(topic, []).append(callback)
+
+
+def unsubscribe(topic, callback):
+    with _lock:
+        callbacks = _subscribers.get(topic, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+
+def publish(topic, *args):
+    """
+    Call all subscribers of `topic` in the publishing thread. Subscribers
+    should be quick; a failing subscriber is logged and skipped.
+    """
+    with _lock:
+        callbacks = list(_subscribers.get(topic, []))
+    for callback in callbacks:
+        try:
+            callback(*args)
+        except Exception as e:
+            logging.error("Subscriber %s of %s failed (%s)", callback, topic, str(e))
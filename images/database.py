@@ -1,55 +1,249 @@
 #!/usr/bin/env python3
 
-import os, logging, threading
-from sqlalchemy import create_engine
+import os, time, logging, threading
+from sqlalchemy import create_engine, event, func, inspect, select, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.schema import CreateTable
 import hashlib
 
 FILENAME = 'images.db'
 
-module_local = threading.local()
-module_local.engine = None
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),  # readers and the writer don't block each other
+    ('synchronous', 'NORMAL'),  # safe with WAL, syncs on checkpoint only
+    ('busy_timeout', 10000),  # ms to wait for a lock before "database is locked"
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -16 * 1024),  # KiB per connection
+)
+
+# Applied to every new SQLite connection of the reader pool, instead of
+# the journal_mode, which only the writer may change
+SQLITE_READER_PRAGMAS = tuple(
+    pragma for pragma in SQLITE_PRAGMAS if pragma[0] != 'journal_mode'
+) + (
+    ('query_only', 'ON'),
+)
+
+# Connections kept open, and opened on top of those under load
+POOL_SIZE = 8
+POOL_OVERFLOW = 16
+READER_POOL_SIZE = 8
+READER_POOL_OVERFLOW = 32
+
+_database = None
+_database_lock = threading.Lock()
 
 
 Base = declarative_base()
 
 
+def _sqlite_pragmas(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute('PRAGMA %s = %s' % (name, value))
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+class LockWaits(object):
+    """
+    Time spent by sessions waiting on locks: for a connection from the
+    pool as they start ('connect'), in every statement on a write
+    connection, where SQLite waits for the write lock as a transaction
+    first writes ('execute'), and in every commit of a write session,
+    flush included ('commit'). The latter two include the work itself, so
+    they are upper bounds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waits = {}  # kind -> [count, total seconds, max seconds]
+
+    def record(self, kind, seconds):
+        with self.lock:
+            wait = self.waits.setdefault(kind, [0, 0.0, 0.0])
+            wait[0] += 1
+            wait[1] += seconds
+            wait[2] = max(wait[2], seconds)
+
+    def get(self):
+        with self.lock:
+            return {
+                kind: {
+                    'count': count,
+                    'total': total,
+                    'mean': total / count,
+                    'max': max_,
+                }
+                for kind, (count, total, max_) in self.waits.items()
+            }
+
+
 class Database(object):
-    local = threading.local()
-    sql_path = None
-    
-    def __init__(self, sql_path=None):
-        Database.sql_path = sql_path or Database.sql_path
-        assert Database.sql_path, "SQL Path must be given at some point"
-        logging.debug("Creating new Database Engine at %s.", Database.sql_path)
-        self.local.in_transaction = False
-        self.local.engine = create_engine(Database.sql_path)
-        self.local.session_maker = sessionmaker()
-        self.local.session_maker.configure(bind=self.local.engine)
+    """
+    The process-wide engine and connection pool, with a session per thread.
+    """
+    def __init__(self, sql_path):
+        self.sql_path = sql_path
+        self.pid = os.getpid()
+        self.local = threading.local()
+        url = make_url(sql_path)
+        logging.debug("Creating new Database Engine at %s.", sql_path)
+        if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+            self.engine = create_engine(
+                sql_path,
+                poolclass=QueuePool,
+                pool_size=POOL_SIZE,
+                max_overflow=POOL_OVERFLOW,
+                connect_args={'check_same_thread': False},
+            )
+            event.listen(self.engine, 'connect', _sqlite_pragmas(SQLITE_PRAGMAS))
+            self.reader = create_engine(
+                sql_path,
+                poolclass=QueuePool,
+                pool_size=READER_POOL_SIZE,
+                max_overflow=READER_POOL_OVERFLOW,
+                connect_args={'check_same_thread': False},
+            )
+            event.listen(self.reader, 'connect', _sqlite_pragmas(SQLITE_READER_PRAGMAS))
+        elif url.get_backend_name() == 'sqlite':
+            self.engine = self.reader = create_engine(sql_path)  # one database per connection
+        else:
+            self.engine = create_engine(sql_path, pool_pre_ping=True)
+            self.reader = create_engine(sql_path, pool_pre_ping=True)
+        self.session_maker = sessionmaker(bind=self.engine)
+        self.read_session_maker = sessionmaker(bind=self.reader, autoflush=False)
+        self.lock_waits = LockWaits()
+        self.time_lock_waits()
+
+    def time_lock_waits(self):
+        """
+        Record the statements and commits of writers in lock_waits, also
+        those inside the body of a transaction.
+        """
+        record = self.lock_waits.record
+
+        def before_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info['execute_start'] = time.perf_counter()
+
+        def after_execute(conn, cursor, statement, parameters, context, executemany):
+            record('execute', time.perf_counter() - conn.info.pop('execute_start'))
+
+        def before_commit(session):
+            session.info['commit_start'] = time.perf_counter()
+
+        def after_commit(session):
+            start = session.info.pop('commit_start', None)
+            if start is not None:
+                record('commit', time.perf_counter() - start)
+
+        event.listen(self.engine, 'before_cursor_execute', before_execute)
+        event.listen(self.engine, 'after_cursor_execute', after_execute)
+        event.listen(self.session_maker, 'before_commit', before_commit)
+        event.listen(self.session_maker, 'after_commit', after_commit)
+
+    def dispose(self):
+        """
+        Close the pooled connections. In a forked child they are only
+        forgotten, as they belong to the parent.
+        """
+        close = self.pid == os.getpid()
+        self.engine.dispose(close=close)
+        if self.reader is not self.engine:
+            self.reader.dispose(close=close)
 
     def transaction(self):
-        return Transaction(self.local)
+        return Transaction(self)
+
+    def in_transaction(self):
+        """
+        True if this thread is inside a transaction (not a read transaction).
+        """
+        return getattr(self.local, 'session', None) is not None
+
+    def read_transaction(self):
+        """
+        Like transaction, but for reading only: the session comes from the
+        reader pool, is never committed and can't write. Inside a
+        transaction, the session of that transaction is used, so that its
+        changes are seen.
+        """
+        return Transaction(self, read=True)
 
     def create_all(self):
-        Base.metadata.create_all(self.local.engine)
+        Base.metadata.create_all(self.engine)
+
+    def upgrade_all(self):
+        """
+        Bring existing tables up to date with the models by adding missing
+        columns and indexes. Existing columns are never changed or dropped.
+        An index that has become unique is made again, after removing the
+        rows that duplicate an older one.
+        """
+        inspector = inspect(self.engine)
+        existing_tables = inspector.get_table_names()
+        with self.engine.begin() as connection:
+            quote = connection.dialect.identifier_preparer.quote
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in columns:
+                        logging.info("Adding column %s.%s", table.name, column.name)
+                        connection.execute(text('ALTER TABLE %s ADD COLUMN %s %s' % (
+                            quote(table.name),
+                            quote(column.name),
+                            column.type.compile(dialect=connection.dialect),
+                        )))
+                indexes = {index['name']: index for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    found = indexes.get(index.name)
+                    if index.unique and not (found and found['unique']):
+                        remove_duplicates(connection, table, index.columns)
+                        if found:
+                            logging.info("Making index %s unique", index.name)
+                            index.drop(connection)
+                    index.create(connection, checkfirst=True)
 
     def get_sql_for_table(self, table):
-        return CreateTable(table.__table__).compile(self.local.engine)
+        return CreateTable(table.__table__).compile(self.engine)
+
+
+def remove_duplicates(connection, table, columns):
+    """
+    Delete the rows of `table` that have the same `columns` as a row with
+    a lower primary key.
+    """
+    key, = table.primary_key.columns
+    first = select(func.min(key)).group_by(*columns)
+    result = connection.execute(table.delete().where(key.not_in(first)))
+    if result.rowcount:
+        logging.warning("Removed %i rows of %s duplicating (%s)", result.rowcount, table.name,
+                        ', '.join(column.name for column in columns))
 
 
 class Transaction(object):
-    def __init__(self, local):
-        self.local = local
-        self.inner = local.in_transaction
-        if not local.in_transaction:
-            local.in_transaction = True
-            self.session = local.session_maker()
-            local.session = self.session
-        else:
-            self.session = local.session
-        logging.debug("DB connect (%s)", 'inner' if self.inner else 'outer')
+    def __init__(self, db, read=False):
+        self.db = db
+        self.local = local = db.local
+        self.read = read and getattr(local, 'session', None) is None
+        self.attr_name = 'read_session' if self.read else 'session'
+        self.session = getattr(local, self.attr_name, None)
+        self.inner = self.session is not None
+        if not self.inner:
+            start = time.perf_counter()
+            self.session = (db.read_session_maker if self.read else db.session_maker)()
+            self.session.connection()
+            db.lock_waits.record('connect', time.perf_counter() - start)
+            setattr(local, self.attr_name, self.session)
+        logging.debug("DB connect (%s%s)", 'inner' if self.inner else 'outer', ', read' if self.read else '')
 
     def __enter__(self):
         return self.session
@@ -66,8 +260,9 @@ class Transaction(object):
         else:
             try:
                 if type is None:
-                    logging.debug("DB commit")
-                    self.session.commit()
+                    if not self.read:
+                        logging.debug("DB commit")
+                        self.session.commit()
                     return True
                 else:
                     logging.error("DB rollback (%s, %s)", str(type), str(value))
@@ -75,7 +270,7 @@ class Transaction(object):
                     return False
             finally:
                 logging.debug("DB close")
-                self.local.in_transaction = False
+                setattr(self.local, self.attr_name, None)
                 self.session.close()
 
 
@@ -85,20 +280,21 @@ def password_hash(string):
 
 def init(sql_path):
     """
-    Initialize a thread-local instance of the database.
+    Initialize the process-wide instance of the database, replacing any
+    earlier one.
     """
-    module_local.engine = Database(sql_path)
-    return module_local.engine
+    global _database
+    with _database_lock:
+        if _database is not None:
+            _database.dispose()
+        _database = Database(sql_path)
+        return _database
 
 
 def get_db():
     """
-    Get the thread-local instance of the database or create one.
-    However, init() needs to be run once.
+    Get the process-wide instance of the database. init() needs to be run
+    first.
     """
-    if hasattr(module_local, 'engine'):
-        return module_local.engine
-    else:
-        logging.debug("Creating a new Database Engine for thread %s", threading.current_thread().name)
-        module_local.engine = Database()
-        return module_local.engine
+    assert _database is not None, "The database must be initialized with init()"
+    return _database
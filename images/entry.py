@@ -1,20 +1,39 @@
 #!/usr/bin/env python3
 
 from enum import IntEnum
-import os, datetime, logging, urllib
-from bottle import Bottle, auth_basic, request
-
-from . import Entry, api
+import os, time, datetime, logging, urllib, json, hashlib, tempfile
+from collections import OrderedDict
+from threading import Lock
+from bottle import Bottle, auth_basic, request, response, HTTPError
+from sqlalchemy import String, and_, or_, type_coerce
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.exc import NoResultFound
+
+from . import Entry, EntryTag, Location, api
 from .database import get_db
 from .types import PropertySet, Property
-from .location import LocationDescriptor, get_download_url
+from .location import LocationDescriptor, get_download_url, get_location_by_id, get_location_by_type
+from .localfile import serve_file
 from .user import require_user_id, current_user_id, authenticate, no_guests, current_is_user
-from .metadata import wrap_raw_json
 from .tag import ensure_tag
 
 
 DELETE_AFTER = 24  # hours
 
+# Number of rows fetched at a time when streaming entries
+STREAM_CHUNK = 500
+
+# Cached total counts of entry queries, kept at most this many seconds as
+# entries written by other processes don't invalidate them
+COUNT_CACHE_SIZE = 256
+COUNT_CACHE_TTL = 60
+
+# Thumbnail sprites are cached in this folder of the thumb location, at
+# most this many of them, the oldest being removed first
+SPRITE_FOLDER = '.sprites'
+SPRITE_CACHE_FILES = 1000
+SPRITE_MIME = 'application/octet-stream'
+
 
 ################################################################################
 # Entry API
@@ -28,11 +47,39 @@ api.register(BASE, app)
 @auth_basic(authenticate)
 def rest_get_entries():
     query = EntryQuery.map_in_from_request()
+    try:
+        fields = query.get_fields()
+        if fields:
+            entry_columns(fields)
+    except ValueError as e:
+        return HTTPError(400, "%s. The fields are %s, and the views %s." % (
+            str(e), ', '.join(FIELDS), ', '.join(sorted(VIEWS))))
+    try:
+        for cursor in (query.after, query.before):
+            if cursor:
+                parse_cursor(cursor)
+    except ValueError as e:
+        return HTTPError(400, "%s. Use the cursors of the next and previous links." % str(e))
+    if request.query.stream == 'yes':
+        response.content_type = 'application/json'
+        return EntryDescriptorFeed().to_json_stream(iter_entries(query=query))
     json = get_entries(query=query).to_json()
     logging.debug("Entry feed\n%s", json)
     return json
 
 
+@app.get('/sprite')
+@auth_basic(authenticate)
+def rest_get_thumb_sprite():
+    query = EntryQuery.map_in_from_request()
+    try:
+        location, path = get_thumb_sprite(query)
+    except (NoResultFound, IndexError):
+        return HTTPError(404, "No thumb location.")
+    response.content_type = SPRITE_MIME
+    return serve_file(location.get_root(), path)
+
+
 @app.get('/<id:int>')
 @auth_basic(authenticate)
 def rest_get_entry_by_id(id):
@@ -86,6 +133,7 @@ class FileDescriptor(PropertySet):
     size = Property(int, default=0)
     purpose = Property(enum=Purpose, default=Purpose.primary)
     mime = Property()
+    version = Property(int)  # st_mtime_ns when written, versions the download url
 
 
 class EntryDescriptor(PropertySet):
@@ -135,13 +183,15 @@ class EntryDescriptor(PropertySet):
 
     def calculate_urls(self):
         self.self_url = '%s/%i' % (BASE, self.id)
+        # Renditions rewritten at the same path get a new version, files
+        # from before there were versions are revalidated instead
         for fd in self.files:
             if fd.purpose == FileDescriptor.Purpose.primary:
                 self.primary_url = api.url().location.get_download_url(fd.location_id, fd.path)
             if fd.purpose == FileDescriptor.Purpose.proxy:
-                self.proxy_url = api.url().location.get_download_url(fd.location_id, fd.path)
+                self.proxy_url = api.url().location.get_download_url(fd.location_id, fd.path, fd.version)
             if fd.purpose == FileDescriptor.Purpose.thumb:
-                self.thumb_url = api.url().location.get_download_url(fd.location_id, fd.path)
+                self.thumb_url = api.url().location.get_download_url(fd.location_id, fd.path, fd.version)
 
     @classmethod
     def map_in(self, entry):
@@ -160,22 +210,39 @@ class EntryDescriptor(PropertySet):
             hidden=entry.hidden,
             files=[FileDescriptor.FromJSON(f) for f in entry.files.split('\n')] if entry.files else [],
             tags=sorted([tag.replace('~', '') for tag in entry.tags.split(',') if tag]),
-            metadata=wrap_raw_json(entry.data),
-            physical_metadata=wrap_raw_json(entry.physical_data),
+            metadata=entry.data,  # decoded on first access
+            physical_metadata=entry.physical_data,
         )
         ed.calculate_urls()
         return ed
 
+    @classmethod
+    def map_in_fields(self, entry, fields):
+        """
+        Map in only `fields`, from an entry with only the columns of
+        `entry_columns(fields)` loaded. Only those fields are serialized.
+        """
+        wanted = set(fields)
+        if wanted & URL_FIELDS:
+            wanted |= {'id', 'files'}
+        ed = EntryDescriptor(**{
+            name: get(entry) for name, get in _map_in_field.items() if name in wanted
+        })
+        if wanted & URL_FIELDS:
+            ed.calculate_urls()
+        ed._projection = tuple(fields)
+        return ed
+
     def map_out(self, entry, system=False):
         entry.original_filename = self.original_filename
         entry.export_filename = self.export_filename
         entry.source = self.source
         entry.state = self.state
         entry.hidden = self.hidden
-        entry.taken_ts = (datetime.datetime.strptime(
-            self.taken_ts, '%Y-%m-%d %H:%M:%S').replace(microsecond = 0)
-            if self.taken_ts else None
-        )
+        if self.taken_ts:
+            # Left as is when missing, taken_ts is part of the sort key
+            entry.taken_ts = (datetime.datetime.strptime(
+                self.taken_ts, '%Y-%m-%d %H:%M:%S').replace(microsecond = 0))
         if self.deleted and self.delete_ts is None:
             self.delete_ts = ((datetime.datetime.utcnow() + datetime.timedelta(hours=DELETE_AFTER))
                 .strftime('%Y-%m-%d %H:%M:%S'))
@@ -193,10 +260,80 @@ class EntryDescriptor(PropertySet):
         entry.latitude = self.latitude
         entry.longitude = self.longitude
         entry.tags = self.tags_as_string
+        self.map_out_tags(entry)
         if system:
             entry.files = '\n'.join([f.to_json(pretty=False) for f in self.files])
 
 
+    def map_out_tags(self, entry):
+        tag_ids = {tag.lower() for tag in self.tags if tag}
+        for entry_tag in list(entry.entry_tags):
+            if entry_tag.tag_id in tag_ids:
+                tag_ids.discard(entry_tag.tag_id)
+            else:
+                entry.entry_tags.remove(entry_tag)
+        for tag_id in sorted(tag_ids):
+            entry.entry_tags.append(EntryTag(tag_id=tag_id))
+
+
+def _ts(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+
+# How to map in each field, and the Entry columns it needs
+_map_in_field = {
+    'id': lambda entry: entry.id,
+    'user_id': lambda entry: entry.user_id,
+    'state': lambda entry: Entry.State(entry.state),
+    'access': lambda entry: Entry.Access(entry.access),
+    'original_filename': lambda entry: entry.original_filename,
+    'source': lambda entry: entry.source,
+    'create_ts': lambda entry: _ts(entry.create_ts),
+    'update_ts': lambda entry: _ts(entry.update_ts),
+    'taken_ts': lambda entry: _ts(entry.taken_ts),
+    'delete_ts': lambda entry: _ts(entry.delete_ts),
+    'deleted': lambda entry: entry.delete_ts is not None,
+    'hidden': lambda entry: entry.hidden,
+    'files': lambda entry: [FileDescriptor.FromJSON(f) for f in entry.files.split('\n')] if entry.files else [],
+    'tags': lambda entry: sorted([tag.replace('~', '') for tag in entry.tags.split(',') if tag]),
+    'metadata': lambda entry: entry.data,
+    'physical_metadata': lambda entry: entry.physical_data,
+}
+_field_columns = {
+    'deleted': ('delete_ts',),
+    'metadata': ('data',),
+    'physical_metadata': ('physical_data',),
+    'primary_url': ('files',),
+    'proxy_url': ('files',),
+    'thumb_url': ('files',),
+    'self_url': ('id',),
+}
+URL_FIELDS = {'primary_url', 'proxy_url', 'thumb_url', 'self_url'}
+
+# The fields that entry queries can be limited to
+FIELDS = tuple(sorted(set(_map_in_field) | set(_field_columns)))
+
+# Named sets of fields for the fields= option of entry queries
+VIEWS = {
+    'summary': ('id', 'state', 'taken_ts', 'tags', 'thumb_url', 'proxy_url'),
+}
+
+
+def entry_columns(fields):
+    """
+    The Entry columns needed to map in `fields`.
+    """
+    columns = {'id'}
+    for field in fields:
+        if field in _field_columns:
+            columns.update(_field_columns[field])
+        elif field in _map_in_field:
+            columns.add(field)
+        else:
+            raise ValueError("No such entry field '%s'" % field)
+    return [getattr(Entry, column) for column in sorted(columns)]
+
+
 class EntryDescriptorFeed(PropertySet):
     count = Property(int)
     total_count = Property(int)
@@ -221,10 +358,24 @@ class EntryQuery(PropertySet):
     exclude_tags = Property(list)
     source = Property()
 
-    next_ts = Property(none='')
-    prev_offset = Property(int)
+    after = Property(none='')  # cursor of the last entry on the previous page
+    before = Property(none='')  # cursor of the first entry on the next page
+    offset = Property(int, default=0)
     page_size = Property(int, default=25, required=True)
     order = Property(default='desc', required=True)
+    count = Property(bool, default=True)  # include total_count
+    fields = Property(list)  # only these fields of the entries
+    view = Property(none='')  # named set of fields, see VIEWS
+
+    def get_fields(self):
+        """
+        The fields to include, or None for all of them.
+        """
+        if self.view:
+            if self.view not in VIEWS:
+                raise ValueError("No such entry view '%s'" % self.view)
+            return VIEWS[self.view]
+        return tuple(self.fields) or None
 
     @classmethod
     def map_in_from_request(self):
@@ -233,9 +384,10 @@ class EntryQuery(PropertySet):
         eq.start_ts = request.query.start_ts
         eq.end_ts = request.query.end_ts
 
-        eq.next_ts = request.query.next_ts
-        if not request.query.prev_offset in (None, ''):
-            eq.prev_offset = request.query.prev_offset
+        eq.after = request.query.after
+        eq.before = request.query.before
+        if not request.query.offset in (None, ''):
+            eq.offset = request.query.offset
         if not request.query.page_size in (None, ''):
             eq.page_size = request.query.page_size
         if not request.query.order in (None, ''):
@@ -247,31 +399,48 @@ class EntryQuery(PropertySet):
         eq.other = request.query.other == 'yes'
 
         eq.source = request.query.source
+        eq.count = request.query.count != 'no'
         
         eq.show_hidden = request.query.show_hidden == 'yes'
         eq.show_deleted = request.query.show_deleted == 'yes'
         eq.only_hidden = request.query.only_hidden == 'yes'
         eq.only_deleted = request.query.only_deleted == 'yes'
 
+        eq.view = request.query.view
+
         decoded = request.query.decode()
         eq.include_tags = decoded.getall('include_tags')
         eq.exclude_tags = decoded.getall('exclude_tags')
+        eq.fields = [field for value in decoded.getall('fields') for field in value.split(',') if field]
         return eq
     
-    def to_query_string(self):
+    def filter_key(self):
+        """
+        The query string without paging, identifying the set of entries.
+        """
+        return self.to_query_string(paging=False)
+
+    def to_query_string(self, paging=True):
         return urllib.parse.urlencode(
+            (
+                ('after', self.after),
+                ('before', self.before),
+                ('offset', self.offset or 0),
+                ('page_size', self.page_size),
+                ('count', 'yes' if self.count else 'no'),
+                ('view', self.view),
+                ('fields', ','.join(self.fields)),
+            ) * paging
+                +
             (
                 ('start_ts', self.start_ts),
                 ('end_ts', self.end_ts),
-                ('next_ts', self.next_ts),
-                ('prev_offset', self.prev_offset or ''),
-                ('page_size', self.page_size),
                 ('order', self.order),
                 ('image', 'yes' if self.image else 'no'),
                 ('video', 'yes' if self.video else 'no'),
                 ('audio', 'yes' if self.audio else 'no'),
                 ('other', 'yes' if self.other else 'no'),
-                ('source', self.source),
+                ('source', self.source or ''),
                 ('show_hidden', 'yes' if self.show_hidden else 'no'),
                 ('show_deleted', 'yes' if self.show_deleted else 'no'),
                 ('only_hidden', 'yes' if self.only_hidden else 'no'),
@@ -292,112 +461,349 @@ class EntryQuery(PropertySet):
 
 
 def get_entries(query=None, system=False):
-    with get_db().transaction() as t:
-        q = (t.query(Entry)
-              .order_by(Entry.taken_ts.desc(), Entry.create_ts.desc())
-        )
-        if not system:
-            q = q.filter(
-                  (Entry.user_id == current_user_id())
-                | (Entry.access >= Entry.Access.users)
-            )
-
-            if not current_is_user():
-                q = q.filter(Entry.access >= Entry.Access.public)
-
-        if query is not None:
-            logging.info("Query: %s", query.to_json())
-            
-            if query.start_ts:
-                start_ts = (datetime.datetime.strptime(
-                    query.start_ts, '%Y-%m-%d')
-                    .replace(hour=0, minute=0, second=0, microsecond=0))
-                q = q.filter(Entry.taken_ts >= start_ts)
-
-            if query.end_ts:
-                end_ts = (datetime.datetime.strptime(
-                    query.end_ts, '%Y-%m-%d')
-                    .replace(hour=0, minute=0, second=0, microsecond=0))
-                q = q.filter(Entry.taken_ts < end_ts)
-            
-            types = [t.value for t in Entry.Type if getattr(query, t.name)]
-            if types:
-                q = q.filter(Entry.type.in_(types))
-
-            if not query.show_hidden:
-                q = q.filter(Entry.hidden == False)
-            if not query.show_deleted:
-                q = q.filter(Entry.delete_ts == None)
-            if query.only_hidden:
-                q = q.filter(Entry.hidden == True)
-            if query.only_deleted:
-                q = q.filter(Entry.delete_ts != None)
-
-            for tag in query.include_tags:
-                q = q.filter(Entry.tags.like('%~' + tag + '~%'))
-            for tag in query.exclude_tags:
-                q = q.filter(~Entry.tags.like('%~' + tag + '~%'))
-
-            if query.source:
-                q = q.filter(Entry.source == query.source)
-
-        total_count = q.count()
-
-        # Default values for when no paging occurs
-        offset = 0
-        total_count_paged = total_count
+    """
+    Get entries newest first, ordered by (taken_ts, create_ts, id). Pages
+    are fetched with keyset pagination: the after and before cursors of
+    the query name the entry just outside the wanted page, so no page
+    costs more than the first one.
+
+    Without a query all entries are returned; see iter_entries for a
+    way to go through them without holding them all in memory.
+    """
+    if query is None:
+        entries = list(iter_entries(system=system))
+        return EntryDescriptorFeed(
+            count=len(entries),
+            total_count=len(entries),
+            offset=0,
+            entries=entries)
+
+    with get_db().read_transaction() as t:
+        q = _query_entries(t, query, system)
+
+        total_count = None
+        if query.count:
+            key = (query.filter_key(), None if system else (current_user_id(), current_is_user()))
+            total_count = get_cached_count(key, q.count)
+
+        fields = query.get_fields()
+        if fields:
+            q = q.options(load_only(*entry_columns(fields)))
 
         # Paging
-        if query is not None:
-            if query.next_ts:
-                end_ts = (datetime.datetime.strptime(
-                    query.next_ts, '%Y-%m-%d %H:%M:%S').replace(microsecond=0))
-                q = q.filter(Entry.taken_ts < end_ts)
-                total_count_paged = q.count()
-                offset = total_count - total_count_paged
-
-            elif query.prev_offset:
-                q = q.offset(query.prev_offset)
-                total_count_paged = total_count
-                offset = query.prev_offset
-
-            logging.info(q)
-            page_size = query.page_size
-            entries = q.limit(page_size).all()
-
+        page_size = query.page_size
+        offset = query.offset or 0
+        backwards = bool(query.before)
+        q = q.add_columns(
+            type_coerce(Entry.taken_ts, String),
+            type_coerce(Entry.create_ts, String),
+        )
+        if backwards:
+            q = q.filter(_after_cursor(query.before, backwards=True))
+            q = q.order_by(Entry.taken_ts.asc(), Entry.create_ts.asc(), Entry.id.asc())
         else:
-            entries = q.all()
-
-        count = len(entries)
+            if query.after:
+                q = q.filter(_after_cursor(query.after))
+            q = q.order_by(Entry.taken_ts.desc(), Entry.create_ts.desc(), Entry.id.desc())
+
+        logging.info(q)
+        rows = q.limit(page_size + 1).all()
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if backwards:
+            rows.reverse()
+            offset = max(offset - len(rows), 0) if more else 0
 
         result = EntryDescriptorFeed(
-            count=count,
+            count=len(rows),
             total_count=total_count,
             offset=offset,
-            entries = [EntryDescriptor.map_in(entry) for entry in entries])
-        
-        # Paging
-        if query is not None:
-            if total_count > count:
-                query.next_ts = result.entries[-1].taken_ts
-                result.next_link = BASE + '?' + query.to_query_string()
-
-            if count > 0 and offset > 0:
-                query.next_ts = ''
-                query.prev_offset = max(offset - page_size, 0)
-                result.prev_link = BASE + '?' + query.to_query_string()
+            entries=[_map_in(row[0], fields) for row in rows])
+
+        if rows and (more or backwards):
+            next_query = EntryQuery(query.to_dict())
+            next_query.after = _cursor(rows[-1])
+            next_query.before = ''
+            next_query.offset = offset + len(rows)
+            result.next_link = BASE + '?' + next_query.to_query_string()
+
+        if rows and (more if backwards else query.after):
+            prev_query = EntryQuery(query.to_dict())
+            prev_query.after = ''
+            prev_query.before = _cursor(rows[0])
+            prev_query.offset = offset
+            result.prev_link = BASE + '?' + prev_query.to_query_string()
 
         return result
 
 
+def _query_entries(t, query=None, system=False):
+    """
+    Query for the entries matching `query` that the current user may see.
+    """
+    q = t.query(Entry)
+    if not system:
+        q = q.filter(
+              (Entry.user_id == current_user_id())
+            | (Entry.access >= Entry.Access.users)
+        )
+
+        if not current_is_user():
+            q = q.filter(Entry.access >= Entry.Access.public)
+
+    if query is None:
+        return q
+
+    logging.info("Query: %s", query.to_json())
+
+    if query.start_ts:
+        start_ts = (datetime.datetime.strptime(
+            query.start_ts, '%Y-%m-%d')
+            .replace(hour=0, minute=0, second=0, microsecond=0))
+        q = q.filter(Entry.taken_ts >= start_ts)
+
+    if query.end_ts:
+        end_ts = (datetime.datetime.strptime(
+            query.end_ts, '%Y-%m-%d')
+            .replace(hour=0, minute=0, second=0, microsecond=0))
+        q = q.filter(Entry.taken_ts < end_ts)
+    
+    types = [t.value for t in Entry.Type if getattr(query, t.name)]
+    if types:
+        q = q.filter(Entry.type.in_(types))
+
+    if not query.show_hidden:
+        q = q.filter(Entry.hidden == False)
+    if not query.show_deleted:
+        q = q.filter(Entry.delete_ts == None)
+    if query.only_hidden:
+        q = q.filter(Entry.hidden == True)
+    if query.only_deleted:
+        q = q.filter(Entry.delete_ts != None)
+
+    for tag in query.include_tags:
+        q = q.filter(Entry.id.in_(
+            t.query(EntryTag.entry_id).filter(EntryTag.tag_id == tag.lower())
+        ))
+    for tag in query.exclude_tags:
+        q = q.filter(~Entry.entry_tags.any(EntryTag.tag_id == tag.lower()))
+
+    if query.source:
+        q = q.filter(Entry.source == query.source)
+
+    return q
+
+
+def iter_entries(query=None, system=False, chunk_size=STREAM_CHUNK):
+    """
+    Yield descriptors of the entries matching `query`, newest first and
+    without paging. Rows are fetched `chunk_size` at a time from a server
+    side cursor where the database has one, so memory use does not grow
+    with the number of entries.
+    """
+    fields = query.get_fields() if query is not None else None
+    with get_db().read_transaction() as t:
+        q = (_query_entries(t, query, system)
+            .order_by(Entry.taken_ts.desc(), Entry.create_ts.desc(), Entry.id.desc())
+            .yield_per(chunk_size))
+        if fields:
+            q = q.options(load_only(*entry_columns(fields)))
+        for entry in q:
+            yield _map_in(entry, fields)
+
+
+def _map_in(entry, fields=None):
+    if fields:
+        return EntryDescriptor.map_in_fields(entry, fields)
+    return EntryDescriptor.map_in(entry)
+
+
+def _cursor(row):
+    """
+    Cursor of an (Entry, taken_ts, create_ts) row, with the timestamps as
+    stored in the database so that they compare equal to themselves.
+    """
+    entry, taken_ts, create_ts = row
+    return '%s|%s|%i' % (taken_ts, create_ts, entry.id)
+
+
+def parse_cursor(cursor):
+    """
+    Return the (taken_ts, create_ts, id) of a cursor made by _cursor, or
+    raise ValueError.
+    """
+    try:
+        taken_ts, create_ts, id = cursor.split('|')
+        return taken_ts, create_ts, int(id)
+    except ValueError:
+        raise ValueError("Bad cursor '%s'" % cursor)
+
+
+def _after_cursor(cursor, backwards=False):
+    """
+    Filter for entries after `cursor` in descending order, or before it if
+    `backwards`. The leading range on taken_ts lets the index seek to the
+    cursor instead of walking up to it.
+    """
+    taken_ts, create_ts, id = parse_cursor(cursor)
+    taken_ts = type_coerce(taken_ts, String)
+    create_ts = type_coerce(create_ts, String)
+    if backwards:
+        return and_(Entry.taken_ts >= taken_ts, or_(
+            Entry.taken_ts > taken_ts,
+            Entry.create_ts > create_ts,
+            and_(Entry.create_ts == create_ts, Entry.id > id),
+        ))
+    else:
+        return and_(Entry.taken_ts <= taken_ts, or_(
+            Entry.taken_ts < taken_ts,
+            Entry.create_ts < create_ts,
+            and_(Entry.create_ts == create_ts, Entry.id < id),
+        ))
+
+
+_count_cache = OrderedDict()  # key -> (monotonic time, count)
+_count_lock = Lock()
+
+
+def get_cached_count(key, count):
+    """
+    Return the cached total count for `key`, or call `count` and cache it.
+    """
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached is not None and now - cached[0] < COUNT_CACHE_TTL:
+            _count_cache.move_to_end(key)
+            return cached[1]
+    value = count()
+    with _count_lock:
+        _count_cache[key] = (now, value)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return value
+
+
+def invalidate_entry_counts():
+    """
+    Forget all cached total counts. Called on every entry write.
+    """
+    with _count_lock:
+        _count_cache.clear()
+
+
+################################################################################
+# Thumbnail Sprites
+
+
+# Fields of the entries that a sprite needs
+SPRITE_FIELDS = ('id', 'files')
+
+
+def get_thumb_sprite(query, system=False):
+    """
+    Get the thumbnails of the page of entries of `query` as one sprite,
+    so that a grid page needs a single request for all its thumbnails.
+    Returns the thumb location and the path of the sprite on it.
+
+    A sprite is a line of JSON, {"entries": [{"id", "offset", "length",
+    "mime"}, ...]}, followed by the thumbnails, the offsets counting from
+    the first byte after the line. Entries without a thumbnail are left
+    out. Sprites are kept on disk, keyed by the entries and the versions
+    of their thumbnails, which change whenever they are rendered.
+    """
+    query = EntryQuery(query.to_dict())
+    query.fields = list(SPRITE_FIELDS)
+    query.view = ''
+    query.count = False
+    thumbs = []
+    for ed in get_entries(query, system=system).entries:
+        for fd in ed.files:
+            if fd.purpose == FileDescriptor.Purpose.thumb:
+                thumbs.append((ed, fd))
+                break
+
+    key = hashlib.sha1('\n'.join(
+        '%i|%i|%s|%s' % (ed.id, fd.location_id, fd.path, fd.version)
+        for ed, fd in thumbs
+    ).encode('utf8')).hexdigest()
+    location = get_location_by_type(Location.Type.thumb)
+    path = os.path.join(SPRITE_FOLDER, key + '.sprite')
+    filename = os.path.join(location.get_root(), path)
+    if not os.path.exists(filename):
+        write_thumb_sprite(filename, thumbs)
+    return location, path
+
+
+def write_thumb_sprite(filename, thumbs):
+    """
+    Write the sprite of the (EntryDescriptor, FileDescriptor) `thumbs` to
+    `filename`. It is written next to it and moved in, so that it is never
+    served half written.
+    """
+    index = []
+    chunks = []
+    offset = 0
+    for ed, fd in thumbs:
+        try:
+            root = get_location_by_id(fd.location_id).get_root()
+            with open(os.path.join(root, fd.path), 'rb') as f:
+                data = f.read()
+        except (NoResultFound, OSError) as e:
+            logging.warning("No thumbnail for entry %i in sprite (%s)", ed.id, str(e))
+            continue
+        index.append({
+            'id': ed.id,
+            'offset': offset,
+            'length': len(data),
+            'mime': fd.mime or 'image/jpeg',
+        })
+        chunks.append(data)
+        offset += len(data)
+
+    folder = os.path.dirname(filename)
+    os.makedirs(folder, exist_ok=True)
+    handle, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(json.dumps({'entries': index}).encode('utf8') + b'\n')
+            f.writelines(chunks)
+        os.replace(tmp, filename)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    logging.debug("Wrote sprite %s of %i thumbnails", filename, len(index))
+    prune_thumb_sprites(folder)
+
+
+def prune_thumb_sprites(folder):
+    """
+    Remove the oldest sprites in `folder` beyond SPRITE_CACHE_FILES.
+    """
+    sprites = []
+    for name in os.listdir(folder):
+        if name.endswith('.sprite'):
+            try:
+                sprites.append((os.stat(os.path.join(folder, name)).st_mtime, name))
+            except FileNotFoundError:
+                pass  # removed by another process
+    sprites.sort()
+    for mtime, name in sprites[:max(len(sprites) - SPRITE_CACHE_FILES, 0)]:
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+
+
 def get_entry_by_id(id):
-    with get_db().transaction() as t:
+    with get_db().read_transaction() as t:
         entry = t.query(Entry).filter(Entry.id==id).one()
         return EntryDescriptor.map_in(entry) 
 
 
 def get_entry_by_source(source, filename, system=False):
-    with get_db().transaction() as t:
+    with get_db().read_transaction() as t:
         q = t.query(Entry).filter(
             Entry.source == source,
             Entry.original_filename == filename
@@ -419,6 +825,7 @@ def update_entry_by_id(id, ed, system=False):
         entry = q.one()
         ed.map_out(entry)
 
+    invalidate_entry_counts()
     return get_entry_by_id(id)
 
 
@@ -434,6 +841,31 @@ def create_entry(ed, system=False):
         t.commit()
         id = entry.id
 
+    invalidate_entry_counts()
+    return get_entry_by_id(id)
+
+
+def set_entry_files(id, fds):
+    """
+    Set files of an entry, replacing those it has for the same purposes,
+    like renditions that are finished after the entry was created.
+
+    A file written again at the same path must get a newer version, for
+    its url to change, but file times can be too coarse to tell two quick
+    writes apart; the version is bumped past the replaced one then.
+    """
+    purposes = {fd.purpose for fd in fds}
+    with get_db().transaction() as t:
+        entry = t.query(Entry).filter(Entry.id==id).one()
+        files = [FileDescriptor.FromJSON(f) for f in entry.files.split('\n')] if entry.files else []
+        replaced = {(fd.location_id, fd.path): fd for fd in files if fd.purpose in purposes}
+        for fd in fds:
+            old = replaced.get((fd.location_id, fd.path))
+            if old is not None and old.version is not None and (fd.version or 0) <= old.version:
+                fd.version = old.version + 1
+        files = [fd for fd in files if fd.purpose not in purposes] + list(fds)
+        entry.files = '\n'.join([fd.to_json(pretty=False) for fd in files])
+
     return get_entry_by_id(id)
 
 
@@ -444,4 +876,50 @@ def delete_entry_by_id(id, system=False):
             q = q.filter(
                 (Entry.user_id == current_user_id()) | (Entry.access >= Entry.Access.common)
             )
+        ids = [entry_id for entry_id, in q.with_entities(Entry.id)]
+        if ids:
+            t.query(EntryTag).filter(EntryTag.entry_id.in_(ids)).delete(synchronize_session=False)
         q.delete()
+    invalidate_entry_counts()
+
+
+def backfill_entry_tags():
+    """
+    Fill the entry_tag table from Entry.tags for entries that have tags but
+    no entry_tag rows, such as entries from before the table existed.
+    """
+    count = 0
+    with get_db().transaction() as t:
+        q = t.query(Entry.id, Entry.tags).filter(
+            Entry.tags != None,
+            Entry.tags != '',
+            ~Entry.entry_tags.any(),
+        )
+        rows = []
+        for entry_id, tags in q.yield_per(1000):
+            rows.extend(
+                {'entry_id': entry_id, 'tag_id': tag_id}
+                for tag_id in {tag.replace('~', '') for tag in tags.split(',') if tag}
+            )
+            count += 1
+        t.bulk_insert_mappings(EntryTag, rows)
+        t.commit()
+    invalidate_entry_counts()
+    if count:
+        logging.info("Backfilled tags of %i entries.", count)
+    return count
+
+
+def backfill_taken_ts():
+    """
+    Set taken_ts to create_ts for entries without it, as entries are
+    paged by taken_ts.
+    """
+    with get_db().transaction() as t:
+        count = t.query(Entry).filter(Entry.taken_ts == None).update(
+            {Entry.taken_ts: Entry.create_ts}, synchronize_session=False)
+        t.commit()
+    if count:
+        invalidate_entry_counts()
+        logging.info("Backfilled taken_ts of %i entries.", count)
+    return count
@@ -1,21 +1,46 @@
 """Take care of import jobs and copying files. Keep track of import modules"""
 
-import logging, mimetypes, os, re, base64
-from threading import Thread, Event
+import logging, mimetypes, os, re, base64, socket, sqlite3, time, functools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Thread, Event, Lock, Semaphore, current_thread
 from datetime import datetime, timedelta
 
-from bottle import Bottle, auth_basic, request
+from bottle import Bottle, auth_basic, request, HTTPError
+from sqlalchemy import text, bindparam, func, insert, DateTime
+from sqlalchemy.dialects import postgresql, sqlite as sqlite_dialect
 from sqlalchemy.orm.exc import NoResultFound
 
-from . import api, ImportJob, Location, Entry, IMPORTABLE
-from .database import get_db
+from . import api, bus, ImportJob, Location, Entry, IMPORTABLE
+from .database import get_db, init
 from .types import PropertySet, Property
-from .user import authenticate, no_guests, current_user_id
-from .location import LocationDescriptor, get_locations_by_type, get_location_by_type
+from .user import authenticate, no_guests, current_user_id, get_credential_cache_stats
+from .location import LocationDescriptor, get_locations_by_type, get_location_by_type, get_location_by_id
 from .metadata import wrap_raw_json
 from .entry import create_entry
 
 
+# Number of import jobs claimed at once by a worker
+CLAIM_BATCH = 10
+
+# How long a claim is valid. Jobs of crashed workers are claimable again after this.
+LEASE_TIME = timedelta(minutes=30)
+
+# Seconds between polls of a location, doubled for each idle poll up to the max
+POLL_INTERVAL = 30
+MAX_POLL_INTERVAL = 600
+
+# Bus topic for new import jobs, published with (location_id, [import_job_id])
+JOB_CREATED = 'import_job.created'
+
+# Number of creation times of import jobs kept for their latency, for jobs
+# created in this process but claimed by others, which never start here
+CREATED_CACHE_SIZE = 10000
+
+# Number of paths per set query or insert when creating import jobs in bulk
+BULK_CHUNK = 500
+
+
 
 ################################################################################
 # Import API
@@ -30,18 +55,25 @@ api.register(BASE, app)
 @auth_basic(authenticate)
 @no_guests()
 def rest_get_importers():
+    manager = rest_trig_import.manager
+    queued = count_import_jobs_by_location(ImportJob.State.new)
     entries = []
     for location in get_locations_by_type(*IMPORTABLE).entries:
-        entries.append({
+        entry = {
             'location_id': location.id,
             'location_name': location.name,
             'trig_url': get_trig_url(location.id),
-        })
+            'queued': queued.get(location.id, 0),
+        }
+        entry.update(manager.get_stats(location.id))
+        entries.append(entry)
 
     return {
         '*schema': 'ImporterFeed',
         'count': len(entries),
         'entries': entries,
+        'lock_waits': get_db().lock_waits.get(),
+        'credential_cache': get_credential_cache_stats(),
     }
 
 
@@ -101,6 +133,23 @@ def rest_create_import_job():
     return json
 
 
+@app.post('/jobs')
+@auth_basic(authenticate)
+@no_guests()
+def rest_create_import_jobs():
+    feed = ImportJobDescriptorFeed(request.json)
+    jds = [ImportJobDescriptor(entry) for entry in feed.entries or []]
+    logging.debug("Incoming %i Import Jobs", len(jds))
+    error = check_import_locations(jds)
+    if error is not None:
+        return error
+    result = create_import_jobs(jds)
+    for location_id in {jd.location.id for jd in jds}:
+        rest_trig_import(location_id)
+    result['result'] = 'ok'
+    return result
+
+
 @app.post('/upload/<source>/<filename>')
 @auth_basic(authenticate)
 @no_guests()
@@ -139,6 +188,22 @@ def rest_upload(source, filename):
     return json
 
 
+def check_import_locations(jds):
+    """
+    Return an HTTPError if an import job descriptor has no location, or
+    one that doesn't exist or can't be imported from, or else None.
+    """
+    for location_id in {jd.location.id if jd.location else None for jd in jds}:
+        if location_id is None:
+            return HTTPError(400, "Import jobs need a location.")
+        try:
+            location = get_location_by_id(location_id)
+        except NoResultFound:
+            return HTTPError(404, "No location %i." % location_id)
+        if location.type not in IMPORTABLE:
+            return HTTPError(400, "Location %i can't be imported from." % location_id)
+
+
 def get_job_url(location_id):
     return '%s/job/%i' % (BASE, location_id)
 
@@ -173,6 +238,13 @@ class GenericImportModule(object):
     def __init__(self, job_descriptor):
         self.job_descriptor = job_descriptor
 
+    def complete(self, entry_id):
+        """
+        Called with the id of the entry once it is created, for work that
+        doesn't have to hold the entry back, like slow renditions.
+        """
+        pass
+
 
 ################################################################################
 # Import Job Descriptor
@@ -271,44 +343,213 @@ def get_import_jobs():
         )
 
 
-def create_import_job(jd): # ImportJobDescriptor
+def count_import_jobs_by_location(state):
+    """
+    Return a dict of location id to number of import jobs in `state`.
+    """
     with get_db().transaction() as t:
-        try:
-            import_job = t.query(ImportJob).filter(
-                ImportJob.location_id == jd.location.id,
-                ImportJob.path == jd.path,
-            ).one()
+        return dict(
+            t.query(ImportJob.location_id, func.count(ImportJob.id))
+             .filter(ImportJob.state == state)
+             .group_by(ImportJob.location_id)
+             .all()
+        )
+
 
+def insert_import_jobs(t, rows):
+    """
+    Insert import job `rows` in transaction `t`, skipping those whose
+    (location, path) has an import job already, also one that another
+    writer, like the folder watcher and the scanner, has just inserted.
+    Returns the number of jobs inserted.
+    """
+    dialect = t.get_bind().dialect.name
+    if dialect == 'sqlite':
+        statement = sqlite_dialect.insert(ImportJob).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(ImportJob).on_conflict_do_nothing()
+    else:
+        statement = insert(ImportJob)
+    return t.execute(statement, rows).rowcount
+
+
+def import_job_row(jd):
+    import_job = ImportJob()
+    jd.map_out(import_job)
+    return {
+        'path': import_job.path,
+        'data': import_job.data,
+        'user_id': import_job.user_id,
+        'location_id': import_job.location_id,
+        'state': import_job.state or ImportJob.State.new,
+    }
+
+
+def create_import_job(jd): # ImportJobDescriptor
+    with get_db().transaction() as t:
+        query = t.query(ImportJob).filter(
+            ImportJob.location_id == jd.location.id,
+            ImportJob.path == jd.path,
+        )
+        import_job = query.one_or_none()
+        if import_job is not None:
             return ImportJobDescriptor.map_in(import_job)
-        except NoResultFound:
-            logging.info("Creating Import Job for %i://%s",
-                         jd.location.id,
-                         jd.path
-            )
-            import_job = ImportJob()
-            jd.map_out(import_job)
-            t.add(import_job)
-            t.commit()
-            id = import_job.id
+
+        logging.info("Creating Import Job for %i://%s",
+                     jd.location.id,
+                     jd.path
+        )
+        created = insert_import_jobs(t, [import_job_row(jd)])
+        id = query.with_entities(ImportJob.id).scalar()
+        t.commit()
     
     jd = get_import_job_by_id(id)
+    if created:
+        bus.publish(JOB_CREATED, jd.location.id, [jd.id])
     return jd
 
-def pick_up_import_job(location_id):
+def create_import_jobs(jds): # [ImportJobDescriptor]
+    """
+    Create import jobs for all descriptors whose (location, path) has no
+    import job yet, in one transaction. Existing paths are found with one
+    set query per location and chunk of paths.
+
+    Returns a dict with the number of jobs created and already existing.
+    """
+    by_location = OrderedDict()
+    for jd in jds:
+        by_location.setdefault(jd.location.id, OrderedDict()).setdefault(jd.path, jd)
+
+    created = 0
+    created_ids = OrderedDict((location_id, []) for location_id in by_location)
+    existing = len(jds) - sum(len(paths) for paths in by_location.values())
     with get_db().transaction() as t:
-        try:
-            import_job = t.query(ImportJob).filter(
-                ImportJob.location_id==location_id,
-                ImportJob.state==ImportJob.State.new
-            ).order_by(ImportJob.create_ts).first()
-            if import_job is None:
-                return None
-
-            import_job.state = ImportJob.State.active
-            return ImportJobDescriptor.map_in(import_job)
+        for location_id, paths in by_location.items():
+            candidates = list(paths)
+            for n in range(0, len(candidates), BULK_CHUNK):
+                chunk = candidates[n:n + BULK_CHUNK]
+                found = {path for path, in t.query(ImportJob.path).filter(
+                    ImportJob.location_id == location_id,
+                    ImportJob.path.in_(chunk),
+                )}
+                rows = [import_job_row(paths[path]) for path in chunk if path not in found]
+                inserted = insert_import_jobs(t, rows) if rows else 0
+                created += inserted
+                existing += len(chunk) - inserted
+                if inserted:
+                    # Also any just inserted by another writer, which only
+                    # wakes the dispatcher once more
+                    created_ids[location_id].extend(id for id, in t.query(ImportJob.id).filter(
+                        ImportJob.location_id == location_id,
+                        ImportJob.path.in_([row['path'] for row in rows]),
+                    ))
+        t.commit()
+
+    logging.info("Created %i Import Jobs in bulk, %i existed", created, existing)
+    for location_id, ids in created_ids.items():
+        bus.publish(JOB_CREATED, location_id, ids)
+    return {'created': created, 'existing': existing}
+
+
+def get_lease_owner():
+    """
+    Name the current worker as host:pid:thread, for leasing import jobs.
+    """
+    return '%s:%i:%s' % (socket.gethostname(), os.getpid(), current_thread().name)
 
-        except NoResultFound:
-            return None
+
+_claim_returning_sql = text("""
+    UPDATE import_job
+       SET state = :active, lease_owner = :owner, lease_expire_ts = :expire
+     WHERE id IN (
+        SELECT id FROM import_job
+         WHERE location_id = :location_id
+           AND (state = :new OR (state = :active AND lease_expire_ts < :now))
+         ORDER BY create_ts
+         LIMIT :limit)
+    RETURNING id
+""").bindparams(bindparam('now', type_=DateTime()), bindparam('expire', type_=DateTime()))
+
+
+def claim_import_jobs(location_id, owner=None, limit=CLAIM_BATCH, lease=LEASE_TIME):
+    """
+    Claim up to `limit` new import jobs on a location, oldest first, for
+    `owner` (defaults to the current worker). Active jobs whose lease has
+    expired are claimed again. Several workers may claim on the same
+    location concurrently without getting the same jobs.
+
+    Returns a list of ImportJobDescriptors.
+    """
+    owner = owner or get_lease_owner()
+    now = datetime.utcnow()
+    expire = now + lease
+    with get_db().transaction() as t:
+        dialect = t.get_bind().dialect.name
+        if dialect == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35, 0):
+            ids = [row[0] for row in t.execute(_claim_returning_sql, {
+                'active': ImportJob.State.active,
+                'new': ImportJob.State.new,
+                'owner': owner,
+                'expire': expire,
+                'now': now,
+                'location_id': location_id,
+                'limit': limit,
+            })]
+        else:
+            claimable = (
+                (ImportJob.state == ImportJob.State.new)
+              | ((ImportJob.state == ImportJob.State.active) & (ImportJob.lease_expire_ts < now))
+            )
+            q = t.query(ImportJob.id).filter(
+                ImportJob.location_id == location_id,
+                claimable
+            ).order_by(ImportJob.create_ts).limit(limit)
+            if dialect != 'sqlite':
+                q = q.with_for_update(skip_locked=True)
+            ids = [id for id, in q.all()]
+            if ids:
+                t.query(ImportJob).filter(
+                    ImportJob.id.in_(ids),
+                    claimable
+                ).update({
+                    ImportJob.state: ImportJob.State.active,
+                    ImportJob.lease_owner: owner,
+                    ImportJob.lease_expire_ts: expire,
+                }, synchronize_session=False)
+        if not ids:
+            return []
+
+        import_jobs = t.query(ImportJob).filter(
+            ImportJob.id.in_(ids),
+            ImportJob.lease_owner == owner,
+            ImportJob.lease_expire_ts == expire,
+        ).order_by(ImportJob.create_ts).all()
+        logging.debug("%s claimed %i Import Jobs on location %i.", owner, len(import_jobs), location_id)
+        return [ImportJobDescriptor.map_in(import_job) for import_job in import_jobs]
+
+
+def pick_up_import_job(location_id):
+    jds = claim_import_jobs(location_id, limit=1)
+    return jds[0] if jds else None
+
+
+def release_import_jobs(jds):
+    """
+    Give up the claims on import jobs that were not started, making them
+    new again.
+    """
+    if not jds:
+        return
+    with get_db().transaction() as t:
+        t.query(ImportJob).filter(
+            ImportJob.id.in_([jd.id for jd in jds]),
+            ImportJob.state == ImportJob.State.active,
+        ).update({
+            ImportJob.state: ImportJob.State.new,
+            ImportJob.lease_owner: None,
+            ImportJob.lease_expire_ts: None,
+        }, synchronize_session=False)
+    logging.debug("Released %i Import Jobs.", len(jds))
 
 
 def fail_import_job(import_job_descriptor, reason):
@@ -367,116 +608,329 @@ def delete_import_job_by_id(import_job_id):
 
 
 ################################################################################
-# Threaded Import Manager (Singleton)
+# Worker Pool Import Manager (Singleton)
+
+
+class ImportStats(object):
+    """
+    Import counters for one location. Guarded by the ImportManager lock.
+    """
+    def __init__(self, window=60):
+        self.window = window  # seconds
+        self.in_flight = 0
+        self.done = 0
+        self.failed = 0
+        self.finished = deque()
+        self.latencies = deque()  # (started, seconds from creation to start)
+
+    def record(self, ok):
+        if ok:
+            self.done += 1
+        else:
+            self.failed += 1
+        self.finished.append(time.monotonic())
+
+    def start(self, latency):
+        self.in_flight += 1
+        if latency is not None:
+            self.latencies.append((time.monotonic(), latency))
+
+    def throughput(self):
+        """Finished jobs per minute over the last window."""
+        limit = time.monotonic() - self.window
+        while self.finished and self.finished[0] < limit:
+            self.finished.popleft()
+        return len(self.finished) * 60.0 / self.window
+
+    def latency(self):
+        """Mean and max seconds from creation to start over the last window."""
+        limit = time.monotonic() - self.window
+        while self.latencies and self.latencies[0][0] < limit:
+            self.latencies.popleft()
+        if not self.latencies:
+            return None, None
+        values = [latency for started, latency in self.latencies]
+        return sum(values) / len(values), max(values)
 
 
 class ImportManager(object):
     """
-    A Thread+Event based Import Manager that keeps one thread per location
-    and trigs a new import round upon the trig method being called.
+    An Import Manager with one pool of workers shared by all importable
+    locations. A dispatcher thread claims jobs CLAIM_BATCH at a time into
+    a queue per location, and hands them out round robin over the
+    locations that have work, one job per location and turn, so a busy
+    location can't starve the others. It runs a new round when the trig
+    method is called.
+
+    The workers are threads, or processes if `pool` is 'process'. Defaults
+    to one worker per core.
 
     There should only be one of these.
     """
-    def __init__(self):
-        self.events = {}
+    def __init__(self, workers=None, pool='thread'):
         rest_trig_import.manager = self
+        self.workers = workers or os.cpu_count()
+
+        logging.debug("Setting up import %s pool with %i workers.", pool, self.workers)
+        if pool == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                               thread_name_prefix='Importer')
+        elif pool == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                initializer=_init_import_process,
+                                                initargs=(get_db().sql_path,))
+        else:
+            raise ValueError("Unknown import pool type '%s'" % pool)
 
-        for location in get_locations_by_type(*IMPORTABLE).entries:
-            logging.debug("Setting up import thread [Importer%i].", location.id)
-            event = Event()
-            self.events[location.id] = event
-            thread = Thread(
-                target=importing_loop,
-                name="Importer%i" % (location.id),
-                args=(event, location)
-            )
-            thread.daemon = True
-            thread.start()
+        self.locations = OrderedDict(
+            (location.id, location)
+            for location in get_locations_by_type(*IMPORTABLE).entries
+        )
+        self.stats = {location_id: ImportStats() for location_id in self.locations}
+        self.queues = {location_id: deque() for location_id in self.locations}  # claimed jobs
+        self.pending = set()
+        self.notified = set()
+        self.next_poll = {location_id: 0 for location_id in self.locations}
+        self.poll_interval = {location_id: POLL_INTERVAL for location_id in self.locations}
+        self.created = OrderedDict()  # import job id -> monotonic time of creation
+        self.slots = Semaphore(self.workers)
+        self.lock = Lock()
+        self.event = Event()
+        self.stopped = False
+
+        bus.subscribe(JOB_CREATED, self.notify)
+
+        logging.debug("Setting up import dispatcher thread [ImportDispatcher].")
+        thread = Thread(
+            target=self.dispatch_loop,
+            name="ImportDispatcher",
+        )
+        thread.daemon = True
+        thread.start()
 
         logging.debug("Setting up import job cleaning thread [ImportCleaner].")
-        event = Event()
-        self.events['clean'] = event
+        self.clean_event = Event()
         thread = Thread(
             target=cleaning_loop,
             name="ImportCleaner",
-            args=(event,)
+            args=(self.clean_event,)
         )
         thread.daemon = True
         thread.start()
 
+    def shutdown(self, wait=True):
+        """
+        Stop dispatching, and with `wait`, wait for the running jobs. Claimed
+        jobs that were not started are released.
+        """
+        bus.unsubscribe(JOB_CREATED, self.notify)
+        self.stopped = True
+        self.event.set()
+        self.executor.shutdown(wait=wait)
+        release_import_jobs([jd for queue in self.queues.values() for jd in queue])
+
     def trig(self, location_id):
-        event = self.events.get(location_id)
-        if event is None:
-            raise NameError("No thread for location %i", location_id)
+        if location_id not in self.locations:
+            raise NameError("No importer for location %i", location_id)
         logging.info("Trigging import event for location %i", location_id)
-        event.set()
-                
+        self.wake(location_id)
+
+    def notify(self, location_id, import_job_ids):
+        """
+        Bus subscriber for JOB_CREATED.
+        """
+        if location_id not in self.locations:
+            return
+        now = time.monotonic()
+        with self.lock:
+            for import_job_id in import_job_ids:
+                self.created[import_job_id] = now
+            while len(self.created) > CREATED_CACHE_SIZE:
+                self.created.popitem(last=False)
+        self.wake(location_id)
+
+    def wake(self, location_id):
+        with self.lock:
+            self.notified.add(location_id)
+            self.poll_interval[location_id] = POLL_INTERVAL
+        self.event.set()
+
+    def get_stats(self, location_id):
+        """
+        Return a dict with claimed (jobs claimed and waiting for a worker),
+        in_flight, done, failed, throughput (jobs per minute) and mean and
+        max latency (seconds from job creation to start) for a location.
+        """
+        with self.lock:
+            stats = self.stats.get(location_id) or ImportStats()
+            latency, max_latency = stats.latency()
+            return {
+                'claimed': len(self.queues.get(location_id, ())),
+                'in_flight': stats.in_flight,
+                'done': stats.done,
+                'failed': stats.failed,
+                'throughput': stats.throughput(),
+                'latency': latency,
+                'max_latency': max_latency,
+            }
+
+    def dispatch_loop(self):
+        """
+        Wait for the event to be set or the next poll to be due, then
+        dispatch jobs until the woken locations have none left.
+        """
+        logging.info("Started import dispatcher for %i locations", len(self.locations))
+        while not self.stopped:
+            with self.lock:
+                timeout = min(self.next_poll.values(), default=None)
+                if timeout is not None:
+                    timeout = max(0, timeout - time.monotonic())
+            self.event.wait(timeout)
+            self.event.clear()
+            with self.lock:
+                now = time.monotonic()
+                self.pending.update(location_id for location_id, due in self.next_poll.items()
+                                    if due <= now)
+            self.dispatch()
+
+    def dispatch(self):
+        while not self.stopped:
+            with self.lock:
+                self.pending.update(self.notified)
+                self.notified.clear()
+                turn = [location_id for location_id in self.locations
+                        if location_id in self.pending]
+            if not turn:
+                return
+
+            for location_id in turn:
+                queue = self.queues[location_id]
+                if not queue:
+                    queue.extend(self.claim(location_id))
+                if not queue:
+                    continue
+                self.slots.acquire()
+                if self.stopped:
+                    self.slots.release()
+                    return
+                self.submit(queue.popleft(), location_id)
+
+    def claim(self, location_id):
+        """
+        Claim the next batch of jobs on a location. Polls of a location
+        without new jobs back off, and it is no longer pending.
+        """
+        jds = claim_import_jobs(location_id, limit=CLAIM_BATCH)
+        with self.lock:
+            interval = self.poll_interval[location_id]
+            if jds:
+                interval = POLL_INTERVAL
+            else:
+                self.pending.discard(location_id)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                logging.debug("Location %i is idle, next poll in %i s", location_id, interval)
+            self.poll_interval[location_id] = interval
+            self.next_poll[location_id] = time.monotonic() + interval
+        return jds
+
+    def submit(self, jd, location_id):
+        with self.lock:
+            created = self.created.pop(jd.id, None)
+            if created is not None:
+                latency = time.monotonic() - created
+            elif jd.create_ts:
+                # created by another process, create_ts is UTC truncated to
+                # the second, so this is up to a second late
+                latency = (datetime.utcnow() - datetime.strptime(
+                    jd.create_ts, '%Y-%m-%d %H:%M:%S')).total_seconds()
+            else:
+                latency = None
+            self.stats[location_id].start(latency)
+        future = self.executor.submit(run_import_job, jd, self.locations[location_id].metadata)
+        future.add_done_callback(functools.partial(self.done, jd, location_id))
+
+    def done(self, jd, location_id, future):
+        self.slots.release()
+        error = future.exception()
+        if error is not None:
+            fail_import_job(jd, "Import failed %s" % str(error))
+        with self.lock:
+            stats = self.stats[location_id]
+            stats.in_flight -= 1
+            stats.record(error is None and future.result())
+
+
+def _init_import_process(sql_path):
+    """
+    Give each import worker process a database engine of its own.
+    """
+    init(sql_path)
+
 
-def importing_loop(import_event, location):
+def run_import_job(jd, metadata):
     """
-    An import loop that will wait for import_event to be set
-    each iteration.
+    Run a claimed import job, creating its entry and marking it as done or
+    failed. `metadata` is the metadata of the job's location. Returns True
+    if the job is done.
     """
-    metadata = location.metadata
-    logging.info("Started importer thread for %i:%s", location.id, metadata.folder)
-    while True:
-        import_event.wait(30)
-        import_event.clear()
-
-        while True:
-            jd = pick_up_import_job(location.id)
-
-            if jd is None:
-                break
-
-            logging.debug("ImportJobDescriptor:\n%s", jd.to_json())
-
-            jd.analyse()
-            import_module = get_import_module(jd)
-
-            if import_module is None:
-                fail_import_job(jd, 
-                    "Could not find a suitable import module for MIME Type %s" % jd.mime_type
-                )
-                continue
-
-            try:
-                import_module.run()
-            except Exception as e:
-                fail_import_job(jd, 
-                    "Import failed %s" % str(e)
-                )
-                continue
-
-            ed = import_module.entry
-            ed.user_id = jd.user_id or import_module.user_id
-
-            if not jd.metadata:
-                jd.metadata = ImportJob.DefaultImportJobMetadata()
-
-            if jd.metadata.tags:
-                ed.tags = jd.metadata.tags
-            elif metadata.tags:
-                ed.tags = metadata.tags
-            ed.hidden = jd.metadata.hidden or metadata.hidden
-            ed.delete_ts = jd.metadata.delete_ts
-            ed.access = jd.metadata.access or metadata.access
-            ed.metadata = jd.metadata.metadata
-            ed.source = jd.metadata.source or metadata.source
-
-            logging.debug("EntryDescriptor:\n%s", ed.to_json())
-            
-            ed.state = Entry.State.online
-            ed = create_entry(ed, system=True)
-
-            if metadata.keep_original:
-                jd.state = ImportJob.State.keep
-            else:
-                jd.state = ImportJob.State.done
+    logging.debug("ImportJobDescriptor:\n%s", jd.to_json())
+
+    jd.analyse()
+    import_module = get_import_module(jd)
+
+    if import_module is None:
+        fail_import_job(jd, 
+            "Could not find a suitable import module for MIME Type %s" % jd.mime_type
+        )
+        return False
+
+    try:
+        import_module.run()
+    except Exception as e:
+        fail_import_job(jd, 
+            "Import failed %s" % str(e)
+        )
+        return False
+
+    ed = import_module.entry
+    ed.user_id = jd.user_id or import_module.user_id
+
+    if not jd.metadata:
+        jd.metadata = ImportJob.DefaultImportJobMetadata()
+
+    if jd.metadata.tags:
+        ed.tags = jd.metadata.tags
+    elif metadata.tags:
+        ed.tags = metadata.tags
+    ed.hidden = jd.metadata.hidden or metadata.hidden
+    ed.delete_ts = jd.metadata.delete_ts
+    ed.access = jd.metadata.access or metadata.access
+    ed.metadata = jd.metadata.metadata
+    ed.source = jd.metadata.source or metadata.source
+
+    logging.debug("EntryDescriptor:\n%s", ed.to_json())
+    
+    ed.state = Entry.State.online
+    ed = create_entry(ed, system=True)
+
+    try:
+        import_module.complete(ed.id)
+    except Exception as e:
+        fail_import_job(jd,
+            "Import of entry %i failed %s" % (ed.id, str(e))
+        )
+        return False
+
+    if metadata.keep_original:
+        jd.state = ImportJob.State.keep
+    else:
+        jd.state = ImportJob.State.done
+
+    jd.entry_id = ed.id
+    update_import_job_by_id(jd.id, jd)
+    logging.info("Import Job Done %s", jd.path)
+    return True
 
-            jd.entry_id = ed.id
-            update_import_job_by_id(jd.id, jd)
-            logging.info("Import Job Done %s", jd.path)
 
 def cleaning_loop(clean_event):
     """
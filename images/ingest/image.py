@@ -1,20 +1,56 @@
 """Take care of Image imports, exports and proxy generation"""
 
-import logging, os
+import logging, os, io
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import parent_process
+from threading import Lock
 from PIL import Image
 import exifread
 from datetime import datetime
 
 from .. import PROXY_SIZE, THUMB_SIZE, Entry, Location
 from ..import_job import GenericImportModule, register_import_module
-from ..localfile import FileCopy
-from ..entry import EntryDescriptor, FileDescriptor
+from ..localfile import FileCopy, file_version
+from ..entry import EntryDescriptor, FileDescriptor, set_entry_files
 from ..location import get_location_by_type
 from ..exif import exif_position, exif_orientation, exif_string, exif_int, exif_ratio
 from ..types import Property
 from ..metadata import register_metadata_schema
 
 
+# ANTIALIAS is called LANCZOS since Pillow 2.7 and the old name is gone in 10
+ANTIALIAS = getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+
+# The EXIF tags used by JPEGImportModule.analyse, everything else is skipped
+WANTED_EXIF_TAGS = (
+    "Image Artist",
+    "Image Copyright",
+    "Image Make",
+    "Image Model",
+    "Image Orientation",
+    "EXIF ColorSpace",
+    "EXIF ExifImageWidth",
+    "EXIF ExifImageLength",
+    "EXIF DateTime",
+    "EXIF DateTimeDigitized",
+    "EXIF DateTimeOriginal",
+    "EXIF ExposureTime",
+    "EXIF FNumber",
+    "EXIF Flash",
+    "EXIF FocalLength",
+    "EXIF FocalLengthIn35mmFilm",
+    "EXIF ISOSpeedRatings",
+    "EXIF Saturation",
+    "EXIF SubjectDistanceRange",
+    "GPS GPSLatitude",
+    "GPS GPSLatitudeRef",
+    "GPS GPSLongitude",
+    "GPS GPSLongitudeRef",
+    "Software",
+    "WhiteBalance",
+)
+
+
 class JPEGImportModule(GenericImportModule):
     def run(self):
         self.entry = EntryDescriptor()
@@ -25,7 +61,10 @@ class JPEGImportModule(GenericImportModule):
         self.proxy_location = get_location_by_type(Location.Type.proxy)
 
         self.copy_original()
-        phmd = JPEGMetadata(**(self.analyse()))
+        if self.wants_fast_thumbnail():
+            phmd = JPEGMetadata(**(self.analyse(wanted=WANTED_EXIF_TAGS + ('JPEGThumbnail',))))
+        else:
+            phmd = JPEGMetadata(**(self.analyse()))
 
         self.correct_folder(phmd)
 
@@ -36,8 +75,7 @@ class JPEGImportModule(GenericImportModule):
                                                mime=self.job_descriptor.mime_type))
 
         angle, mirror = phmd.Angle, phmd.Mirror
-        self.create_thumbnail(angle, mirror)
-        self.create_proxy(angle, mirror)
+        self.create_renditions(angle, mirror)
 
         self.entry.physical_metadata = phmd
 
@@ -69,33 +107,63 @@ class JPEGImportModule(GenericImportModule):
             self.image_path = filecopy.destination_full_path
             self.image_rel_path = filecopy.destination_rel_path
 
-    def create_thumbnail(self, angle, mirror):
+    def complete(self, entry_id):
+        """
+        Add the renditions that were still being rendered when the entry
+        was created: the proxy, and the thumbnail if it was replaced.
+        """
+        if self.rendition is not None:
+            fds = self.rendition.result()
+            if not self.replace_thumb:
+                fds = [fd for fd in fds if fd.purpose != FileDescriptor.Purpose.thumb]
+            set_entry_files(entry_id, fds)
+
+    def wants_fast_thumbnail(self):
+        """
+        Fast thumbnails are turned on for the import location, or for all
+        imports on the thumb location.
+        """
+        return bool(self.job_descriptor.location.metadata.fast_thumbnail
+                    or self.thumb_location.metadata.fast_thumbnail)
+
+    def create_renditions(self, angle, mirror):
+        """
+        Render the thumbnail and the proxy. With an embedded thumbnail, the
+        thumbnail is made from that right away and the entry is created
+        with it, and the proxy is added by complete once rendered. An
+        embedded thumbnail smaller than THUMB_SIZE is not scaled up; it is
+        kept as is until the thumbnail from the original replaces it.
+        """
         thumb_path = os.path.join(self.thumb_location.get_root(), self.image_rel_path)
-        create_thumbnail(self.image_path, thumb_path, angle=angle, mirror=mirror)
-        s = os.stat(thumb_path)
-        self.entry.files.append(FileDescriptor(path=self.image_rel_path,
-                                               size=s.st_size, created=datetime.fromtimestamp(s.st_ctime),
-                                               location_id=self.thumb_location.id,
-                                               purpose=FileDescriptor.Purpose.thumb,
-                                               mime="image/jpeg"))
-
-
-    def create_proxy(self, angle, mirror):
-        proxy_path = os.path.join(self.proxy_location.get_root(), self.image_rel_path)
-        convert(self.image_path, proxy_path, angle=angle, mirror=mirror)
-        s = os.stat(proxy_path)
-        self.entry.files.append(FileDescriptor(path=self.image_rel_path,
-                                               size=s.st_size, created=datetime.fromtimestamp(s.st_ctime),
-                                               location_id=self.proxy_location.id,
-                                               purpose=FileDescriptor.Purpose.proxy,
-                                               mime="image/jpeg"))
-
-    def analyse(self):
+        size = None
+        if self.embedded_thumbnail is not None and not os.path.exists(thumb_path):
+            size = _embedded_thumbnail(self.embedded_thumbnail, thumb_path, angle, mirror)
+        self.replace_thumb = size is not None and min(size) < THUMB_SIZE
+        self.rendition = get_rendition_engine().submit(
+            self.image_path, self.image_rel_path,
+            self.thumb_location, self.proxy_location,
+            angle=angle, mirror=mirror,
+            replace_thumb=self.replace_thumb,
+        )
+        if size is None:
+            self.entry.files.extend(self.rendition.result())
+            self.rendition = None
+        else:
+            self.entry.files.append(FileDescriptor(path=self.image_rel_path,
+                                                   size=os.path.getsize(thumb_path),
+                                                   location_id=self.thumb_location.id,
+                                                   purpose=FileDescriptor.Purpose.thumb,
+                                                   mime="image/jpeg",
+                                                   version=file_version(thumb_path)))
+
+    def analyse(self, wanted=WANTED_EXIF_TAGS):
         infile = self.image_path
         
         exif = None
         with open(infile, 'rb') as f:
-            exif = exifread.process_file(f)
+            exif = exifread.process_file(f, buffered=True, wanted=wanted)
+
+        self.embedded_thumbnail = exif.get('JPEGThumbnail')
 
         orientation, mirror, angle = exif_orientation(exif)
         lon, lat = exif_position(exif)
@@ -162,39 +230,213 @@ class JPEGMetadata(Entry.DefaultPhysicalMetadata):
 register_metadata_schema(JPEGMetadata)
 
 
+################################################################################
+# Rendition Engine (Singleton)
+
+
+class RenditionEngine(object):
+    """
+    A process pool that renders the proxy and the thumbnail of an original
+    image. Each original is decoded once, in a worker process, and both
+    renditions are derived from that decoded image.
+
+    With `workers` set to 0, jobs are rendered in the calling process.
+
+    There should only be one of these, see `get_rendition_engine`.
+    """
+    def __init__(self, workers=None):
+        if workers == 0:
+            logging.info("Setting up inline rendition engine.")
+            self.pool = None
+        else:
+            logging.info("Setting up rendition engine with %s workers.", workers or os.cpu_count())
+            self.pool = ProcessPoolExecutor(max_workers=workers)
+
+    def submit(self, path_in, path, thumb_location, proxy_location, angle=None, mirror=None,
+               replace_thumb=False):
+        """
+        Queue rendering of the original at `path_in`. The renditions are
+        stored at the relative `path` on the thumb and proxy locations.
+        With `replace_thumb`, an existing thumbnail is rendered again.
+        Returns a `Rendition`.
+        """
+        thumb_path = os.path.join(thumb_location.get_root(), path)
+        proxy_path = os.path.join(proxy_location.get_root(), path)
+        if self.pool is not None:
+            future = self.pool.submit(render, path_in, thumb_path, proxy_path,
+                                      angle=angle, mirror=mirror, replace_thumb=replace_thumb)
+        else:
+            future = Future()
+            try:
+                future.set_result(render(path_in, thumb_path, proxy_path,
+                                         angle=angle, mirror=mirror, replace_thumb=replace_thumb))
+            except Exception as e:
+                future.set_exception(e)
+        return Rendition(future, path, thumb_location, proxy_location)
+
+    def shutdown(self, wait=True):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait)
+
+
+class Rendition(object):
+    """
+    A pending rendering job from the `RenditionEngine`.
+    """
+    def __init__(self, future, path, thumb_location, proxy_location):
+        self.future = future
+        self.path = path
+        self.thumb_location = thumb_location
+        self.proxy_location = proxy_location
+
+    def result(self, timeout=None):
+        """
+        Wait for the renditions and return a list of `FileDescriptor`s,
+        thumbnail first.
+        """
+        ((thumb_size, thumb_ctime, thumb_version),
+         (proxy_size, proxy_ctime, proxy_version)) = self.future.result(timeout)
+        return [
+            FileDescriptor(path=self.path,
+                           size=thumb_size, created=datetime.fromtimestamp(thumb_ctime),
+                           location_id=self.thumb_location.id,
+                           purpose=FileDescriptor.Purpose.thumb,
+                           mime="image/jpeg", version=thumb_version),
+            FileDescriptor(path=self.path,
+                           size=proxy_size, created=datetime.fromtimestamp(proxy_ctime),
+                           location_id=self.proxy_location.id,
+                           purpose=FileDescriptor.Purpose.proxy,
+                           mime="image/jpeg", version=proxy_version),
+        ]
+
+
+_rendition_engine = None
+_rendition_engine_lock = Lock()
+
+
+def get_rendition_engine():
+    """
+    Get the process-wide `RenditionEngine` or create one with one worker
+    per core. In a child process, like a process pool import worker, the
+    engine renders inline instead of starting a pool of its own.
+    """
+    global _rendition_engine
+    with _rendition_engine_lock:
+        if _rendition_engine is None:
+            _rendition_engine = RenditionEngine(0 if parent_process() is not None else None)
+        return _rendition_engine
+
+
+def render(path_in, thumb_path, proxy_path, angle=None, mirror=None,
+           thumb_size=THUMB_SIZE, proxy_size=PROXY_SIZE, draft=True, replace_thumb=False):
+    """
+    Decode the image at `path_in` once and write the proxy and the
+    thumbnail from it. An existing thumbnail is kept, unless
+    `replace_thumb`. Runs in a worker process; returns (size, ctime,
+    version) for the thumbnail and the proxy.
+
+    With `draft`, JPEG originals are decoded directly at the smallest
+    scale that still covers the proxy.
+    """
+    _makedirs(proxy_path)
+    _makedirs(thumb_path)
+
+    im = Image.open(path_in)
+    try:
+        if draft:
+            _draft(im, _proxy_box(im.size, proxy_size))
+
+        # The proxy shrinks im in place, so the thumbnail is derived from
+        # the proxy sized image instead of the original.
+        with open(proxy_path, 'wb') as out:
+            _resize(im, _proxy_box(im.size, proxy_size), False, out, angle, mirror)
+        logging.info("Created image %s", proxy_path)
+
+        if os.path.exists(thumb_path) and not replace_thumb:
+            logging.debug("Thumbnail already exists, keeping")
+        else:
+            with open(thumb_path, 'wb') as out:
+                _resize(im, (thumb_size, thumb_size), True, out, angle, mirror)
+            logging.info("Created thumbnail %s", thumb_path)
+    finally:
+        im.close()
+
+    thumb_stat = os.stat(thumb_path)
+    proxy_stat = os.stat(proxy_path)
+    return (
+        (thumb_stat.st_size, thumb_stat.st_ctime, thumb_stat.st_mtime_ns),
+        (proxy_stat.st_size, proxy_stat.st_ctime, proxy_stat.st_mtime_ns),
+    )
+
+
 def create_thumbnail(path_in, path_out, override=False, size=THUMB_SIZE, angle=None, mirror=None):
     if os.path.exists(path_out) and not override:
         logging.debug("Thumbnail already exists, keeping")
         return
-    try:
-        os.makedirs(os.path.dirname(path_out))
-    except FileExistsError as e:
-        pass
-    with open(path_out, 'w') as out:
+    _makedirs(path_out)
+    with open(path_out, 'wb') as out:
         im = Image.open(path_in)
+        _draft(im, (size, size))
         _resize(im, (size, size), True, out, angle, mirror)
         im.close()
         logging.info("Created thumbnail %s", path_out)
 
 
 def convert(path_in, path_out, longest_edge=PROXY_SIZE, angle=None, mirror=None):
+    _makedirs(path_out)
+    with open(path_out, 'wb') as out:
+        im = Image.open(path_in)
+        box = _proxy_box(im.size, longest_edge)
+        _draft(im, box)
+        _resize(im, box, False, out, angle, mirror)
+        im.close()
+        logging.info("Created image %s", path_out)
+
+
+def _embedded_thumbnail(data, path_out, angle=None, mirror=None, size=THUMB_SIZE):
+    """
+    Write a thumbnail from embedded JPEG thumbnail data. One smaller than
+    the thumbnail box is cropped but not scaled up. Returns the size of
+    the embedded thumbnail, or None if it could not be read.
+    """
     try:
-        os.makedirs(os.path.dirname(path_out))
+        im = Image.open(io.BytesIO(data))
+        im.load()
+    except (IOError, SyntaxError):
+        logging.warning("Could not read embedded thumbnail for %s", path_out)
+        return None
+    _makedirs(path_out)
+    with open(path_out, 'wb') as out:
+        _resize(im, (size, size), True, out, angle, mirror)
+    logging.info("Created thumbnail %s from embedded thumbnail %s", path_out, im.size)
+    return im.size
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(os.path.dirname(path))
     except FileExistsError as e:
         pass
 
-    with open(path_out, 'w') as out:
-        im = Image.open(path_in)
-        width, height = im.size
-        if width > height:
-            scale = float(longest_edge) / float(width)
-        else:
-            scale = float(longest_edge) / float(height)
-        w = int(width * scale)
-        h = int(height * scale)
-        _resize(im, (w, h), False, out, angle, mirror)
-        im.close()
-        logging.info("Created image %s", path_out)
+
+def _draft(img, box):
+    """
+    Let the JPEG decoder scale the not yet loaded img by 1/2, 1/4 or 1/8,
+    picking the largest reduction that still covers box. Other formats,
+    like TIFF, are left for a full decode.
+    """
+    if img.format == 'JPEG':
+        img.draft(img.mode, box)
+        logging.debug("Drafted JPEG to %s for %s", img.size, box)
+
+
+def _proxy_box(size, longest_edge):
+    width, height = size
+    if width > height:
+        scale = float(longest_edge) / float(width)
+    else:
+        scale = float(longest_edge) / float(height)
+    return int(width * scale), int(height * scale)
 
 
 def _resize(img, box, fit, out, angle, mirror):
@@ -231,9 +473,9 @@ def _resize(img, box, fit, out, angle, mirror):
         img = img.crop((x1,y1,x2,y2))
 
     #Resize the image with best quality algorithm ANTI-ALIAS
-    img.thumbnail(box, Image.ANTIALIAS)
+    img.thumbnail(box, ANTIALIAS)
     if mirror == 'H':
-        img = img.transpose(Image.FLIP_RIGHT_LEFT)
+        img = img.transpose(Image.FLIP_LEFT_RIGHT)
     elif mirror == 'V':
         img = img.transpose(Image.FLIP_TOP_BOTTOM)
     if angle:
@@ -1,7 +1,9 @@
 """Helper classes for dealing with local file operations."""
 
 
-import os, errno, logging
+import os, stat, errno, logging, mimetypes
+from functools import lru_cache
+from bottle import request, response, HTTPError, http_date, parse_date, parse_range_header
 
 
 ################################################################################
@@ -93,3 +95,146 @@ class FileCopy(object):
         if not self.keep_original:
             logging.debug("Removing original %s", src)
             os.remove(src)
+
+
+################################################################################
+# File Serving
+
+
+# Cache-Control for files that never change under their url
+IMMUTABLE = 'private, max-age=31536000, immutable'
+
+# Cache-Control for other files, which are revalidated with their ETag
+REVALIDATE = 'private, no-cache'
+
+
+def file_etag(st):
+    """
+    A strong ETag for the file with the os.stat result `st`. It changes
+    whenever the file is replaced or written to.
+    """
+    return '"%x-%x-%x"' % (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def etag_matches(header, etag):
+    """
+    True if the If-None-Match `header` matches `etag`, weakly compared.
+    """
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip().lstrip('W/') for tag in header.split(','))
+
+
+class FileRange(object):
+    """
+    A file-like object for `length` bytes from `offset` of the open file
+    `f`. The file is positioned at `offset`, so that servers that send
+    wsgi.file_wrapper bodies with os.sendfile start there, and stop at the
+    end of the range going by the Content-Length.
+    """
+    def __init__(self, f, offset, length):
+        f.seek(offset)
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+@lru_cache(maxsize=256)
+def guess_type(extension):
+    """
+    The mimetype and encoding for files ending in `extension`.
+    """
+    return mimetypes.guess_type('file' + extension)
+
+
+def file_version(filename):
+    """
+    The version of a file that was just written, for its FileDescriptor.
+    """
+    return os.stat(filename).st_mtime_ns
+
+
+def serve_file(root, path, immutable=False):
+    """
+    Return the body for the file at `path` below `root`, for the current
+    request, setting the headers on the bottle response. Answers
+    If-None-Match and If-Modified-Since with 304, HEAD without a body, and
+    a single byte range, with If-Range, with 206.
+
+    The open file is the body, which bottle hands to the server's
+    wsgi.file_wrapper where there is one; servers like gunicorn send it
+    with os.sendfile, without copying it through Python.
+
+    With `immutable`, clients are told never to revalidate the file, so
+    it must only be used for urls that change when the file does.
+    """
+    root = os.path.abspath(root) + os.sep
+    filename = os.path.normpath(os.path.join(root, path.strip('/\\')))
+    if not filename.startswith(root):
+        return HTTPError(403, "Access denied.")
+    try:
+        st = os.stat(filename)
+    except (FileNotFoundError, NotADirectoryError):
+        return HTTPError(404, "File does not exist.")
+    if not stat.S_ISREG(st.st_mode):
+        return HTTPError(404, "File does not exist.")
+
+    etag = file_etag(st)
+    headers = response.headers
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(st.st_mtime)
+    headers['Cache-Control'] = IMMUTABLE if immutable else REVALIDATE
+    headers['Accept-Ranges'] = 'bytes'
+    mimetype, encoding = guess_type(os.path.splitext(filename)[1].lower())
+    if mimetype:
+        headers['Content-Type'] = mimetype
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    environ = request.environ
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            response.status = 304
+            return ''
+    elif 'HTTP_IF_MODIFIED_SINCE' in environ:
+        since = parse_date(environ['HTTP_IF_MODIFIED_SINCE'].split(';')[0].strip())
+        if since is not None and since >= int(st.st_mtime):
+            response.status = 304
+            return ''
+
+    size = st.st_size
+    offset, length = 0, size
+    if 'HTTP_RANGE' in environ and environ.get('HTTP_IF_RANGE', etag) == etag:
+        ranges = list(parse_range_header(environ['HTTP_RANGE'], size))
+        if not ranges:
+            headers['Content-Range'] = 'bytes */%i' % size
+            response.status = 416
+            return ''
+        offset, end = ranges[0]
+        length = end - offset
+        response.status = 206
+        headers['Content-Range'] = 'bytes %i-%i/%i' % (offset, end - 1, size)
+    headers['Content-Length'] = str(length)
+
+    if request.method == 'HEAD':
+        return ''
+    try:
+        f = open(filename, 'rb')
+    except PermissionError:
+        return HTTPError(403, "You do not have permission to access this file.")
+    except FileNotFoundError:
+        return HTTPError(404, "File does not exist.")
+    return FileRange(f, offset, length) if response.status_code == 206 else f
@@ -1,11 +1,16 @@
 
-import logging, datetime, os
+import logging, datetime, os, time
+from threading import Lock
 
 from . import api, Location, SCANNABLE, IMPORTABLE, EXPORTABLE
-from bottle import Bottle, auth_basic, static_file, request
+from bottle import Bottle, auth_basic, request, HTTPError
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.exc import NoResultFound
 from .types import PropertySet, Property
 from .user import authenticate, require_admin
 from .database import get_db
+from .localfile import serve_file
 from .metadata import wrap_raw_json
 
 
@@ -17,6 +22,9 @@ BASE = '/location'
 app = Bottle()
 api.register(BASE, app)
 
+# Locations of files rendered from an entry's primary file
+RENDITIONS = (Location.Type.thumb, Location.Type.proxy)
+
 
 @app.get('/')
 @auth_basic(authenticate)
@@ -69,14 +77,23 @@ def rest_update_location_by_id(id):
 @app.get('/<location_id>/dl/<path:path>')
 @auth_basic(authenticate)
 def rest_download(location_id, path):
-    location = get_location_by_id(location_id)
-    return static_file(path, root=location.metadata.folder)
+    try:
+        location = get_location_by_id(location_id)
+    except (NoResultFound, ValueError):
+        return HTTPError(404, "No such location.")
+    # v is the version of the rendition, which changes when it is written
+    immutable = bool(request.query.v) and location.type in RENDITIONS
+    return serve_file(location.metadata.folder, path, immutable=immutable)
 
 
-def get_download_url(location_id, path):
+def get_download_url(location_id, path, version=None):
     """
-    Return a physical download url for a file on a location.
+    Return a physical download url for a file on a location. The
+    `version` must change whenever the file does, see FileDescriptor, and
+    makes downloads of thumbnails and proxies cacheable for good.
     """
+    if version:
+        return "%s/%i/dl/%s?v=%s" % (BASE, location_id, path, version)
     return "%s/%i/dl/%s" % (BASE, location_id, path)
 
 api.url().location += get_download_url
@@ -150,24 +167,42 @@ class LocationDescriptorFeed(PropertySet):
 
 
 def get_location_by_id(id):
-    with get_db().transaction() as t:
-        location = t.query(Location).filter(Location.id==id).one()
-        return LocationDescriptor.map_in(location)
+    locations = _get_registry()
+    if locations is None:
+        with get_db().read_transaction() as t:
+            location = t.query(Location).filter(Location.id==id).one()
+            return LocationDescriptor.map_in(location)
+    try:
+        return locations[int(id)]
+    except KeyError:
+        raise NoResultFound("No location with id %s" % id)
 
 
 def get_location_by_name(name):
-    with get_db().transaction() as t:
-        location = t.query(Location).filter(Location.name==name).one()
-        return LocationDescriptor.map_in(location)
+    locations = _get_registry()
+    if locations is None:
+        with get_db().read_transaction() as t:
+            location = t.query(Location).filter(Location.name==name).one()
+            return LocationDescriptor.map_in(location)
+    for location in locations.values():
+        if location.name == name:
+            return location
+    raise NoResultFound("No location named %s" % name)
 
 
 def get_locations_by_type(*types):
-    with get_db().transaction() as t:
-        locations = t.query(Location).filter(Location.type.in_(types)).all()
-        return LocationDescriptorFeed(
-            count=len(locations),
-            entries=[LocationDescriptor.map_in(location) for location in locations]
-        )
+    locations = _get_registry()
+    if locations is None:
+        with get_db().read_transaction() as t:
+            locations = {
+                location.id: LocationDescriptor.map_in(location)
+                for location in t.query(Location).filter(Location.type.in_(types))
+            }
+    entries = [location for location in locations.values() if location.type in types]
+    return LocationDescriptorFeed(
+        count=len(entries),
+        entries=entries
+    )
 
 
 def get_location_by_type(type):
@@ -176,13 +211,7 @@ def get_location_by_type(type):
 
 
 def get_locations():
-    with get_db().transaction() as t:
-        locations = t.query(Location).all()
-
-        return LocationDescriptorFeed(
-            count=len(locations),
-            entries=[LocationDescriptor.map_in(location) for location in locations]
-        )
+    return get_locations_by_type(*Location.Type)
 
 
 def delete_file_on_location(location, path):
@@ -201,6 +230,7 @@ def create_location(ld):
         t.commit()
         id = location.id
 
+    invalidate_locations()
     return get_location_by_id(id)
 
 
@@ -210,9 +240,88 @@ def update_location_by_id(id, ld):
         location = q.one()
         ld.map_out(location)
 
+    invalidate_locations()
     return get_location_by_id(id)
 
 
 def delete_location_by_id(id):
     with get_db().transaction() as t:
         q = t.query(Location).filter(Location.id==id).delete()
+
+    invalidate_locations()
+
+
+################################################################################
+# Location Registry
+
+
+# Locations are reloaded at least this often, in seconds, for the changes
+# made by other processes
+LOCATION_REGISTRY_TTL = 60
+
+_registry = None  # (database, monotonic time, {id: LocationDescriptor})
+_registry_generation = 0
+_registry_lock = Lock()
+
+
+def _get_registry():
+    """
+    All locations by id, loaded once and shared by all threads until
+    invalidate_locations is called. The descriptors must not be changed.
+
+    Returns None inside a write transaction, where the locations are
+    looked up in its session instead, as it may change them.
+    """
+    global _registry
+    db = get_db()
+    if db.in_transaction():
+        return None
+    registry = _registry
+    if (registry is not None and registry[0] is db
+            and time.monotonic() - registry[1] < LOCATION_REGISTRY_TTL):
+        return registry[2]
+
+    generation = _registry_generation
+    loaded = time.monotonic()
+    with db.read_transaction() as t:
+        locations = {
+            location.id: LocationDescriptor.map_in(location)
+            for location in t.query(Location).order_by(Location.id)
+        }
+    with _registry_lock:
+        # Not kept if the locations changed while they were loaded
+        if generation == _registry_generation:
+            _registry = (db, loaded, locations)
+    logging.debug("Loaded %i locations.", len(locations))
+    return locations
+
+
+def invalidate_locations():
+    """
+    Forget the loaded locations. Done automatically when a transaction
+    that wrote a location through the ORM is committed; bulk updates have
+    to call this themselves.
+    """
+    global _registry, _registry_generation
+    with _registry_lock:
+        _registry = None
+        _registry_generation += 1
+
+
+@event.listens_for(Location, 'after_insert')
+@event.listens_for(Location, 'after_update')
+@event.listens_for(Location, 'after_delete')
+def _location_written(mapper, connection, location):
+    # Until the commit, other threads still read the locations as they were
+    object_session(location).info['locations_written'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _session_committed(session):
+    if session.info.pop('locations_written', False):
+        invalidate_locations()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _session_rolled_back(session):
+    session.info.pop('locations_written', None)
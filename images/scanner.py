@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 
-import os, logging
-from threading import Thread, Event
+import os, logging, time
+from threading import Thread, Event, Lock
 from bottle import Bottle, auth_basic
 
-from . import api, Location, SCANNABLE
+from . import api, inotify, Location, ScanState, SCANNABLE
 from .database import get_db
 from .location import LocationDescriptor, get_locations_by_type
-from .import_job import ImportJobDescriptor, create_import_job
+from .import_job import ImportJobDescriptor, create_import_job, create_import_jobs
 from .metadata import wrap_raw_json
 from .user import authenticate, no_guests
 
@@ -78,6 +78,252 @@ class FolderScanner(object):
                         yield p
 
 
+################################################################################
+# Incremental Folder Scanner
+
+
+# Every this many scans, look into unchanged folders too
+FULL_SCAN_EVERY = 120
+
+# Number of scanned files to create import jobs for at once
+SCAN_BATCH = 1000
+
+# Seconds to wait before watching again after the watcher failed
+WATCH_RETRY = 10
+
+
+class IncrementalScanner(FolderScanner):
+    """
+    A folder scanner that remembers (size, mtime, inode) of every file and
+    the mtime of every folder in the scan_state table, and only yields
+    files that are new or changed since the last scan.
+
+    Folders whose mtime hasn't changed have had no files added, removed or
+    renamed, so they are not listed again; their known subfolders are
+    still visited. A file rewritten in place in such a folder is only
+    found by a full scan.
+    """
+    def __init__(self, basepath, location_id, ext=None):
+        super().__init__(basepath, ext=ext)
+        self.location_id = location_id
+        self.state = None
+        self.lock = Lock()  # held while scanning, the scanner is shared between threads
+
+    def load(self):
+        with get_db().transaction() as t:
+            rows = t.query(ScanState).filter(ScanState.location_id == self.location_id).all()
+            self.state = {
+                row.path: (row.is_dir, row.size, row.mtime, row.inode)
+                for row in rows
+            }
+
+    def scan(self, full=False):
+        """
+        Yield relative paths of new and changed files. The generator
+        returns the new state, for save once the files have been taken
+        care of; until then, later scans find them again.
+        """
+        if self.state is None:
+            self.load()
+        old = self.state
+        new = {}
+        children = {}
+        for path, state in old.items():
+            if path:
+                children.setdefault(os.path.dirname(path), []).append(path)
+
+        stack = ['']
+        while stack:
+            folder = stack.pop()
+            try:
+                st = os.stat(os.path.join(self.basepath, folder))
+            except FileNotFoundError:
+                continue
+            state = (True, None, st.st_mtime, st.st_ino)
+            new[folder] = state
+            if not full and old.get(folder) == state:
+                for path in children.get(folder, ()):
+                    new[path] = old[path]
+                    if old[path][0]:
+                        stack.append(path)
+                continue
+
+            try:
+                it = os.scandir(os.path.join(self.basepath, folder))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with it:
+                for entry in it:
+                    path = os.path.join(folder, entry.name)
+                    if path.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        if self.ext and entry.name.split('.')[-1].lower() not in self.ext:
+                            continue
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    state = (False, st.st_size, st.st_mtime, st.st_ino)
+                    new[path] = state
+                    if old.get(path) != state:
+                        yield path
+
+        return new
+
+    def scan_batches(self, size, full=False):
+        """
+        Like scan, but yield lists of at most `size` paths, and save the
+        state when the next list is asked for after the last one, that is
+        once the caller is done with all of them. A scan that is abandoned
+        half way, or fails, is simply done over.
+        """
+        scan = self.scan(full=full)
+        batch = []
+        while True:
+            try:
+                batch.append(next(scan))
+            except StopIteration as stop:
+                new = stop.value
+                break
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        self.save(new)
+
+    def save(self, new):
+        old = self.state
+        removed = [path for path in old if path not in new]
+        changed = [
+            dict(location_id=self.location_id, path=path,
+                 is_dir=state[0], size=state[1], mtime=state[2], inode=state[3])
+            for path, state in new.items()
+            if old.get(path) != state
+        ]
+        if not removed and not changed:
+            return
+        logging.debug("Saving scan state for location %i, %i changed, %i removed",
+                      self.location_id, len(changed), len(removed))
+        with get_db().transaction() as t:
+            for n in range(0, len(removed), 500):
+                t.query(ScanState).filter(
+                    ScanState.location_id == self.location_id,
+                    ScanState.path.in_(removed[n:n + 500]),
+                ).delete(synchronize_session=False)
+            stale = [c['path'] for c in changed if c['path'] in old]
+            for n in range(0, len(stale), 500):
+                t.query(ScanState).filter(
+                    ScanState.location_id == self.location_id,
+                    ScanState.path.in_(stale[n:n + 500]),
+                ).delete(synchronize_session=False)
+            t.bulk_insert_mappings(ScanState, changed)
+            t.commit()
+        self.state = new
+
+
+################################################################################
+# Live Folder Watcher
+
+
+# Set when the kernel event queue overflowed and events were lost
+OVERFLOW = None
+
+WATCH_MASK = (
+    inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM |
+    inotify.IN_CREATE | inotify.IN_DELETE_SELF | inotify.IN_ONLYDIR
+)
+
+
+class FolderWatcher(object):
+    """
+    Watches a folder tree with inotify and yields the relative path of
+    every file that is closed after writing or moved in. Folders created
+    or moved in are watched as they appear, and the files already in them
+    are yielded.
+
+    When the kernel queue overflows events are lost and OVERFLOW is
+    yielded; the caller should rescan.
+    """
+    def __init__(self, basepath, ext=None):
+        self.basepath = basepath
+        self.ext = ext
+        self.inotify = inotify.Inotify()
+        self.folders = {}  # wd -> relative path of folder
+        self.add_folder('')
+
+    def add_folder(self, folder):
+        """
+        Watch `folder` and its subfolders, and return the files in them.
+        """
+        found = []
+        for r, ds, fs in os.walk(os.path.join(self.basepath, folder)):
+            relative = os.path.relpath(r, self.basepath)
+            relative = '' if relative == '.' else relative
+            if relative.startswith('.'):
+                ds[:] = []
+                continue
+            try:
+                wd = self.inotify.add_watch(r, WATCH_MASK)
+            except OSError as e:
+                logging.warning("Could not watch %s (%s)", r, str(e))
+                ds[:] = []
+                continue
+            self.folders[wd] = relative
+            found.extend(os.path.join(relative, f) for f in fs)
+        return [path for path in found if self.wanted(path)]
+
+    def remove_folder(self, folder):
+        prefix = folder + os.sep
+        for wd, path in list(self.folders.items()):
+            if path == folder or path.startswith(prefix):
+                self.inotify.rm_watch(wd)
+                del self.folders[wd]
+
+    def wanted(self, path):
+        if path.startswith('.'):
+            return False
+        return not self.ext or path.split('.')[-1].lower() in self.ext
+
+    def watch(self, timeout=None):
+        """
+        Yield paths as files arrive. Returns when no event has arrived for
+        `timeout` seconds, never if it is None.
+        """
+        while True:
+            events = self.inotify.read(timeout)
+            if not events:
+                return
+            for event in events:
+                if event.mask & inotify.IN_Q_OVERFLOW:
+                    logging.warning("Watch queue overflow in %s", self.basepath)
+                    yield OVERFLOW
+                    continue
+                folder = self.folders.get(event.wd)
+                if folder is None:
+                    continue
+                if event.mask & inotify.IN_IGNORED:
+                    del self.folders[event.wd]
+                    continue
+                path = os.path.join(folder, event.name)
+                if event.mask & inotify.IN_ISDIR:
+                    if event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                        yield from self.add_folder(path)
+                    elif event.mask & inotify.IN_MOVED_FROM:
+                        self.remove_folder(path)
+                elif event.mask & (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO):
+                    if self.wanted(path):
+                        yield path
+
+    def close(self):
+        self.inotify.close()
+
+
 ################################################################################
 # Threaded Scanner Manager (Singleton)
 
@@ -87,6 +333,10 @@ class ScannerManager(object):
     A Thread+Event based Scanner Manager that keeps one thread per folder
     and trigs a new scan upon the trig method being called.
 
+    Locations with the watch option also get a watcher thread, which
+    creates import jobs as files arrive. The periodic scan goes on as a
+    safety net.
+
     There should only be one of these.
     """
     def __init__(self):
@@ -97,10 +347,25 @@ class ScannerManager(object):
             logging.debug("Setting up scanner thread [Scanner%i]", location.id)
             event = Event()
             self.events[location.id] = event
+            scanner = IncrementalScanner(location.metadata.folder, location.id, ext=None)
             thread = Thread(
                 target=scanning_loop,
                 name="Scanner%i" % (location.id),
-                args=(event, location)
+                args=(event, location, scanner)
+            )
+            thread.daemon = True
+            thread.start()
+
+            if not location.metadata.watch:
+                continue
+            if not inotify.available():
+                logging.warning("Can't watch location %i, inotify is not available", location.id)
+                continue
+            logging.debug("Setting up watcher thread [Watcher%i]", location.id)
+            thread = Thread(
+                target=watching_loop,
+                name="Watcher%i" % (location.id),
+                args=(location, scanner)
             )
             thread.daemon = True
             thread.start()
@@ -113,23 +378,75 @@ class ScannerManager(object):
         event.set()
                 
 
-def scanning_loop(scan_event, location):
+def scanning_loop(scan_event, location, scanner=None):
     """
-    A scanning loop using FolderScanner. Will wait for scan_event to be set
-    each iteration.
+    A scanning loop using IncrementalScanner. Will wait for scan_event to be
+    set each iteration. A trigged scan, and every FULL_SCAN_EVERY:th scan,
+    looks into all folders.
     """
     metadata = location.metadata
     logging.info("Started scanner thread for %i:%s", location.id, metadata.folder)
+    scanner = scanner or IncrementalScanner(metadata.folder, location.id, ext=None)
+    count = 0
     while True:
-        scanner = FolderScanner(metadata.folder, ext=None)
-
-        scan_event.wait(30)
+        full = scan_event.wait(30) or count % FULL_SCAN_EVERY == 0
         scan_event.clear()
+        count += 1
+
+        try:
+            with scanner.lock:
+                create_scanned_import_jobs(location, scanner, full=full)
+        except Exception as e:
+            logging.error("Scan of location %i failed (%s)", location.id, str(e))
+
+
+def watching_loop(location, scanner):
+    """
+    A watching loop using FolderWatcher. After a queue overflow, the
+    folder is rescanned with the (shared) IncrementalScanner. Files that
+    fail are left for the periodic scan.
+    """
+    metadata = location.metadata
+    logging.info("Started watcher thread for %i:%s", location.id, metadata.folder)
+    watcher = FolderWatcher(metadata.folder, ext=None)
+    while True:
+        try:
+            for filepath in watcher.watch():
+                try:
+                    if filepath is OVERFLOW:
+                        with scanner.lock:
+                            create_scanned_import_jobs(location, scanner)
+                    else:
+                        create_scanned_import_job(location, filepath)
+                except Exception as e:
+                    logging.error("Watcher of location %i failed on %s (%s)",
+                                  location.id, filepath or 'overflow', str(e))
+        except Exception as e:
+            logging.error("Watcher of location %i failed (%s)", location.id, str(e))
+            time.sleep(WATCH_RETRY)
+
+
+def create_scanned_import_job(location, filepath):
+    jd = ImportJobDescriptor(
+        path=filepath,
+        location=LocationDescriptor(id=location.id),
+        user_id=location.metadata.user_id
+    )
+    return create_import_job(jd)
 
-        for filepath in scanner.scan():
-            jd = ImportJobDescriptor(
+
+def create_scanned_import_jobs(location, scanner, full=False):
+    """
+    Scan `location` with `scanner` and create import jobs for the files
+    found, SCAN_BATCH at a time. The scan state is saved only after the
+    last batch is committed.
+    """
+    for filepaths in scanner.scan_batches(SCAN_BATCH, full=full):
+        create_import_jobs([
+            ImportJobDescriptor(
                 path=filepath,
                 location=LocationDescriptor(id=location.id),
-                user_id=metadata.user_id
+                user_id=location.metadata.user_id
             )
-            create_import_job(jd)
+            for filepath in filepaths
+        ])
@@ -4,6 +4,7 @@ import sys, os, logging, configparser
 from .database import init, password_hash
 from . import Location, User, Tag
 from .location import get_location_by_name, update_location_by_id
+from .entry import backfill_entry_tags, backfill_taken_ts
 
 class Setup:
     def __init__(self, config_path, debug=False):
@@ -26,6 +27,10 @@ class Setup:
     def create_database_tables(self):
         logging.info("Creating tables...")
         self.db.create_all()
+        logging.info("Upgrading tables...")
+        self.db.upgrade_all()
+        backfill_entry_tags()
+        backfill_taken_ts()
 
     def add_users(self):
         logging.info("Setting up users...")
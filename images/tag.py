@@ -209,7 +209,7 @@ class TagDescriptorFeed(PropertySet):
 
 
 def get_tags():
-    with get_db().transaction() as t:
+    with get_db().read_transaction() as t:
         tags = t.query(Tag).order_by(Tag.id).all()
 
         return TagDescriptorFeed(
@@ -227,7 +227,7 @@ def get_tags():
 
 
 def get_tag_by_id(id):
-    with get_db().transaction() as t:
+    with get_db().read_transaction() as t:
         tag = t.query(Tag).filter(Tag.id==id).one()
 
         return TagDescriptor(
@@ -1,6 +1,12 @@
 import json
+from enum import Enum
 from .metadata import wrap_dict, wrap_raw_json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 class Property(object):
     def __init__(self, type=str, name=None, default=None, enum=None,
                  required=False, validator=None, wrap=False, none=None):
@@ -34,14 +40,23 @@ class Property(object):
                 value = getattr(model_instance, self.attr_name)
                 if value is None:
                     return self.none
+                elif self.wrap and isinstance(value, str):
+                    # Raw JSON is decoded on first access
+                    value = wrap_raw_json(value)
+                    setattr(model_instance, self.attr_name, value)
+                    return value
                 else:
                     return value
             except AttributeError:
                 return self.default
     
     def __set__(self, model_instance, value):
-        value = self.validate(value)
+        value = self.coerce(value)
         setattr(model_instance, self.attr_name, value)
+
+    def coerce(self, value):
+        # Replaced by compile() when the class is created
+        return self.validate(value)
     
     def is_empty(self, value):
         return value is None
@@ -60,12 +75,10 @@ class Property(object):
         except AttributeError:
             pass
 
-        # PropertySet - Wrapped
+        # PropertySet - Wrapped, raw JSON is kept until first access
         if self.wrap:
             if isinstance(value, dict):
                 value = wrap_dict(value)
-            elif isinstance(value, str):
-                value = wrap_raw_json(value)
 
         # PropertySet - Direct
         elif issubclass(self.type, PropertySet) and isinstance(value, dict):
@@ -95,6 +108,70 @@ class Property(object):
 
         return value
     
+    def compile(self):
+        """
+        Return a function that does what validate does for this property,
+        with the checks that can't apply to it left out. Required and
+        externally validated properties keep the full validate.
+        """
+        if self.required or callable(self.validator):
+            return self.validate
+
+        type_ = self.type
+        if self.wrap:
+            if type_ is bool:
+                return self.validate
+            def convert(value):
+                return wrap_dict(value) if isinstance(value, dict) else value
+        elif type_ is bool:
+            convert = _to_bool
+        elif issubclass(type_, PropertySet):
+            def convert(value):
+                return type_(value) if isinstance(value, dict) else value
+        elif self.enum:
+            convert = self.enum
+        elif type_ is int or type_ is float or type_ is str:
+            convert = type_
+        else:
+            return _unchanged
+
+        def coerce(value):
+            if value is None:
+                return None
+            return convert(value)
+        return coerce
+
+    def compile_get(self):
+        """
+        Return a function that does what __get__ does for an instance.
+        """
+        attr_name = self.attr_name
+        if self.type in (dict, list):
+            type_ = self.type
+            default = self.default
+            def get(model_instance):
+                try:
+                    return getattr(model_instance, attr_name)
+                except AttributeError:
+                    value = type_() if default is None else type_(default)
+                    setattr(model_instance, attr_name, value)
+                    return value
+            return get
+
+        if self.wrap:
+            return lambda model_instance: self.__get__(model_instance, None)
+
+        none = self.none
+        default = self.default
+        def get(model_instance):
+            value = getattr(model_instance, attr_name, _missing)
+            if value is None:
+                return none
+            if value is _missing:
+                return default
+            return value
+        return get
+
     @property
     def attr_name(self):
         return '_' + self.name
@@ -150,21 +227,135 @@ def _initialize_properties(model_class, name, bases, dct):
     )
 
 
+_missing = object()
+
+
+def _to_bool(value):
+    try:
+        if value.lower() in ('yes', 'no', 'true', 'false', '1', '0'):
+            return value in ('yes', 'true', '1')
+    except AttributeError:
+        pass
+    return value
+
+
+def _unchanged(value):
+    return value
+
+
+def _property_slots(bases, dct):
+    """
+    The __slots__ for a class: one per property declared in it.
+    """
+    return tuple(
+        '_' + (attr.name or attr_name)
+        for attr_name, attr in dct.items()
+        if isinstance(attr, Property)
+    )
+
+
+def _compile_properties(model_class, dct):
+    """
+    Give the class a from_dict, to_dict and to_plain specialized for its
+    properties, unless it defines its own.
+    """
+    properties = [model_class._properties[name] for name in model_class._properties]
+    for prop in properties:
+        prop.coerce = prop.compile()
+    setters = tuple((prop.name, prop.attr_name, prop.coerce) for prop in properties)
+    getters = tuple((prop.name, prop.compile_get()) for prop in properties)
+    schema = model_class.__name__
+
+    def from_dict(self, dct):
+        for name, attr_name, coerce in setters:
+            if name in dct:
+                setattr(self, attr_name, coerce(dct[name]))
+
+    def to_dict(self):
+        if self._projection:
+            return PropertySet.to_dict(self)
+        dct = {name: get(self) for name, get in getters}
+        dct['*schema'] = schema
+        return dct
+
+    def to_plain_(self):
+        if self._projection:
+            return PropertySet.to_plain(self)
+        dct = {name: to_plain(get(self)) for name, get in getters}
+        dct['*schema'] = schema
+        return dct
+
+    for method_name, method in (('from_dict', from_dict), ('to_dict', to_dict), ('to_plain', to_plain_)):
+        if method_name not in dct:
+            setattr(model_class, method_name, method)
+
+
 class ClassWithProperties(type):
+    def __new__(mcs, name, bases, dct):
+        if '__slots__' not in dct:
+            dct = dict(dct, __slots__=_property_slots(bases, dct))
+        return super(ClassWithProperties, mcs).__new__(mcs, name, bases, dct)
+
     def __init__(cls, name, bases, dct):
         super(ClassWithProperties, cls).__init__(name, bases, dct)
         _initialize_properties(cls, name, bases, dct)
+        if name != 'PropertySet':
+            _compile_properties(cls, dct)
         
 
 class PropertySet(metaclass=ClassWithProperties):
+    """
+    Values are kept in __slots__ made from the declared properties. Other
+    attributes can still be set, and go in the instance __dict__, which
+    is only allocated when that happens.
+    """
+    __slots__ = (
+        '_projection',  # names of the properties to serialize, None for all
+        '__dict__',
+    )
+
     def __init__(self, *args, **values):
+        self._projection = None
         if len(args) == 1:
             self.from_dict(args[0])
         for key, value in values.items():
             setattr(self, key, value)
 
-    def to_json(self, pretty=True):
-        return json.dumps(self, default=lambda x: x.to_dict(), indent=(2 if pretty else None), sort_keys=True)
+    def to_json(self, pretty=False):
+        """
+        Serialize to JSON, compact unless `pretty`. Uses orjson when it is
+        installed.
+        """
+        return dumps(self.to_plain(), pretty=pretty)
+
+    def to_plain(self):
+        """
+        Like to_dict, but with nested property sets, lists and dicts
+        turned into plain values all the way down.
+        """
+        dct = {}
+        for attr_name in self._projection or self._all_properties:
+            dct[attr_name] = to_plain(getattr(self, attr_name))
+        dct['*schema'] = self.__class__.__name__
+        return dct
+
+    def to_json_stream(self, items, key='entries'):
+        """
+        Yield the JSON of this feed in pieces, with the list property `key`
+        taken from the iterable `items` one item at a time. The count
+        property, if any, is set from the number of items.
+        """
+        dct = self.to_dict()
+        del dct[key]
+        yield '{"%s":[' % key
+        count = 0
+        for item in items:
+            yield (',' if count else '') + item.to_json()
+            count += 1
+        if 'count' in dct:
+            dct['count'] = count
+        tail = dumps(to_plain(dct))
+        yield '],' + tail[1:] if len(dct) else ']}'
 
     def from_json(self, json_string):
         if json_string is None:
@@ -172,17 +363,20 @@ class PropertySet(metaclass=ClassWithProperties):
         else:
             self.from_dict(json.loads(json_string))
 
+    # The generic from_dict, to_dict and to_plain below are replaced by
+    # specialized ones for each subclass, see _compile_properties.
+
     def to_dict(self):
         dct = {}
-        for attr_name in self._all_properties:
+        for attr_name in self._projection or self._all_properties:
             dct[attr_name] = getattr(self, attr_name)
         dct['*schema'] = self.__class__.__name__
         return dct
 
     def from_dict(self, dct):
-        for attr_name in self._all_properties:
-            if attr_name in dct:
-                setattr(self, attr_name, dct.get(attr_name)) 
+        for name, prop in self._properties.items():
+            if prop.name in dct:
+                setattr(self, prop.attr_name, prop.validate(dct[prop.name]))
 
     def from_row(self, row):
         raise NotImplemented
@@ -202,6 +396,36 @@ class PropertySet(metaclass=ClassWithProperties):
 
 
 
+def to_plain(value):
+    """
+    Turn `value` into something json can serialize without a default
+    callback.
+    """
+    if value is None or type(value) in (str, int, float, bool):
+        return value
+    if isinstance(value, PropertySet):
+        return value.to_plain()
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def dumps(value, pretty=False):
+    """
+    JSON from plain values, as made by to_plain.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2 if pretty else 0
+        return orjson.dumps(value, option=option).decode()
+    if pretty:
+        return json.dumps(value, indent=2, sort_keys=True)
+    return json.dumps(value, separators=(',', ':'))
+
+
 def strip(dct, prefix):
     if prefix is None:
         return dct
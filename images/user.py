@@ -1,6 +1,10 @@
 
-import logging, functools
+import logging, functools, hashlib, hmac, os, time
+from collections import OrderedDict
+from threading import Lock
 from bottle import Bottle, auth_basic, request, HTTPError
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
 from sqlalchemy.orm.exc import NoResultFound
 from enum import IntEnum, unique
 from .types import PropertySet, Property, strip
@@ -13,30 +17,143 @@ app = Bottle()
 api.register(BASE, app)
 
 
+# Credentials that recently logged in are trusted this long, in seconds
+CREDENTIAL_CACHE_SIZE = 1024
+CREDENTIAL_CACHE_TTL = 300
+
+
 def authenticate(username, password):
     """
     Bottle-compatible simple-checker that stores the user descriptor
     of the currently logged in user onto the request.
+
+    Successful logins are cached for CREDENTIAL_CACHE_TTL seconds, keyed
+    on a keyed hash of the credentials, so that a page of thumbnails
+    doesn't look the user up once per image. The user descriptor is then
+    shared by all requests of the user, and must not be changed.
     """
-    with get_db().transaction() as t:
-        try:
-            user = (t.query(User)
+    key = credential_key(username, password)
+    user = get_cached_credentials(key)
+    if user is None:
+        generation = _credential_generation
+        with get_db().read_transaction() as t:
+            try:
+                user = UserDescriptor.map_in(
+                    t.query(User)
                      .filter(User.name==username)
                      .filter(User.password==password_hash(password))
                      .filter(User.status==User.Status.enabled)
                      .one())
+            except NoResultFound:
+                return False
+        cache_credentials(key, user, generation)
+
+    request.user = user
+    logging.debug("Logged in as %s", user.name)
+    return True
+
+
+################################################################################
+# Credential Cache
+
+
+_credential_secret = os.urandom(32)  # never leaves the process
+_credential_cache = OrderedDict()  # key -> (monotonic time, UserDescriptor)
+_credential_generation = 0  # counts invalidations
+_credential_lock = Lock()
+_credential_stats = {'hits': 0, 'misses': 0}
+
+
+def credential_key(username, password):
+    """
+    A keyed hash of the credentials, so that no password is kept in memory.
+    """
+    message = ('%s\0%s' % (username, password)).encode('utf8')
+    return hmac.new(_credential_secret, message, hashlib.sha256).digest()
+
+
+def get_cached_credentials(key):
+    """
+    Return the cached user descriptor for `key`, or None. It is shared
+    and must not be changed.
+    """
+    now = time.monotonic()
+    with _credential_lock:
+        cached = _credential_cache.get(key)
+        if cached is not None and now - cached[0] < CREDENTIAL_CACHE_TTL:
+            _credential_stats['hits'] += 1
+            return cached[1]
+        _credential_stats['misses'] += 1
+        return None
+
+
+def cache_credentials(key, user, generation):
+    """
+    Cache the user descriptor for `key`, unless the credentials have been
+    invalidated since `generation`, the value of _credential_generation
+    before the user was read, as it may be out of date then.
+    """
+    with _credential_lock:
+        if generation != _credential_generation:
+            return
+        _credential_cache[key] = (time.monotonic(), user)
+        _credential_cache.move_to_end(key)
+        while len(_credential_cache) > CREDENTIAL_CACHE_SIZE:
+            _credential_cache.popitem(last=False)
+
+
+def invalidate_credentials(user_id=None):
+    """
+    Forget the cached credentials of a user, or of all users. Done
+    automatically when a transaction that wrote a user through the ORM is
+    committed; bulk updates have to call this themselves.
+    """
+    global _credential_generation
+    with _credential_lock:
+        _credential_generation += 1
+        if user_id is None:
+            _credential_cache.clear()
+            return
+        for key, (ts, user) in list(_credential_cache.items()):
+            if user.id == user_id:
+                del _credential_cache[key]
+
+
+def get_credential_cache_stats():
+    """
+    Size, hits, misses and hit rate of the credential cache, for GET /import.
+    """
+    with _credential_lock:
+        hits, misses = _credential_stats['hits'], _credential_stats['misses']
+        return {
+            'size': len(_credential_cache),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_written(mapper, connection, user):
+    # Until the commit, other sessions still read the user as it was
+    object_session(user).info.setdefault('written_user_ids', set()).add(user.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _session_committed(session):
+    for user_id in session.info.pop('written_user_ids', ()):
+        invalidate_credentials(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _session_rolled_back(session):
+    session.info.pop('written_user_ids', None)
+
 
-            request.user = UserDescriptor(
-                id=user.id,
-                status=User.Status(user.status),
-                name=user.name,
-                fullname=user.fullname,
-                user_class=User.Class(user.user_class)
-            )
-            logging.debug("Logged in as %s", user.name)
-            return True
-        except NoResultFound:
-            return False
+################################################################################
+# Decorators
 
 
 def require_admin(realm="private"):
@@ -154,7 +271,7 @@ def require_user_id(user_id):
 
 
 def get_user_by_id(user_id):
-    with get_db().transaction() as t:
+    with get_db().read_transaction() as t:
         user = (t.query(User)
                  .filter(User.id == user_id)
                  .one())
@@ -163,7 +280,7 @@ def get_user_by_id(user_id):
 
 
 def get_user_by_name(name):
-    with get_db().transaction() as t:
+    with get_db().read_transaction() as t:
         user = (t.query(User)
                  .filter(User.name == name)
                  .one())
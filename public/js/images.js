@@ -88,10 +88,52 @@ angular.module('images', ['drahak.hotkeys', 'ngTouch'])
             .success(function(data) {
                 $scope.message = "Entry updated";
                 $scope.feed.entries[current_before] = data;
+                delete $scope.thumbs[data.id]; // may have been rendered again
             });
     };
 
+    // Thumbnail sprites: all the thumbnails of a page in one request,
+    // see get_thumb_sprite. Entries left out of it, or all of them if
+    // it fails, fall back to their thumb_url.
+    $scope.thumbs = new Object(); // entry id -> blob url
+    $scope.sprite_loaded = false;
+    var sprite_request = 0;
+
+    $scope.load_sprite = function(url, params) {
+        var request = ++sprite_request;
+        $scope.sprite_loaded = false;
+        angular.forEach($scope.thumbs, function(blob_url) {
+            URL.revokeObjectURL(blob_url);
+        });
+        $scope.thumbs = new Object();
+        $http.get(url, {
+            params: params,
+            responseType: 'arraybuffer'
+        })
+            .success(function(data) {
+                if (request != sprite_request) return;
+                var bytes = new Uint8Array(data);
+                var start = bytes.indexOf(10) + 1; // after the index line
+                var index = JSON.parse(new TextDecoder().decode(bytes.subarray(0, start)));
+                angular.forEach(index.entries, function(thumb) {
+                    var blob = new Blob(
+                        [bytes.subarray(start + thumb.offset, start + thumb.offset + thumb.length)],
+                        {type: thumb.mime});
+                    $scope.thumbs[thumb.id] = URL.createObjectURL(blob);
+                });
+            })
+            .finally(function() {
+                if (request == sprite_request) $scope.sprite_loaded = true;
+            });
+    };
+
+    $scope.thumb_src = function(entry) {
+        if (entry.id in $scope.thumbs) return $scope.thumbs[entry.id];
+        return $scope.sprite_loaded ? entry.thumb_url : '';
+    };
+
     $scope.reload = function() {
+        $scope.load_sprite('entry/sprite', $scope.q);
         $http.get('entry', {
             params: $scope.q
         })
@@ -107,6 +149,7 @@ angular.module('images', ['drahak.hotkeys', 'ngTouch'])
     };
 
     $scope.reload_page = function(url, current) {
+        $scope.load_sprite(url.replace('?', '/sprite?'));
         $http.get(url)
             .success(function(data) {
                 $scope.feed = data;
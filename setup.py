@@ -44,6 +44,9 @@ setup(
         "bottle>0.12.7",
         "sqlalchemy>=1.0.0",
     ],
+    extras_require={
+        "fast": ["orjson"],
+    },
     tests_require=[
         "behave>=1.2.4",
         "pyhamcrest",